@@ -3,5 +3,7 @@ from . import tools  # noqa
 
 def setup():
     from .glue_statistics import StatsDataViewer
+    from .registry import statistic_registry
     from glue.config import qt_client
     qt_client.add(StatsDataViewer)
+    statistic_registry.load_plugins()
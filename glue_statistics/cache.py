@@ -0,0 +1,341 @@
+import sys
+import time
+import types
+import hashlib
+import functools
+from collections import OrderedDict
+
+import numpy as np
+
+
+def estimate_size(value):
+    '''
+    Rough memory footprint in bytes of a cached value: arrays report their buffer size,
+    tuples and dicts are the sum of their items
+    @param value: cached value
+    '''
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, tuple):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    return sys.getsizeof(value)
+
+
+def subset_state_fingerprint(subset_state, identify=None, shareable=False):
+    '''
+    Structural hash of a subset state: two subset states built the same way (same class,
+    same ROI vertices, limits, categories, masks and attributes) get the same fingerprint,
+    whatever their label or identity. Component IDs and datasets are identified by their
+    uuid so that renaming them does not change the fingerprint. Functions are identified by
+    their code, constants and closure; callables that cannot be described are identified by
+    their id, which only holds within the session.
+    @param subset_state: glue SubsetState to fingerprint
+    @param identify: optional function returning a string identifying an object that has a
+                     uuid (e.g. a content fingerprint of a component), or None to use the uuid
+    @param shareable: if True, returns None instead of a fingerprint that holds only within
+                      the session, so it is never shared with other sessions
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    local = []
+    _hash_structure(subset_state, digest.update, set(), identify, local)
+    if shareable and local:
+        return None
+    return digest.hexdigest()
+
+
+def _hash_structure(value, update, seen, identify=None, local=None):
+    '''
+    Feeds a canonical description of value to update, recursing into containers, into the
+    code and closures of functions and into the attributes of subset states, ROIs and other
+    plain objects
+    @param value: object to describe
+    @param update: function taking bytes
+    @param seen: ids of the objects on the current recursion path, guards against cycles
+    @param identify: see subset_state_fingerprint
+    @param local: list to which the objects described by their id are appended
+    '''
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes, slice)):
+        update(repr(value).encode('utf8'))
+        return
+    if isinstance(value, np.generic):
+        update(repr(value.item()).encode('utf8'))
+        return
+
+    # component IDs and datasets carry a uuid (see ComponentID.uuid and Data.uuid)
+    uuid = getattr(value, 'uuid', None)
+    if isinstance(uuid, str):
+        identity = None if identify is None else identify(value)
+        if identity is not None:
+            update(b'id:' + identity.encode('utf8'))
+        else:
+            update(b'uuid:' + uuid.encode('utf8'))
+        return
+
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        update(('array:%s%r:' % (array.dtype.str, array.shape)).encode('utf8'))
+        if array.dtype.hasobject:
+            for item in array.ravel():
+                _hash_structure(item, update, seen, identify, local)
+        else:
+            update(array.view(np.uint8).ravel())
+        return
+
+    if isinstance(value, types.ModuleType):
+        update(('module:%s' % value.__name__).encode('utf8'))
+        return
+    if isinstance(value, type) or (isinstance(value, types.BuiltinFunctionType) and
+                                   isinstance(value.__self__, (type(None), types.ModuleType))):
+        # classes and module level builtins are unique by name
+        update(('callable:%s.%s' % (getattr(value, '__module__', ''),
+                                    getattr(value, '__qualname__', repr(value)))).encode('utf8'))
+        return
+
+    if id(value) in seen:
+        update(b'cycle')
+        return
+    seen.add(id(value))
+    try:
+        if isinstance(value, types.FunctionType):
+            # distinct lambdas and closures share their qualified name but not their code,
+            # constants or captured values
+            update(('function:%s.%s' % (value.__module__, value.__qualname__)).encode('utf8'))
+            cells = [_cell_contents(cell) for cell in value.__closure__ or ()]
+            _hash_structure((value.__code__, value.__defaults__, value.__kwdefaults__, cells),
+                            update, seen, identify, local)
+        elif isinstance(value, types.CodeType):
+            update(b'code:' + value.co_code)
+            _hash_structure((value.co_names, value.co_consts), update, seen, identify, local)
+        elif isinstance(value, types.MethodType):
+            update(b'method')
+            _hash_structure((value.__func__, value.__self__), update, seen, identify, local)
+        elif isinstance(value, functools.partial):
+            update(b'partial')
+            _hash_structure((value.func, value.args, value.keywords), update, seen, identify, local)
+        elif isinstance(value, (types.BuiltinFunctionType, types.BuiltinMethodType,
+                                types.MethodWrapperType, types.WrapperDescriptorType)):
+            # bound to an object whose state cannot be described, only valid in this session
+            update(('local:%d' % id(value)).encode('utf8'))
+            if local is not None:
+                local.append(value)
+        elif isinstance(value, (list, tuple)):
+            update(('%s[%d]' % (type(value).__name__, len(value))).encode('utf8'))
+            for item in value:
+                _hash_structure(item, update, seen, identify, local)
+        elif isinstance(value, (set, frozenset)):
+            update(('set[%d]' % len(value)).encode('utf8'))
+            for item in sorted(repr(item) for item in value):
+                update(item.encode('utf8'))
+        elif isinstance(value, dict):
+            update(('dict[%d]' % len(value)).encode('utf8'))
+            for key in sorted(value, key=repr):
+                update(repr(key).encode('utf8'))
+                _hash_structure(value[key], update, seen, identify, local)
+        elif hasattr(value, '__dict__'):
+            cls = type(value)
+            update(('object:%s.%s' % (cls.__module__, cls.__qualname__)).encode('utf8'))
+            attributes = dict((key, item) for key, item in vars(value).items()
+                              if 'cache' not in key and not key.startswith('__'))
+            _hash_structure(attributes, update, seen, identify, local)
+        elif callable(value):
+            update(('local:%d' % id(value)).encode('utf8'))
+            if local is not None:
+                local.append(value)
+        else:
+            update(repr(value).encode('utf8'))
+    finally:
+        seen.discard(id(value))
+
+
+def _cell_contents(cell):
+    '''
+    Returns the value captured by a closure cell, or a marker if it is not assigned yet
+    @param cell: cell of a function closure
+    '''
+    try:
+        return cell.cell_contents
+    except ValueError:
+        return 'empty cell'
+
+
+class LRUCache(object):
+    '''
+    Dict-like cache with a least-recently-used eviction policy and an entry and/or memory
+    budget. Keys can be pinned (e.g. rows that are currently checked in the viewer), pinned
+    entries are never evicted, so the cache can exceed its budget if everything is pinned.
+    '''
+
+    def __init__(self, max_entries=None, max_bytes=None, sizeof=estimate_size, on_evict=None):
+        '''
+        @param max_entries: maximum number of entries, or None for no limit
+        @param max_bytes: maximum estimated memory of the entries, or None for no limit
+        @param sizeof: function returning the estimated size in bytes of a value
+        @param on_evict: function called with the key of every entry evicted by the budget
+        '''
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._on_evict = on_evict
+        self._entries = OrderedDict()
+        self._sizes = dict()
+        self._pinned = set()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    def __getitem__(self, key):
+        value = self._entries[key]
+        self._entries.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self._entries:
+            self.nbytes -= self._sizes[key]
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._sizes[key] = self._sizeof(value)
+        self.nbytes += self._sizes[key]
+        self._evict()
+
+    def get(self, key, default=None):
+        if key in self._entries:
+            return self[key]
+        return default
+
+    def pop(self, key, *default):
+        if key not in self._entries and default:
+            return default[0]
+        value = self._entries.pop(key)
+        self.nbytes -= self._sizes.pop(key)
+        return value
+
+    def items(self):
+        return list(self._entries.items())
+
+    def clear(self):
+        self._entries.clear()
+        self._sizes.clear()
+        self.nbytes = 0
+
+    def pin(self, key):
+        self._pinned.add(key)
+
+    def unpin(self, key):
+        self._pinned.discard(key)
+        self._evict()
+
+    def set_pinned(self, keys):
+        '''
+        Replaces the set of pinned keys, evicting entries that are no longer protected if the
+        cache is over budget
+        @param keys: iterable of keys to pin
+        '''
+        self._pinned = set(keys)
+        self._evict()
+
+    def _over_budget(self):
+        return ((self.max_entries is not None and len(self._entries) > self.max_entries) or
+                (self.max_bytes is not None and self.nbytes > self.max_bytes))
+
+    def _evict(self):
+        if not self._over_budget():
+            return
+        # oldest entries first
+        for key in list(self._entries):
+            if not self._over_budget():
+                break
+            if key in self._pinned:
+                continue
+            self.pop(key)
+            if self._on_evict is not None:
+                self._on_evict(key)
+
+
+class SubsetMaskCache(object):
+    '''
+    Caches the boolean masks of subset states so that a mask is evaluated once per
+    (subset state, dataset) pair and then shared by every component and statistic of
+    that pair, in both the subset view and the component view.
+
+    Entries are looked up by identity. The subset state and dataset are stored with the
+    mask so that a recycled id() can never return the mask of a different object. Masks are
+    kept in an LRUCache bounded by their total size.
+    '''
+
+    def __init__(self, max_bytes=None, on_evaluate=None):
+        '''
+        @param max_bytes: maximum memory used by the cached masks, or None for no limit
+        @param on_evaluate: function called with the dataset and the seconds taken every time
+                            a mask is evaluated
+        '''
+        self._masks = LRUCache(max_bytes=max_bytes, sizeof=lambda entry: entry[2].nbytes)
+        self._on_evaluate = on_evaluate
+
+    def __len__(self):
+        return len(self._masks)
+
+    def get_mask(self, subset_state, data):
+        '''
+        Returns the mask of subset_state over data, evaluating it only on a cache miss.
+        Any exception raised by to_mask (e.g. IncompatibleAttribute) is not cached.
+        @param subset_state: glue SubsetState to evaluate
+        @param data: glue Data the mask is computed for
+        '''
+        key = (id(subset_state), id(data))
+        entry = self._masks.get(key)
+        if entry is not None and entry[0] is subset_state and entry[1] is data:
+            return entry[2]
+        # a stale entry under a recycled id is replaced below
+
+        started = time.monotonic()
+        mask = subset_state.to_mask(data)
+        if self._on_evaluate is not None:
+            self._on_evaluate(data, time.monotonic() - started)
+        self._masks[key] = (subset_state, data, mask)
+        return mask
+
+    def has_mask(self, subset_state, data):
+        '''
+        Returns True if the mask of subset_state over data is cached, without evaluating it
+        @param subset_state: glue SubsetState
+        @param data: glue Data
+        '''
+        entry = self._masks.get((id(subset_state), id(data)))
+        return entry is not None and entry[0] is subset_state and entry[1] is data
+
+    def invalidate(self, subset_state=None, data=None):
+        '''
+        Drops the cached masks matching the given subset state and/or dataset.
+        With no arguments every mask is dropped.
+        @param subset_state: only drop masks of this subset state
+        @param data: only drop masks computed over this dataset
+        '''
+        for key, (state, dataset, mask) in self._masks.items():
+            if subset_state is not None and state is not subset_state:
+                continue
+            if data is not None and dataset is not data:
+                continue
+            self._masks.pop(key)
+
+    def prune(self, live_states, live_data):
+        '''
+        Drops the masks of subset states that are no longer used by any subset, which
+        happens whenever glue replaces a subset state after an edit, and the masks of
+        datasets that were removed from the data collection
+        @param live_states: iterable of the subset states currently in the data collection
+        @param live_data: iterable of the datasets currently in the data collection
+        '''
+        live = set(id(state) for state in live_states)
+        live.update(id(dataset) for dataset in live_data)
+        for key, (state, dataset, mask) in self._masks.items():
+            if id(state) not in live or id(dataset) not in live:
+                self._masks.pop(key)
@@ -0,0 +1,165 @@
+import numpy as np
+
+
+class ColumnStore(object):
+    '''
+    Raw values of the columns of the viewer, one float NumPy array per column, aligned with
+    an index of row keys. Expressions of custom columns are evaluated on these arrays directly
+    instead of reading the values back from the trees. Missing and non-numeric values (not
+    calculated yet, categorical, errors) are NaN.
+    Rows are appended at the end and removed by moving the last row in their place, so the
+    arrays stay dense; their capacity doubles when they are full.
+    '''
+
+    def __init__(self, columns=(), capacity=64):
+        '''
+        @param columns: names of the initial columns
+        @param capacity: number of rows allocated up front
+        '''
+        self._capacity = capacity
+        self._keys = []
+        self._positions = dict()
+        self._columns = dict()
+        for name in columns:
+            self.add_column(name)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def keys(self):
+        '''
+        Returns the row keys, in the order of the column arrays
+        '''
+        return list(self._keys)
+
+    def columns(self):
+        '''
+        Returns the names of the columns
+        '''
+        return list(self._columns)
+
+    def position(self, key):
+        '''
+        Returns the position of a row in the column arrays, adding the row if needed
+        @param key: row key
+        '''
+        position = self._positions.get(key)
+        if position is None:
+            position = len(self._keys)
+            if position == self._capacity:
+                self._capacity *= 2
+                for name, values in self._columns.items():
+                    grown = np.full(self._capacity, np.nan)
+                    grown[:position] = values[:position]
+                    self._columns[name] = grown
+            self._keys.append(key)
+            self._positions[key] = position
+            for values in self._columns.values():
+                values[position] = np.nan
+        return position
+
+    def add_column(self, name):
+        '''
+        Adds a column, all NaN, does nothing if it exists
+        @param name: name of the column
+        '''
+        if name not in self._columns:
+            self._columns[name] = np.full(self._capacity, np.nan)
+
+    def remove_column(self, name):
+        self._columns.pop(name, None)
+
+    def column(self, name):
+        '''
+        Returns the values of a column for every row, in the order of keys(). This is a view
+        of the store, copy it to keep it across changes.
+        @param name: name of the column
+        '''
+        return self._columns[name][:len(self._keys)]
+
+    def get(self, key, name):
+        '''
+        Returns the value of a cell, NaN if the row or column is not stored
+        @param key: row key
+        @param name: name of the column
+        '''
+        position = self._positions.get(key)
+        if position is None or name not in self._columns:
+            return np.nan
+        return self._columns[name][position]
+
+    def set(self, key, name, value):
+        '''
+        Sets the value of a cell, values that are not numbers are stored as NaN
+        @param key: row key
+        @param name: name of the column, added if needed
+        @param value: value of the cell
+        '''
+        self.add_column(name)
+        self._columns[name][self.position(key)] = self._number(value)
+
+    def set_row(self, key, names, values):
+        '''
+        Sets several cells of a row
+        @param key: row key
+        @param names: names of the columns
+        @param values: values in the order of names
+        '''
+        position = self.position(key)
+        for name, value in zip(names, values):
+            self.add_column(name)
+            self._columns[name][position] = self._number(value)
+
+    def set_column(self, name, keys, values):
+        '''
+        Sets the cells of a column for several rows at once
+        @param name: name of the column, added if needed
+        @param keys: row keys
+        @param values: values in the order of keys
+        '''
+        self.add_column(name)
+        positions = np.array([self.position(key) for key in keys], dtype=np.intp)
+        column = self._columns[name]
+        column[positions] = [self._number(value) for value in values]
+
+    def clear(self, keys=None, names=None):
+        '''
+        Sets cells back to NaN, e.g. when the values they were calculated from changed
+        @param keys: row keys, every row by default
+        @param names: names of the columns, every column by default
+        '''
+        if keys is None:
+            positions = slice(0, len(self._keys))
+        else:
+            positions = np.array([self._positions[key] for key in keys if key in self._positions], dtype=np.intp)
+        for name in (self._columns if names is None else names):
+            if name in self._columns:
+                self._columns[name][positions] = np.nan
+
+    def discard(self, keys):
+        '''
+        Removes rows, the last row takes the place of each removed row
+        @param keys: row keys
+        '''
+        for key in keys:
+            position = self._positions.pop(key, None)
+            if position is None:
+                continue
+            last = len(self._keys) - 1
+            if position != last:
+                moved = self._keys[last]
+                self._keys[position] = moved
+                self._positions[moved] = position
+                for values in self._columns.values():
+                    values[position] = values[last]
+            self._keys.pop()
+
+    @staticmethod
+    def _number(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
@@ -0,0 +1,503 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from qtpy.QtCore import QObject, Signal
+
+from glue_statistics.reductions import fused_aggregate, incremental_aggregate, batch_aggregates, \
+    grouped_aggregates, chunk_aggregate, finite_values, quantiles_in_place
+from glue_statistics.streaming import mapped_file
+
+
+def default_workers():
+    '''
+    Number of worker threads used by default, one per core
+    '''
+    return max(1, os.cpu_count() or 1)
+
+
+def split_jobs(items, parts):
+    '''
+    Splits items into at most parts lists of consecutive items with sizes differing by at most
+    one, so that independent work can be spread over the worker threads
+    @param items: list to split
+    @param parts: number of lists wanted
+    '''
+    parts = max(1, min(parts, len(items)))
+    size, extra = divmod(len(items), parts)
+    chunks = []
+    start = 0
+    for part in range(parts):
+        stop = start + size + (1 if part < extra else 0)
+        chunks.append(items[start:stop])
+        start = stop
+    return chunks
+
+
+def dataset_job(columns, quantiles=()):
+    '''
+    Computes the accumulators of whole components. Float components are stacked and reduced
+    together, the others one at a time.
+    Returns a list of (key, PartialAggregate, values at the quantiles).
+    @param columns: list of (key, values) pairs, values being a numeric array
+    @param quantiles: quantiles of the order statistics, see StatisticPlan
+    '''
+    floats = [(key, values) for key, values in columns if values.dtype.kind == 'f']
+    # a single float component gains nothing from stacking
+    if len(floats) < 2:
+        floats = []
+
+    results = []
+    if floats:
+        batch = batch_aggregates([values for key, values in floats], quantiles)
+        results.extend((key, aggregate, order) for (key, values), (aggregate, order) in zip(floats, batch))
+    stacked = set(id(values) for key, values in floats)
+    for key, values in columns:
+        if id(values) not in stacked:
+            results.append((key,) + fused_aggregate(values, None, quantiles))
+    return results
+
+
+def subset_job(values, subsets, quantiles=()):
+    '''
+    Computes the accumulators of several subsets of one component. Subsets with accumulators
+    from an earlier definition are updated incrementally, the others are reduced together.
+    Returns a list of (key, PartialAggregate, values at the quantiles).
+    @param values: numeric array of component values
+    @param subsets: list of (key, mask, previous) where previous is (aggregate, old mask)
+                    or None
+    @param quantiles: quantiles of the order statistics, see StatisticPlan
+    '''
+    results = []
+    fresh = []
+    for key, mask, previous in subsets:
+        if previous is not None:
+            aggregate, order = incremental_aggregate(values, previous[0], previous[1], mask, quantiles)
+            results.append((key, aggregate, order))
+        else:
+            fresh.append((key, mask))
+
+    if len(fresh) > 1:
+        grouped = grouped_aggregates(values, [mask for key, mask in fresh], quantiles)
+        results.extend((key, aggregate, order) for (key, mask), (aggregate, order) in zip(fresh, grouped))
+    elif fresh:
+        key, mask = fresh[0]
+        aggregate, order = fused_aggregate(values, mask, quantiles)
+        results.append((key, aggregate, order))
+    return results
+
+
+def chunk_job(key, values, mask, start, stop):
+    '''
+    Computes the accumulator of one chunk of a row that is too large for a single worker, see
+    chunk_aggregate. Returns [(key, PartialAggregate, None)], the chunks of a row are merged
+    with tree_merge once they are all done.
+    @param key: key of the row
+    @param values: numeric array of component values
+    @param mask: boolean subset mask, or None for the whole component
+    @param start: first flat index of the chunk
+    @param stop: flat index after the chunk
+    '''
+    return [(key, chunk_aggregate(values, mask, start, stop), None)]
+
+
+def order_job(key, values, mask, quantiles):
+    '''
+    Computes the order statistics of a row whose accumulator is computed by chunk jobs. They
+    cannot be merged from chunks, so they run alongside them, all from one selection.
+    Returns [(key, None, values at the quantiles)].
+    @param key: key of the row
+    @param values: numeric array of component values
+    @param mask: boolean subset mask, or None for the whole component
+    @param quantiles: quantiles of the order statistics, see StatisticPlan
+    '''
+    return [(key, None, quantiles_in_place(finite_values(values, mask), quantiles))]
+
+
+# Execution backends of StatsComputeService
+BACKENDS = ('thread', 'process')
+
+
+class SharedArrays(object):
+    '''
+    Publishes the NumPy arrays passed to process-pool jobs so that workers map them instead of
+    receiving a pickled copy. Arrays backed by a file (np.memmap) are mapped from that file,
+    other arrays are copied once into a multiprocessing.shared_memory block that is shared by
+    every job using the same array and unlinked when the last of these jobs is done.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # id(array) -> [array, SharedMemory, number of jobs using it]
+        self._blocks = dict()
+
+    def pack(self, value, used):
+        '''
+        Replaces the arrays in value (possibly nested in lists and tuples) by descriptors
+        @param value: job argument
+        @param used: list collecting the ids of the shared memory blocks used by the job
+        '''
+        if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+            return self._publish(value, used)
+        if isinstance(value, tuple):
+            return tuple(self.pack(item, used) for item in value)
+        if isinstance(value, list):
+            return [self.pack(item, used) for item in value]
+        # small objects (accumulators, keys) and object arrays are pickled
+        return value
+
+    def _publish(self, array, used):
+        mapped = mapped_file(array) if array.flags.c_contiguous else None
+        if mapped is not None:
+            return ('memmap', mapped[0], mapped[1], array.shape, array.dtype.str)
+        with self._lock:
+            entry = self._blocks.get(id(array))
+            if entry is None or entry[0] is not array:
+                block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+                np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+                entry = [array, block, 0]
+                self._blocks[id(array)] = entry
+            entry[2] += 1
+        used.append(id(array))
+        return ('shm', entry[1].name, array.shape, array.dtype.str)
+
+    def release(self, used):
+        '''
+        Called when a job is done, unlinks the blocks no other job uses
+        @param used: ids collected by pack for the job
+        '''
+        with self._lock:
+            for key in used:
+                entry = self._blocks.get(key)
+                if entry is None:
+                    continue
+                entry[2] -= 1
+                if entry[2] == 0:
+                    del self._blocks[key]
+                    entry[1].close()
+                    entry[1].unlink()
+
+
+def _attach(value, blocks):
+    '''
+    Inverse of SharedArrays.pack, run in the worker process
+    @param value: packed job argument
+    @param blocks: list collecting the attached SharedMemory blocks, closed after the job
+    '''
+    if isinstance(value, tuple) and value and value[0] == 'shm':
+        name, shape, dtype = value[1:]
+        try:
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # before Python 3.13 attaching registers the block again with the resource tracker,
+            # which spawned workers share with the viewer, so the registration is harmless
+            block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.flags.writeable = False
+        return array
+    if isinstance(value, tuple) and value and value[0] == 'memmap':
+        filename, offset, shape, dtype = value[1:]
+        return np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape)
+    if isinstance(value, tuple):
+        return tuple(_attach(item, blocks) for item in value)
+    if isinstance(value, list):
+        return [_attach(item, blocks) for item in value]
+    return value
+
+
+def _run_attached(function, args):
+    '''
+    Runs a job in a worker process on arrays mapped from shared memory or files. Only the
+    results (small tuples and accumulators) are sent back to the viewer.
+    @param function: dataset_job or subset_job
+    @param args: arguments packed by SharedArrays.pack
+    '''
+    blocks = []
+    try:
+        result = function(*_attach(args, blocks))
+        # results never reference the shared buffers, but make sure before closing them
+        return _detach(result)
+    finally:
+        for block in blocks:
+            try:
+                block.close()
+            except BufferError:
+                pass
+
+
+def _detach(value):
+    if isinstance(value, np.ndarray):
+        return np.array(value)
+    if isinstance(value, tuple):
+        return tuple(_detach(item) for item in value)
+    if isinstance(value, list):
+        return [_detach(item) for item in value]
+    return value
+
+
+class StatsComputeService(QObject):
+    '''
+    Runs statistics jobs on a pool of workers so the GUI thread never waits for a reduction.
+    With the 'thread' backend the workers are threads: NumPy releases the GIL during
+    reductions, so independent jobs run in parallel on several cores. The 'process' backend
+    runs jobs in worker processes for work that holds the GIL; their arrays are published
+    through SharedArrays instead of being pickled.
+    Jobs wait in a priority queue and only max_workers of them are handed to the pool at a
+    time, so queued jobs can still be reprioritized or cancelled. Jobs with the lowest
+    priority run first, jobs with the same priority in submission order.
+    Jobs only get NumPy arrays gathered on the GUI thread (a snapshot of the component values
+    and subset masks), never glue objects. Results and errors are sent back with the
+    finished/failed signals; these are emitted from worker threads, so Qt queues them to the
+    receivers on the GUI thread.
+    '''
+
+    # job id, result of the job
+    finished = Signal(object, object)
+    # job id, exception raised by the job
+    failed = Signal(object, object)
+    # jobs done and jobs submitted since the queue was last empty, estimated seconds left
+    progress = Signal(int, int, float)
+    # job id, seconds the job ran, emitted before finished
+    measured = Signal(object, float)
+
+    def __init__(self, max_workers=None, backend='thread', parent=None):
+        '''
+        @param max_workers: number of workers, one per core by default
+        @param backend: 'thread' or 'process', see BACKENDS
+        @param parent: parent QObject
+        '''
+        super(StatsComputeService, self).__init__(parent)
+        if backend not in BACKENDS:
+            raise ValueError("backend should be one of " + ", ".join(BACKENDS))
+        self.max_workers = max_workers or default_workers()
+        self.backend = backend
+        self._shared = SharedArrays()
+        self._executor = self._create_executor()
+        self._local_executor = None
+        self._ids = itertools.count()
+
+        self._lock = threading.Lock()
+        # heap of (priority, sequence, job id), entries of reprioritized or cancelled jobs
+        # are skipped when they come up
+        self._queue = []
+        self._sequence = itertools.count()
+        # job id -> [priority, function, args, local] of the queued jobs
+        self._queued = dict()
+        # ids of the jobs handed to the pool and of the running jobs that were cancelled
+        self._running = set()
+        self._cancelled = set()
+        self._done_count = 0
+        self._total_count = 0
+        # moving average of the duration of a job, in seconds
+        self._job_seconds = None
+
+    def _create_executor(self):
+        if self.backend == 'process':
+            # forking a process running Qt is unsafe, workers are started fresh
+            return ProcessPoolExecutor(max_workers=self.max_workers,
+                                       mp_context=multiprocessing.get_context('spawn'))
+        return ThreadPoolExecutor(max_workers=self.max_workers)
+
+    def _replace_executor(self):
+        old = self._executor
+        self._executor = self._create_executor()
+        old.shutdown(wait=False)
+
+    def set_max_workers(self, max_workers):
+        '''
+        Changes the number of workers. Jobs already submitted finish on the old pool and
+        still report their results.
+        @param max_workers: number of workers
+        '''
+        if max_workers == self.max_workers:
+            return
+        self.max_workers = max_workers
+        self._replace_executor()
+        self._dispatch()
+
+    def set_backend(self, backend):
+        '''
+        Switches between worker threads and worker processes. Jobs already submitted finish on
+        the old pool and still report their results.
+        @param backend: 'thread' or 'process', see BACKENDS
+        '''
+        if backend not in BACKENDS:
+            raise ValueError("backend should be one of " + ", ".join(BACKENDS))
+        if backend == self.backend:
+            return
+        self.backend = backend
+        self._replace_executor()
+
+    def submit(self, function, *args, priority=0):
+        '''
+        Queues function(*args) to run on a worker and returns the id of the job
+        @param function: module-level function to run, must not touch Qt or glue objects
+        @param args: arguments of the function
+        @param priority: sortable priority, lower values run first
+        '''
+        return self._enqueue(function, args, priority, False)
+
+    def submit_local(self, function, *args, priority=0):
+        '''
+        Queues function(*args) to run on a worker thread whatever the backend, for jobs that
+        bring their own parallelism (e.g. dask) or take arguments that cannot be sent to
+        another process. Returns the id of the job.
+        @param function: function to run, must not touch Qt or glue objects
+        @param args: arguments of the function
+        @param priority: sortable priority, lower values run first
+        '''
+        return self._enqueue(function, args, priority, True)
+
+    def _enqueue(self, function, args, priority, local):
+        job_id = next(self._ids)
+        with self._lock:
+            self._queued[job_id] = [priority, function, args, local]
+            heapq.heappush(self._queue, (priority, next(self._sequence), job_id))
+            self._total_count += 1
+        self._dispatch()
+        self._report()
+        return job_id
+
+    def reprioritize(self, job_id, priority):
+        '''
+        Changes the priority of a job that is still queued, does nothing for jobs that already
+        started or finished
+        @param job_id: id returned by submit
+        @param priority: new priority, lower values run first
+        '''
+        with self._lock:
+            job = self._queued.get(job_id)
+            if job is None or job[0] == priority:
+                return
+            job[0] = priority
+            heapq.heappush(self._queue, (priority, next(self._sequence), job_id))
+
+    def cancel(self, job_id):
+        '''
+        Cancels a job. Queued jobs never run; a running job cannot be interrupted, but its
+        result is dropped and neither finished nor failed is emitted for it.
+        @param job_id: id returned by submit
+        '''
+        with self._lock:
+            if self._queued.pop(job_id, None) is not None:
+                self._total_count -= 1
+            elif job_id in self._running:
+                self._cancelled.add(job_id)
+            else:
+                return
+        self._report()
+
+    def _dispatch(self):
+        '''
+        Hands queued jobs to the pool, highest priority first, until max_workers jobs run
+        '''
+        while True:
+            with self._lock:
+                if len(self._running) >= self.max_workers:
+                    return
+                job = None
+                while self._queue and job is None:
+                    priority, sequence, job_id = heapq.heappop(self._queue)
+                    job = self._queued.get(job_id)
+                    # stale entry of a cancelled or reprioritized job
+                    if job is not None and job[0] != priority:
+                        job = None
+                if job is None:
+                    return
+                del self._queued[job_id]
+                self._running.add(job_id)
+            priority, function, args, local = job
+            started = time.monotonic()
+            used = []
+            try:
+                if local:
+                    future = self._local_pool().submit(function, *args)
+                elif self.backend == 'process':
+                    future = self._executor.submit(_run_attached, function, self._shared.pack(args, used))
+                else:
+                    future = self._executor.submit(function, *args)
+            except Exception as error:
+                # e.g. the arguments could not be published or the pool is broken
+                if not self._finish(job_id, used, None):
+                    self.failed.emit(job_id, error)
+                self._report()
+                continue
+            future.add_done_callback(lambda future, job_id=job_id, used=used, started=started:
+                                     self._done(job_id, future, used, started))
+
+    def _local_pool(self):
+        if self.backend == 'thread':
+            return self._executor
+        if self._local_executor is None:
+            self._local_executor = ThreadPoolExecutor(max_workers=1)
+        return self._local_executor
+
+    def _finish(self, job_id, used, elapsed):
+        '''
+        Releases the shared arrays of a job that is over and counts it as done. Returns True
+        if the job was cancelled, its outcome is then not reported.
+        @param job_id: id of the job
+        @param used: ids collected by SharedArrays.pack for the job
+        @param elapsed: time the job ran, or None if it never started
+        '''
+        self._shared.release(used)
+        with self._lock:
+            self._running.discard(job_id)
+            cancelled = job_id in self._cancelled
+            self._cancelled.discard(job_id)
+            if cancelled:
+                self._total_count -= 1
+            else:
+                self._done_count += 1
+                if elapsed is not None:
+                    self._job_seconds = elapsed if self._job_seconds is None else \
+                        0.8 * self._job_seconds + 0.2 * elapsed
+        return cancelled
+
+    def _done(self, job_id, future, used, started):
+        elapsed = time.monotonic() - started
+        cancelled = self._finish(job_id, used, elapsed)
+        self._dispatch()
+        if not cancelled and not future.cancelled():
+            error = future.exception()
+            if error is not None:
+                self.failed.emit(job_id, error)
+            else:
+                self.measured.emit(job_id, elapsed)
+                self.finished.emit(job_id, future.result())
+        self._report()
+
+    def _report(self):
+        '''
+        Emits the progress of the jobs submitted since the queue was last empty, and starts
+        counting afresh once everything is done
+        '''
+        with self._lock:
+            done, total = self._done_count, self._total_count
+            remaining = total - done
+            if self._job_seconds is None or remaining <= 0:
+                eta = float('nan') if remaining > 0 else 0.
+            else:
+                eta = remaining * self._job_seconds / self.max_workers
+            if remaining <= 0 and not self._running:
+                self._done_count = self._total_count = 0
+        self.progress.emit(done, total, eta)
+
+    def shutdown(self):
+        '''
+        Stops accepting jobs and drops the queued ones, the running jobs are left to finish in
+        the background
+        '''
+        with self._lock:
+            self._queued.clear()
+            self._queue = []
+        self._executor.shutdown(wait=False)
+        if self._local_executor is not None:
+            self._local_executor.shutdown(wait=False)
@@ -0,0 +1,147 @@
+import os
+
+# Kinds of rows, by how their values are read: from memory, streamed from a file, or with dask
+ROW_KINDS = ('memory', 'stream', 'dask')
+
+# Bytes reduced per second by one worker, used until jobs of that kind have been measured
+DEFAULT_THROUGHPUT = dict(memory=400e6, stream=150e6, dask=150e6)
+
+# Seconds to evaluate a subset mask per element of the dataset, until masks have been timed
+DEFAULT_MASK_SECONDS = 2e-8
+
+
+def available_memory():
+    '''
+    Returns the physical memory available in bytes, or None if it cannot be found
+    '''
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def format_bytes(size):
+    '''
+    Formats a number of bytes for the messages of the viewer, e.g. 1.5 GB
+    @param size: number of bytes
+    '''
+    for unit in ('bytes', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return ('%d %s' if unit == 'bytes' else '%.1f %s') % (size, unit)
+        size /= 1024.
+    return '%.1f TB' % size
+
+
+def format_seconds(seconds):
+    '''
+    Formats a duration for the messages of the viewer, e.g. 2 min 30 s
+    @param seconds: duration in seconds
+    '''
+    if seconds < 1:
+        return 'under a second'
+    if seconds < 60:
+        return '%d s' % round(seconds)
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    if minutes < 60:
+        return '%d min %d s' % (minutes, seconds)
+    return '%d h %d min' % divmod(minutes, 60)
+
+
+class CostEstimate(object):
+    '''
+    Estimated cost of calculating a batch of rows
+    '''
+
+    def __init__(self, rows, seconds, memory):
+        '''
+        @param rows: number of rows that have to be calculated
+        @param seconds: estimated time until every row is calculated
+        @param memory: estimated peak memory used by the calculation, in bytes
+        '''
+        self.rows = rows
+        self.seconds = seconds
+        self.memory = memory
+
+    def describe(self):
+        '''
+        Returns a sentence describing the estimate, shown when confirming a calculation
+        '''
+        return "%d row%s to calculate, about %s and %s of memory." % (
+            self.rows, '' if self.rows == 1 else 's', format_seconds(self.seconds), format_bytes(self.memory))
+
+
+class CostModel(object):
+    '''
+    Estimates the time and memory needed to calculate a batch of rows from the number of
+    elements and the dtype of their components, whether their subset masks still have to be
+    evaluated, and the throughput measured on the jobs that ran recently. Measurements are
+    smoothed with a moving average, so the estimates follow the machine and the data.
+    '''
+
+    def __init__(self, smoothing=0.3):
+        '''
+        @param smoothing: weight of a new measurement in the moving averages
+        '''
+        self.smoothing = smoothing
+        # bytes reduced per second by one worker, by kind of row
+        self.throughput = dict(DEFAULT_THROUGHPUT)
+        # seconds to evaluate a subset mask, per element
+        self.mask_seconds = DEFAULT_MASK_SECONDS
+
+    def _average(self, old, new):
+        return (1 - self.smoothing) * old + self.smoothing * new
+
+    def observe(self, kind, nbytes, seconds):
+        '''
+        Records how long a job took
+        @param kind: kind of the rows of the job, see ROW_KINDS
+        @param nbytes: bytes of component values the job reduced
+        @param seconds: time the job ran
+        '''
+        # jobs that are too short to time are not representative
+        if nbytes <= 0 or seconds < 1e-3:
+            return
+        self.throughput[kind] = self._average(self.throughput[kind], nbytes / seconds)
+
+    def observe_mask(self, elements, seconds):
+        '''
+        Records how long a subset mask took to evaluate
+        @param elements: number of elements of the dataset
+        @param seconds: time to_mask took
+        '''
+        if elements <= 0 or seconds < 1e-3:
+            return
+        self.mask_seconds = self._average(self.mask_seconds, seconds / elements)
+
+    def estimate(self, rows, workers, chunk_bytes):
+        '''
+        Estimates the cost of a batch. Jobs are spread over the workers while subset masks are
+        evaluated one after the other on the GUI thread. Rows in memory need temporaries of
+        about a float copy of their selected values plus boolean masks while they run, streamed
+        rows a block of chunk_bytes; new subset masks stay in memory in the mask cache.
+        @param rows: list of (kind, elements, itemsize, new_mask) tuples, one per row to
+                     calculate, new_mask being a key of the (subset state, dataset) pair if
+                     the subset mask of the row has to be evaluated and None otherwise. Rows
+                     with the same key share one mask, which is only counted once.
+        @param workers: number of workers
+        @param chunk_bytes: memory budget of a block of a streamed row
+        '''
+        job_seconds = 0.
+        mask_seconds = 0.
+        running = []
+        masks = 0
+        new_masks = set()
+        for kind, elements, itemsize, new_mask in rows:
+            job_seconds += elements * itemsize / self.throughput[kind]
+            if new_mask is not None and new_mask not in new_masks:
+                new_masks.add(new_mask)
+                mask_seconds += elements * self.mask_seconds
+                masks += elements
+            if kind == 'memory':
+                running.append(elements * (8 + 2))
+            else:
+                running.append(min(elements * itemsize, chunk_bytes))
+        # the largest rows running side by side make the peak
+        running.sort(reverse=True)
+        memory = sum(running[:max(1, workers)]) + masks
+        return CostEstimate(len(rows), job_seconds / max(1, workers) + mask_seconds, memory)
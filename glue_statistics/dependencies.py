@@ -0,0 +1,142 @@
+import numbers
+
+import numpy as np
+
+from glue_statistics.reductions import finite_values
+
+# Name under which expressions refer to the component values of their row
+COMPONENT = 'Component'
+
+
+class ColumnGraph(object):
+    '''
+    Dependencies of the custom columns. A custom column depends on the columns its
+    expression uses (base statistics or other custom columns) and, through {Component}, on
+    the component values of its row, subset mask included. When some of these change for a
+    row, dependents gives the custom columns to recompute for that row, in an order where
+    every column comes after the columns it uses.
+    '''
+
+    def __init__(self):
+        # name -> Expression, and name -> names of the columns the expression uses
+        self._expressions = dict()
+        self._uses = dict()
+
+    def __contains__(self, name):
+        return name in self._expressions
+
+    def __len__(self):
+        return len(self._expressions)
+
+    def add(self, name, expression):
+        '''
+        Adds a custom column. Raises ValueError if it would depend on itself.
+        @param name: name of the column
+        @param expression: Expression of the column, see compile_expression
+        '''
+        uses = set(expression.columns)
+        if name in uses or any(name in self._closure(used) for used in uses if used in self._expressions):
+            raise ValueError("Column %s cannot depend on itself" % name)
+        self._expressions[name] = expression
+        self._uses[name] = uses
+
+    def remove(self, name):
+        self._expressions.pop(name, None)
+        self._uses.pop(name, None)
+
+    def expression(self, name):
+        return self._expressions[name]
+
+    def _closure(self, name):
+        '''
+        Returns the names a custom column depends on, directly or through other custom columns
+        '''
+        seen = set()
+        stack = [name]
+        while stack:
+            for used in self._uses.get(stack.pop(), ()):
+                if used not in seen:
+                    seen.add(used)
+                    stack.append(used)
+        return seen
+
+    def order(self, names=None):
+        '''
+        Returns custom columns in topological order, each after the custom columns it uses
+        @param names: custom columns to order, all of them by default
+        '''
+        names = set(self._expressions if names is None else names)
+        ordered = []
+        done = set()
+
+        def visit(name):
+            if name in done or name not in self._expressions:
+                return
+            done.add(name)
+            for used in sorted(self._uses[name]):
+                visit(used)
+            if name in names:
+                ordered.append(name)
+
+        # creation order breaks ties, so the order is stable
+        for name in self._expressions:
+            visit(name)
+        return ordered
+
+    def dependents(self, changed):
+        '''
+        Returns the custom columns to recompute when the given columns change, directly or
+        through other custom columns, in topological order
+        @param changed: names of columns (or COMPONENT for the component values) that changed
+        '''
+        changed = set(changed)
+        stale = set()
+        for name in self.order():
+            if self._uses[name] & (changed | stale):
+                stale.add(name)
+        return self.order(stale)
+
+    def uses(self, names):
+        '''
+        Returns the columns the given custom columns use that are not among them, which have to
+        be bound when they are evaluated
+        @param names: names of custom columns
+        '''
+        used = set()
+        for name in names:
+            used.update(self._uses[name])
+        return used - set(names)
+
+
+def column_job(rows):
+    '''
+    Worker job recomputing the custom column cells of rows, see ColumnGraph. The columns of a
+    row are evaluated in the given order, each binding its value for the next ones.
+    Returns [(key, version, {name: value})]; cells whose evaluation failed are "Error".
+    @param rows: list of (key, version, columns, bindings, values, mask) tuples, with columns
+                 a list of (name, Expression) in topological order, bindings the values of the
+                 other columns used, and values and mask the component values and subset mask
+                 of the row (values is None if the row has no numeric component values)
+    '''
+    results = []
+    for key, version, columns, bindings, values, mask in rows:
+        bindings = dict(bindings)
+        component = None
+        computed = dict()
+        for name, expression in columns:
+            try:
+                if COMPONENT in expression.columns and values is None:
+                    value = "NaN"
+                else:
+                    if COMPONENT in expression.columns:
+                        if component is None:
+                            component = finite_values(values, mask)
+                        bindings[COMPONENT] = component
+                    value = expression.evaluate(bindings)
+            except Exception:
+                value = "Error"
+            computed[name] = value
+            # the columns using this one see NaN for values that are not numbers
+            bindings[name] = value if isinstance(value, (numbers.Number, np.ndarray)) else np.nan
+        results.append((key, version, computed))
+    return results
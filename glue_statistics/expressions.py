@@ -0,0 +1,156 @@
+import re
+import ast
+import math
+
+import numpy as np
+
+# Placeholders of columns in an expression, e.g. {Mean} or {Component}
+PLACEHOLDER = re.compile(r'\{([^{}]+)\}')
+
+# Modules expressions can use, more can be passed to compile_expression
+DEFAULT_NAMESPACE = dict(np=np, numpy=np, math=math)
+
+# Builtins expressions can use
+SAFE_BUILTINS = dict(abs=abs, min=min, max=max, len=len, sum=sum, round=round, pow=pow,
+                     float=float, int=int, bool=bool)
+
+# Nodes an expression can be made of: arithmetic, comparisons, calls, attribute access and
+# indexing, but no lambdas, comprehensions, assignments or statements
+_ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp,
+                  ast.Call, ast.keyword, ast.Attribute, ast.Subscript, ast.Slice, ast.Name,
+                  ast.Load, ast.Constant, ast.Tuple, ast.List,
+                  ast.operator, ast.unaryop, ast.cmpop, ast.boolop)
+if hasattr(ast, 'Index'):
+    # Python < 3.9 wraps subscripts
+    _ALLOWED_NODES += (ast.Index,)
+
+# Nodes that act element by element on arrays
+_ELEMENTWISE_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name,
+                      ast.Load, ast.Constant, ast.Attribute, ast.operator, ast.unaryop, ast.cmpop)
+
+
+class ExpressionError(ValueError):
+    '''
+    Raised when an expression cannot be parsed, uses something it is not allowed to, or
+    refers to a column that does not exist
+    '''
+
+
+def _identifier(index):
+    return '_column_%d' % index
+
+
+class Expression(object):
+    '''
+    An expression of a custom column, parsed and compiled once. Column placeholders are
+    replaced by variables that are bound to their values (scalars or NumPy arrays, by
+    reference) when the expression is evaluated, so evaluating it costs the NumPy operations
+    it is made of and nothing more.
+    '''
+
+    def __init__(self, text, code, identifiers, namespace, elementwise):
+        '''
+        Use compile_expression to create expressions
+        @param text: expression as typed
+        @param code: compiled expression
+        @param identifiers: dict column name -> variable name in code, of the columns used
+        @param namespace: dict of the modules and functions the expression can use
+        @param elementwise: True if the expression acts element by element on its columns
+        '''
+        self.text = text
+        self.columns = tuple(identifiers)
+        self.elementwise = elementwise
+        self._code = code
+        self._identifiers = identifiers
+        self._globals = dict(namespace, __builtins__=SAFE_BUILTINS)
+
+    def evaluate(self, bindings):
+        '''
+        Evaluates the expression and returns its value. Invalid operations on NaN values give
+        NaN silently, as in the statistics.
+        @param bindings: dict column name -> value of every column the expression uses
+        '''
+        missing = [name for name in self.columns if name not in bindings]
+        if missing:
+            raise ExpressionError("No value for " + ", ".join("{%s}" % name for name in missing))
+        variables = dict((identifier, bindings[name]) for name, identifier in self._identifiers.items())
+        with np.errstate(all='ignore'):
+            value = eval(self._code, self._globals, variables)
+        if isinstance(value, np.ndarray) and value.ndim == 0:
+            value = value[()]
+        return value
+
+
+def _is_elementwise(tree, namespace):
+    '''
+    Returns True if every operation of an expression acts element by element: arithmetic,
+    comparisons and NumPy ufuncs such as np.log, so that it can be evaluated once on the
+    columns of many rows stacked in arrays
+    '''
+    for node in ast.walk(tree):
+        if not isinstance(node, _ELEMENTWISE_NODES):
+            return False
+        if isinstance(node, ast.Compare) and len(node.ops) > 1:
+            # chained comparisons use 'and', which arrays do not support
+            return False
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, complex)):
+            return False
+        if isinstance(node, ast.Call):
+            function = _resolve(node.func, namespace)
+            if not (isinstance(function, np.ufunc) or function is abs) or node.keywords:
+                return False
+    return True
+
+
+def _resolve(node, namespace):
+    '''
+    Returns the object a name or dotted attribute refers to in the namespace, or None
+    '''
+    if isinstance(node, ast.Name):
+        return namespace.get(node.id, SAFE_BUILTINS.get(node.id))
+    if isinstance(node, ast.Attribute):
+        parent = _resolve(node.value, namespace)
+        return None if parent is None else getattr(parent, node.attr, None)
+    return None
+
+
+def compile_expression(text, columns, namespace=None):
+    '''
+    Parses and compiles the expression of a custom column. Column names are written between
+    braces, e.g. np.std({Component}) or {Maximum} - {Minimum}. Raises ExpressionError if the
+    expression is not valid.
+    @param text: expression
+    @param columns: names of the columns that can be used
+    @param namespace: dict of the modules and functions that can be used, numpy (as np) and
+                      math by default
+    '''
+    if namespace is None:
+        namespace = DEFAULT_NAMESPACE
+    identifiers = dict()
+
+    def substitute(match):
+        name = match.group(1)
+        if name not in columns:
+            raise ExpressionError("Unknown column {%s}" % name)
+        if name not in identifiers:
+            identifiers[name] = _identifier(len(identifiers))
+        return identifiers[name]
+
+    source = PLACEHOLDER.sub(substitute, text.strip())
+    try:
+        tree = ast.parse(source, mode='eval')
+    except SyntaxError as error:
+        raise ExpressionError("Invalid expression: %s" % error.msg)
+
+    variables = set(identifiers.values())
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ExpressionError("%s is not allowed in expressions" % type(node).__name__)
+        if isinstance(node, ast.Attribute) and node.attr.startswith('_'):
+            raise ExpressionError("Private attribute %s is not allowed in expressions" % node.attr)
+        if isinstance(node, ast.Name) and node.id not in variables and node.id not in namespace \
+                and node.id not in SAFE_BUILTINS:
+            raise ExpressionError("Unknown name %s, columns are written between braces" % node.id)
+
+    code = compile(tree, '<custom column>', 'eval')
+    return Expression(text, code, identifiers, namespace, _is_elementwise(tree, namespace))
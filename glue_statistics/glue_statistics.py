@@ -1,20 +1,23 @@
+import os
 import numpy as np
-import sys
 import pandas as pd
 
 from qtpy import compat
 from qtpy.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QTextEdit, QCheckBox, \
     QTreeWidget, QTreeWidgetItem, QAbstractItemView, QPushButton, QSpinBox, QMainWindow, \
-    QLabel, QMessageBox, QRadioButton, QLineEdit, QComboBox
-from PyQt5.QtCore import QVariant, QItemSelectionModel, Qt
+    QLabel, QMessageBox, QRadioButton, QLineEdit, QComboBox, QStyledItemDelegate
+from PyQt5.QtCore import QVariant, QItemSelectionModel, Qt, QSettings, QModelIndex, QPersistentModelIndex, QTimer
 
 from glue.viewers.common.qt.data_viewer import DataViewer
 from glue.viewers.common.qt.toolbar import BasicToolbar
 from glue.core import Data
+from glue.core.component_id import ComponentID
+from glue.core.component import DerivedComponent, CoordinateComponent
+from glue.config import CFG_DIR
 from glue.core.message import SubsetUpdateMessage, DataUpdateMessage, \
     DataAddComponentMessage, DataRemoveComponentMessage, DataCollectionDeleteMessage,\
     SubsetDeleteMessage, EditSubsetMessage, LayerArtistVisibilityMessage, \
-    ExternallyDerivableComponentsChangedMessage, DataRenameComponentMessage
+    ExternallyDerivableComponentsChangedMessage, DataRenameComponentMessage, NumericalDataChangedMessage
 from PyQt5.QtGui import QStandardItemModel
 from PyQt5 import QtGui
 from PyQt5.QtWidgets import QTabWidget
@@ -22,8 +25,29 @@ from glue.icons.qt import helpers
 
 from glue_statistics.icons import NOTATION_LOGO, CALCULATE_LOGO, SORT_LOGO, \
     SETTINGS_LOGO, INSTRUCTIONS_LOGO, HOME_LOGO, SAVE_LOGO, EXPAND_LOGO, COLLAPSE_LOGO
+from glue_statistics.reductions import fused_statistics, fused_aggregate, \
+    incremental_aggregate, is_numeric, chunk_bounds, tree_merge, finite_values, NUMERIC_KINDS
+from glue_statistics.cache import LRUCache, SubsetMaskCache, subset_state_fingerprint
+from glue_statistics.persistent_cache import PersistentStatsCache, array_fingerprint
+from glue_statistics.compute import StatsComputeService, BACKENDS, dataset_job, subset_job, chunk_job, \
+    order_job, split_jobs, default_workers
+from glue_statistics.out_of_core import DaskScheduler, SCHEDULERS, dask_available, cluster_available, \
+    is_dask_array, out_of_core_fingerprint, dask_statistics, dask_job
+from glue_statistics.streaming import STREAM_CHUNK_BYTES, is_file_backed, file_fingerprint, streaming_statistics, \
+    stream_job
+from glue_statistics.progressive import SAMPLE_BLOCKS, SAMPLE_SIZE, Estimate, draw_blocks, draw_sample
+from glue_statistics.cost import CostModel, available_memory
+from glue_statistics.expressions import DEFAULT_NAMESPACE, ExpressionError, compile_expression
+from glue_statistics.columns import ColumnStore
+from glue_statistics.dependencies import ColumnGraph, COMPONENT, column_job
+from glue_statistics.registry import StatisticPlan, statistic_registry
 showInstructions = True
 
+# Priorities of the statistics jobs of a row, see StatsDataViewer.rowPriority
+ROW_PRIORITY_VISIBLE = 0
+ROW_PRIORITY_RECENT = 1
+ROW_PRIORITY_OTHER = 2
+
 
 class StatsDataViewer(DataViewer):
     """
@@ -55,7 +79,41 @@ class StatsDataViewer(DataViewer):
     tools = ['stats:save_tool', 'stats:home_tool', 'stats:calc_tool',
              'stats:collapse', 'stats:expand_tool', 'stats:notation_tool',
              'stats:sort_tool', 'stats:export_tool', 'stats:instructions',
-             'stats:add_column', 'stats:settings']
+             'stats:add_column', 'stats:columns', 'stats:settings']
+
+    # Memory budgets of the statistics and subset mask caches, least recently used entries
+    # are evicted first and rows that are currently checked are never evicted
+    cache_max_entries = 50000
+    cache_max_bytes = 64 * 1024 ** 2
+    mask_cache_max_bytes = 1024 ** 3
+    # Memory budget of the masks kept for incremental subset updates. Every row is charged
+    # its whole mask, so rows of one subset and dataset sharing a mask are counted each time
+    subset_aggregates_max_bytes = 1024 ** 3
+    # Item data role holding what the lazily created children of an item are built from,
+    # until the item is expanded or checked for the first time (see populateItem)
+    unpopulated_role = Qt.UserRole + 1
+
+    # Optional on-disk cache of raw statistic values, shared between sessions and processes
+    disk_cache_path = os.path.join(CFG_DIR, 'statistics_cache.sqlite')
+    # Rows of components with at least this many values are split into chunks reduced by all
+    # the workers at once (see scheduleSplitStats)
+    split_row_elements = 2 ** 25
+    # Memory budget of one block read from a file when streaming components that are larger
+    # than memory, see outOfCoreValues
+    stream_chunk_bytes = STREAM_CHUNK_BYTES
+    # Rows of components with at least this many values first show estimates from a random
+    # sample of progressive_sample_size values, refined as chunks of about
+    # progressive_chunk_elements values are reduced (see sampleEstimate). Rows backed by a
+    # file are sampled from progressive_sample_blocks contiguous blocks instead
+    progressive_elements = 1000000
+    progressive_sample_size = SAMPLE_SIZE
+    progressive_sample_blocks = SAMPLE_BLOCKS
+    progressive_chunk_elements = 2 ** 22
+    # Checked rows are calculated right away unless the cost model estimates that they take
+    # longer than confirm_seconds or more than this fraction of the available memory, in which
+    # case the calculation is confirmed first (see check_status)
+    confirm_seconds = 10
+    confirm_memory_fraction = 0.5
 
     def __init__(self, *args, **kwargs):
         '''
@@ -73,9 +131,76 @@ class StatsDataViewer(DataViewer):
         # self.calculatedComponentViewList = np.array(["Subset, Dataset, Component, Mean,
         #                                               Median, Minimum, Maximum, Sum"])
 
-        self.headings = ['Name', 'Mean', 'Median', 'Minimum', 'Maximum', 'Sum']
-        # Set up dict for caching
-        self.cache_stash = dict()
+        # Every registered statistic has a column, those the user hid in the column chooser
+        # are hidden and not calculated; the plan groups the others into shared passes
+        self.statistic_names = statistic_registry.names()
+        settings = QSettings('glue', 'glue-statistics')
+        self.shown_statistics = set(statistic.name for statistic in statistic_registry.defaults())
+        self.shown_statistics.update(settings.value('shown_statistics', [], type=list))
+        self.shown_statistics.difference_update(settings.value('hidden_statistics', [], type=list))
+        self.headings = ['Name'] + list(self.statistic_names)
+        # Raw values of every column by row, see storeKey, that custom columns are evaluated on
+        self.column_store = ColumnStore(self.headings[1:])
+        # Dependencies of the custom columns, and the custom cells waiting to be recomputed
+        # (store key -> names) since their statistics, component values or subset changed
+        self.column_graph = ColumnGraph()
+        self.dirty_columns = dict()
+        # version of the last recomputation of the custom cells of each row, results of older
+        # ones are dropped, and the ids of the recomputation jobs running
+        self.column_versions = dict()
+        self.column_jobs = set()
+        self.updatePlan()
+        # Set up LRU cache for the computed statistics, see cacheKey for the keys
+        self.cache_stash = LRUCache(max_entries=self.cache_max_entries, max_bytes=self.cache_max_bytes)
+        # Version counters of datasets and components (by uuid), bumped when their values change
+        self.data_versions = dict()
+        # Structural fingerprints of the subset states, by id(subset_state)
+        self.state_fingerprints = dict()
+        # Content fingerprints of the components, by (component uuid, version)
+        self.content_fingerprints = dict()
+        # PersistentStatsCache when the disk cache is enabled in the settings
+        self.disk_cache = None
+        # Worker threads computing the statistics, and the rows waiting for each cache key
+        settings = QSettings('glue', 'glue-statistics')
+        workers = settings.value('worker_threads', default_workers(), type=int)
+        backend = settings.value('compute_backend', 'thread', type=str)
+        if backend not in BACKENDS:
+            backend = 'thread'
+        self.compute_service = StatsComputeService(max_workers=workers, backend=backend, parent=self)
+        self.compute_service.finished.connect(self.statsComputed)
+        # components that do not fit in memory are streamed from their file, or reduced by dask
+        # when they are dask arrays
+        self.stream_chunk_bytes = settings.value('stream_chunk_mb', STREAM_CHUNK_BYTES // 1024 ** 2, type=int) * 1024 ** 2
+        self.dask_scheduler = None
+        if dask_available():
+            kind = settings.value('dask_scheduler', 'threads', type=str)
+            memory_limit = settings.value('dask_memory_limit', 0, type=int)
+            self.dask_scheduler = DaskScheduler(kind=kind if kind in SCHEDULERS else 'threads',
+                                                num_workers=workers,
+                                                memory_limit=memory_limit * 1024 ** 3 or None)
+        self.compute_service.failed.connect(self.statsFailed)
+        self.compute_service.progress.connect(self.showProgress)
+        # estimates the cost of the rows about to be calculated from the jobs measured so far,
+        # job id -> (kind of row, bytes reduced) of the jobs running or queued
+        self.cost_model = CostModel()
+        self.job_costs = dict()
+        self.compute_service.measured.connect(self.jobMeasured)
+        self.confirm_seconds = settings.value('confirm_seconds', self.confirm_seconds, type=int)
+        # large rows show estimates until their exact values are known
+        self.progressive = settings.value('progressive', True, type=bool)
+        # item checked most recently, its rows are calculated right after the visible ones
+        self.recentItem = None
+        self.pending_stats = dict()
+        # cache keys of the rows checked in each tab, pinned in the cache
+        self.pinned_keys = {0: set(), 1: set()}
+        # Subset masks shared by every component/statistic of a (subset, dataset) pair
+        self.mask_cache = SubsetMaskCache(max_bytes=self.mask_cache_max_bytes,
+                                          on_evaluate=lambda data, seconds: self.cost_model.observe_mask(data.size, seconds))
+        # Mask and mergeable accumulators each subset row was last computed with, so that
+        # subset edits only have to process the elements that entered or left the subset
+        self.subset_aggregates = LRUCache(max_entries=self.cache_max_entries,
+                                          max_bytes=self.subset_aggregates_max_bytes,
+                                          sizeof=lambda entry: entry[2].nbytes)
         self.isSci = True
         self.num_sigs = 3
         # Set up past selected items
@@ -90,7 +215,7 @@ class StatsDataViewer(DataViewer):
         self.updateComponentSort = False
         self.selected_indices = []
 
-        self.columnCount = 6
+        self.columnCount = len(self.headings)
 
         # Set up tree widget item for the view
         self.subsetTree = ModifiedTreeWidget()
@@ -99,7 +224,9 @@ class StatsDataViewer(DataViewer):
         self.subsetTree.setColumnWidth(0, 350)
         # self.subsetTree.header().setSortIndicator(0, 0)
         QTreeWidget.setHeaderLabels(self.subsetTree, self.headings)
+        self.subsetTree.setItemDelegate(StatsItemDelegate(self, self.subsetTree))
         self.subsetTree.itemClicked.connect(self.check_status)
+        self.subsetTree.itemExpanded.connect(self.populateItem)
         self.sortBySubsets()
         self.subsetTree.expandToDepth(2)
         # self.subsetTree.sortByColumn(0)
@@ -112,7 +239,9 @@ class StatsDataViewer(DataViewer):
         self.componentTree.header().setSortIndicator(1, 0)
         QTreeWidget.setHeaderLabels(self.componentTree, self.headings)
         self.sortByComponents()
+        self.componentTree.setItemDelegate(StatsItemDelegate(self, self.componentTree))
         self.componentTree.itemClicked.connect(self.check_status)
+        self.componentTree.itemExpanded.connect(self.populateItem)
         self.componentTree.expandToDepth(1)
 
         # set up the tabs for each of the two tree views
@@ -122,6 +251,8 @@ class StatsDataViewer(DataViewer):
         self.tabs.addTab(self.tabs1, "Subset View")
         self.tabs.addTab(self.tabs2, "Component View")
         self.setCentralWidget(self.tabs)
+        for name in self.statistic_names:
+            self.setColumnShown(self.statisticColumn(name), name in self.shown_statistics)
 
         # Set up dicts for row indices
         self.subset_dict = dict()
@@ -142,14 +273,23 @@ class StatsDataViewer(DataViewer):
         self.componentViewExportCache = set()
         self.subsetViewExportCache = set()
 
-        self.isCalcAutomatic = not self.hasLargeData()
-        self.confirmedCalc = False
+        # in manual mode every item checked is confirmed, in automatic mode only the
+        # calculations that the cost model finds expensive
+        self.isCalcAutomatic = True
         self.alreadyChecked = []
 
         # Creates the window used to edit decimal points shown on the stats viewer
         self.createEditDecimalWindow()
         # create the window used to toggle manual/automatic calculation
         self.createManualCalcWindow()
+        # create the window used to choose between worker threads and worker processes
+        self.createComputeBackendWindow()
+        # open the disk cache if it was enabled in an earlier session
+        self.setDiskCacheEnabled(QSettings('glue', 'glue-statistics').value('disk_cache', False, type=bool))
+        # create the window used to toggle the disk cache
+        self.createDiskCacheWindow()
+        # create the window used to set the number of workers
+        self.createPerformanceWindow()
 
         # minimize grayed data
         self.minimizeGrayedData()
@@ -176,9 +316,6 @@ class StatsDataViewer(DataViewer):
             msgbox.buttonClicked.connect(self.showAgainUpdate)
             msgbox.exec()
 
-        if not self.isCalcAutomatic:
-            self.showLargeDatasetWarning()
-
         # print(self.state.layers)
         self.state.add_callback('layers', self._on_layers_changed)
 
@@ -202,14 +339,13 @@ class StatsDataViewer(DataViewer):
         self.ctCalculatedItems = []
 
         self.component_names = self.componentNames()
-        self.notYetManualWarned = True
 
         # variables for expanding and collapsing in levels
         self.componentViewLevel = 2
         self.subsetViewDataLevel = 1
         self.subsetViewSubsetLevel = 3
 
-        self.currentColumns = ["{Mean}", "{Median}", "{Minimum}", "{Maximum}", "{Sum}"]
+        self.currentColumns = ["{%s}" % name for name in self.statistic_names]
 
     def addColumn(self):
         '''
@@ -372,240 +508,200 @@ class StatsDataViewer(DataViewer):
         self.expressionEditor.blockSignals(False)
 
     def createNewColumn(self, expression):
-        print("made new column")
         columnName = self.columnNameLine.text()
         expr = str(self.expressionEditor.toPlainText())
         try:
-            columnValues, subsetValues = self.calculateNewColumn(expr)
-            # columnValues = [1, 2, 3, 4, 5] test values
-            print("Done!", columnValues)
+            # parsed and compiled once, then evaluated for every row
+            expression = compile_expression(expr, self.headings[1:] + ["Component"], self.expressionNamespace())
+            values = self.calculateNewColumn(expression)
+        except ExpressionError as e:
+            QMessageBox.warning(None, 'Error', 'Could not evaluate code: ' + str(e))
+            return
 
-            # Add column to viewer
-            # subset view
+        # Add column to viewer
+        self.headings.append(str(columnName))
+        self.subsetTree.setColumnCount(len(self.headings))
+        self.componentTree.setColumnCount(len(self.headings))
+        QTreeWidget.setHeaderLabels(self.subsetTree, self.headings)
+        QTreeWidget.setHeaderLabels(self.componentTree, self.headings)
 
-            self.headings.append(str(columnName))
-            self.subsetTree.setColumnCount(len(self.headings))
-            self.componentTree.setColumnCount(len(self.headings))
-            QTreeWidget.setHeaderLabels(self.subsetTree, self.headings)
-            QTreeWidget.setHeaderLabels(self.componentTree, self.headings)
+        self.populateNewColumn(values)
+        # recomputed from now on when the values it depends on change
+        self.column_graph.add(str(columnName), expression)
+        # the statistics it uses are calculated even if their columns are hidden
+        plan = self.plan
+        self.updatePlan()
+        if self.plan != plan and self.isCalcAutomatic:
+            self.pressedEventCalculate()
 
-            self.populateNewColumn(columnValues, subsetValues)
+    def expressionNamespace(self):
+        '''
+        Returns the modules custom column expressions can use: numpy (np), math, pandas (pd)
+        and scipy when it is installed
+        '''
+        namespace = dict(DEFAULT_NAMESPACE, pd=pd, pandas=pd)
+        try:
+            import scipy
+            import scipy.stats  # noqa
+            namespace['scipy'] = scipy
+        except ImportError:
+            pass
+        return namespace
 
-        except Exception as e:
-            print(e)
-            np.set_printoptions(threshold=False)
-            QMessageBox.warning(None, 'Error', 'Could not evaluate code: ' + str(e))
-            return
+    def updatePlan(self):
+        '''
+        Rebuilds the plan from the statistics whose column is shown and those used by custom
+        columns, hidden statistics are not calculated
+        '''
+        used = self.column_graph.uses(self.column_graph.order())
+        self.plan = StatisticPlan([statistic for statistic in statistic_registry
+                                   if statistic.name in self.shown_statistics or statistic.name in used])
 
-    def populateNewColumn(self, columnValues, subsetValues):
-        '''For Data'''
-        # Subset View
-        data_branch = self.subsetTree.invisibleRootItem().child(0)
-        print('okk', columnValues)
-        for data_i in range(0, data_branch.childCount()):
-            for comp_i in range(0, data_branch.child(data_i).childCount()):
-                value = self.changeNotationForCustomColumnValues(columnValues[comp_i])
-                # print(type(columnValues[comp_i]))
-                temp = self.subsetTree.indexFromItem(data_branch.child(data_i).child(comp_i))
-                self.subsetTree.itemFromIndex(temp).setData(len(self.headings)-1, 0, value)
-                print("subset view added")
-        # Component View
-        data_branch = self.componentTree.invisibleRootItem()
-        for data_i in range(0, data_branch.childCount()):
-            for comp_i in range(0, data_branch.child(data_i).childCount()):
-                value = self.changeNotationForCustomColumnValues(columnValues[comp_i])
-                # print(type(columnValues[comp_i]))
-                # adds values for All Data rows in datasets
-                temp = self.componentTree.indexFromItem(data_branch.child(data_i).child(comp_i).child(0))
-                self.componentTree.itemFromIndex(temp).setData(len(self.headings)-1, 0, value)
-                print("component view added")
-
-        '''For Subsets'''
-        # Subset View
-        index = 0
-        data_branch = self.subsetTree.invisibleRootItem().child(1)
-        for subset_i in range(0, data_branch.childCount()):
-            for data_i in range(0, data_branch.child(subset_i).childCount()):
-                for comp_i in range(0, data_branch.child(subset_i).child(data_i).childCount()):
-                    if not data_branch.child(subset_i).child(data_i).child(comp_i).foreground(0) == QtGui.QBrush(Qt.gray):
-                        value = self.changeNotationForCustomColumnValues(subsetValues[index])
-                        temp = self.subsetTree.indexFromItem(data_branch.child(subset_i).child(data_i).child(comp_i))
-                        self.subsetTree.itemFromIndex(temp).setData(len(self.headings)-1, 0, value)
-                        index += 1
-                        print("Subset view subset added")
-
-        # Component View
-        index = 0
-        data_branch = self.componentTree.invisibleRootItem()
-        for data_i in range(0, data_branch.childCount()):
-            for subset_i in range(0, len(self.xc.subset_groups)):
-                subset_i += 1
-                for comp_i in range(0, data_branch.child(data_i).childCount()):
-                    if not data_branch.child(data_i).child(comp_i).child(subset_i).foreground(0) == QtGui.QBrush(Qt.gray):
-                        value = self.changeNotationForCustomColumnValues(subsetValues[index])
-                        temp = self.componentTree.indexFromItem(data_branch.child(data_i).child(comp_i).child(subset_i))
-                        self.componentTree.itemFromIndex(temp).setData(len(self.headings)-1, 0, value)
-                        index += 1
-                        print("component view subset added")
-
-    def calculateNewColumn(self, expr):
-        '''
-        TODO: This method is super laggy. split() method is slow and eval itself is slow.
-        '''
-        columnValues = []
-        subsetValues = []
-        np.set_printoptions(threshold=sys.maxsize)
-
-        # start loading screen
-        # self.animation_label = QLabel("Loading...")
-        # self.animation_layout = QVBoxLayout()
-        # self.animation_layout.addWidget(self.animation_label)
-        # self.loadingScreen = QWidget()
-        # self.loadingScreen.setFixedSize(200, 200)
-        # self.loadingScreen.setWindowFlags(Qt.WindowStaysOnTopHint | Qt.CustomizeWindowHint)
-        # self.loadingScreen.setLayout(self.animation_layout)
+    def statisticColumn(self, name):
+        '''
+        Returns the column of a statistic in the trees
+        @param name: name of the statistic
+        '''
+        return 1 + self.statistic_names.index(name)
+
+    def isStatisticShown(self, name):
+        return name in self.shown_statistics
+
+    def setColumnShown(self, col, shown):
+        '''
+        Shows or hides a column in both trees
+        @param col: index of the column
+        @param shown: True to show the column
+        '''
+        self.subsetTree.setColumnHidden(col, not shown)
+        self.componentTree.setColumnHidden(col, not shown)
+
+    def setStatisticShown(self, name, shown):
+        '''
+        Shows or hides the column of a statistic, and remembers it for later sessions. Hidden
+        statistics are no longer calculated; a statistic shown again is calculated for the
+        checked rows that do not have it yet, right away in automatic mode.
+        @param name: name of the statistic
+        @param shown: True to show the column
+        '''
+        if shown:
+            self.shown_statistics.add(name)
+        else:
+            self.shown_statistics.discard(name)
+        settings = QSettings('glue', 'glue-statistics')
+        settings.setValue('shown_statistics', [n for n in self.statistic_names if n in self.shown_statistics])
+        settings.setValue('hidden_statistics', [n for n in self.statistic_names if n not in self.shown_statistics])
+        self.updatePlan()
+        self.setColumnShown(self.statisticColumn(name), shown)
+        if shown and self.isCalcAutomatic:
+            self.pressedEventCalculate()
+
+    def populateNewColumn(self, values):
+        '''
+        Writes the values of a new custom column, the last column of the trees, into the rows
+        of both views
+        @param values: dict (subset_i, data_i, comp_i) -> value, see calculateNewColumn
+        '''
+        name = self.headings[-1]
+        self.column_store.set_column(name, [self.storeKey(*indices) for indices in values], list(values.values()))
+        for indices, items in self.rowItems().items():
+            if indices in values:
+                value = self.itemValue(values[indices])
+                for item in items:
+                    item.setData(len(self.headings) - 1, 0, value)
+
+    def rowItems(self):
+        '''
+        Returns a dict mapping the (subset_i, data_i, comp_i) indices of the rows created in
+        the trees to their items in both views. Grayed out rows are left out.
+        '''
+        rows = dict()
+        for tree in (self.subsetTree, self.componentTree):
+            stack = [tree.invisibleRootItem()]
+            while stack:
+                item = stack.pop()
+                stack.extend(item.child(x) for x in range(item.childCount()))
+                if item.foreground(0) == QtGui.QBrush(Qt.gray):
+                    continue
+                labels = self.itemRowLabels(item)
+                if labels is None:
+                    continue
+                try:
+                    indices = self.findIndexInDc(*labels)
+                except Exception:
+                    continue
+                rows.setdefault(indices, []).append(item)
+        return rows
+
+    def componentValues(self, subset_i, data_i, comp_i):
+        '''
+        Returns the finite values of the component of a row (restricted to its subset), which
+        {Component} stands for in custom columns, or None for categorical components
+        @param subset_i: subset index from tree, -1 for all data
+        @param data_i: data index from the tree
+        @param comp_i: component index from the tree
+        '''
+        data = self.xc[data_i]
+        cid = data.components[comp_i]
+        if data.get_component(cid).categorical:
+            return None
+        mask = None
+        if subset_i != -1:
+            mask = self.mask_cache.get_mask(self.xc.subset_groups[subset_i].subset_state, data)
+        return finite_values(data.get_data(cid), mask)
+
+    def calculateNewColumn(self, expression):
+        '''
+        Evaluates a custom column for the rows of the datasets shown in the viewer. Columns are
+        bound to the values of each row in column_store; {Component} to the finite values of
+        its component. Expressions that only combine columns element by element (e.g.
+        {Maximum} - {Minimum}) are evaluated once on the column arrays of the store, across
+        the rows of both views. Rows whose evaluation fails are marked as errors.
+        Returns a dict (subset_i, data_i, comp_i) -> value.
+        @param expression: Expression returned by compile_expression
+        '''
         self.loadingScreen = QMessageBox()
         self.loadingScreen.setWindowFlags(Qt.CustomizeWindowHint | Qt.WindowTitleHint | Qt.FramelessWindowHint)
         self.loadingScreen.setFixedSize(200, 200)
         self.loadingScreen.setInformativeText("Loading...")
-        # self.loadingScreen.setStandardButtons(QMessageBox.close)
-        self.loadingScreen.exec()
-
-        # self.loadingMovie = QMovie('jk317/glue/icons/glue_buffering.png')
-        # if not self.loadingMovie.isValid():
-        #    print("not valid")
-        # self.pixmap = QPixmap('jk317/glue/icons/glue_buffering.png')
-        # self.animation_label.setPixmap(self.pixmap)
-        # self.animation_label.setMovie(self.loadingMovie)
-        # self.loadingMovie.start()d
+        # not modal, so the rest of glue stays usable
+        self.loadingScreen.show()
 
         currentlyActiveDatasets = self.getActiveDatasetsInPlotLayer()
-        # Uses component variable
-        for dataset in self.xc:
-            if dataset.label in currentlyActiveDatasets:
-                for comp in range(0, len(dataset.components)):
-                    code = expr
-                    # uses predefined columns
-                    for index in range(0, len(self.headings)):
-                        if "{" + self.headings[index]+"}" in expr:
-                            columnArray = self.getColumnArray(index)
-                            # columnArray = np.array(columnArray)
-                            code = code.replace("{" + self.headings[index]+"}", str(columnArray[comp]))
-                            # print(code)
-                            # columnValues.append(answer)
-                            # if Component is not used, then we can exit early
-                            # if not "{Component}" in expr:
-                            #    answer = eval(org.replace("{" + self.headings[index]+"}", "np.array(" + str(columnArray)+")"))
-                            #    np.set_printoptions(threshold=False)
-                            #    self.widget.close()
-                            #    return answer
-
-                    import timeit
-
-                    if "{Component}" in expr:
-                        # print("Calculating" , dataset.components[comp], "...")
-                        start = timeit.default_timer()
-
-                        # str(array) results in an array without commas, which cannot be evaluated.
-                        # Need to manipulate array string so it has commas.
-
-                        # print(type(dataset["PRIMARY"]))
-                        dataList = dataset[str(dataset.components[comp])]
-                        # dataList = np.ndarray([elem for elem in dataList if type(elem) == int or type(elem) == np.double or type(elem) ==float])
-                        dataList = np.array2string(dataList, separator=',')
-                        '''
-                        print("converting ...")
-                        dataList = str(dataList)
-                        print("splitting ...")
-                        dataList = ", ".join(dataList.split())
-                        print("replacing ...")
-                        dataList = dataList.replace("[, ", "[")
-                        # need to create a copy of expr because each {Component} will be different component for the loop
-                        '''
-                        code = code.replace("{Component}", dataList)
-                        code = code.replace("nan, ", "")
-                        code = code.replace("nan", "")
-                        # print(code)
-                        try:
-                            print("evaluating ...")
-                            answer = eval(code)
-                        except:
-                            print("Did not calculate")
-                            answer = "NAN"
-                            # break
-                        stop = timeit.default_timer()
-                        print('Time: ', stop - start)
-                        columnValues.append(answer)
-
-                    # No components or predefined columns used: these are simple expressions like 1+1 or "test value"
-                    else:
-                        answer = eval(code)
-                        columnValues.append(answer)
-
-        # subsets
-        for subset_i in range(0, len(self.xc.subset_groups)):
-            for data_i in range(0, len(self.xc)):
-                if self.xc[data_i].label in currentlyActiveDatasets:
-                    for comp_i in self.xc.subset_groups[subset_i].subsets[data_i].components:
-                        code = expr
-                        print("DOING SUBSETS", comp_i)
-                        for index in range(0, len(self.headings)):
-                            if "{" + self.headings[index]+"}" in expr:
-                                columnArray = self.getSubsetArray(index)
-                                # columnArray = np.array(columnArray)
-                                code = code.replace("{" + self.headings[index]+"}", str(columnArray[comp]))
-
-                        if "{Component}" in expr:
-                            start = timeit.default_timer()
-                            try:
-                                print("Calculating", self.xc.subset_groups[subset_i].subsets[data_i][comp_i], "...")
-                            except:
-                                break
-                            start = timeit.default_timer()
-
-                            # str(array) results in an array without commas, which cannot be evaluated.
-                            # Need to manipulate array string so it has commas.
-
-                            # print(type(dataset["PRIMARY"]))
-                            # get values of subset and modify it
-                            dataList = np.array2string(self.xc.subset_groups[subset_i].subsets[data_i][comp_i], separator=',')
-
-                            code = code.replace("{Component}", dataList)
-                            code = code.replace("nan, ", "")
-                            code = code.replace("nan", "")
-                            # print(code)
-                            try:
-                                print("evaluating ...")
-                                answer = eval(code)
-                            except:
-                                print("Did not calculate")
-                                answer = "NAN"
-                            stop = timeit.default_timer()
-                            print('Time: ', stop - start)
-                            subsetValues.append(answer)
-
-                        # No components or predefined columns used:
-                        # these are simple expressions like 1+1 or "test value"
-                        else:
-                            answer = eval(code)
-                            subsetValues.append(answer)
+        rows = [indices for indices in self.rowItems() if self.xc[indices[1]].label in currentlyActiveDatasets]
+        keys = [self.storeKey(*indices) for indices in rows]
+        columns = [name for name in expression.columns if name != "Component"]
+        values = dict()
+
+        if expression.elementwise and "Component" not in expression.columns and rows:
+            # rows that were never calculated take part with NaN values
+            positions = [self.column_store.position(key) for key in keys]
+            try:
+                # one evaluation over the column arrays of every row
+                result = expression.evaluate(dict((name, self.column_store.column(name)) for name in columns))
+                result = np.broadcast_to(result, (len(self.column_store),))
+                values = dict((indices, result[position]) for indices, position in zip(rows, positions))
+            except Exception:
+                # e.g. the result is not a number, evaluate the rows one by one
+                values = dict()
+
+        for indices, key in zip(rows, keys):
+            if indices in values:
+                continue
+            bindings = dict((name, self.column_store.get(key, name)) for name in columns)
+            try:
+                if "Component" in expression.columns:
+                    bindings["Component"] = self.componentValues(*indices)
+                    if bindings["Component"] is None:
+                        values[indices] = "NaN"
+                        continue
+                values[indices] = expression.evaluate(bindings)
+            except Exception:
+                values[indices] = "Error"
 
-        # self.loadingMovie.stop()
-        self.loadingScreen.setInformativeText("Done!")
         self.loadingScreen.close()
-
-        '''
-        subset_branch = self.subsetTree.invisibleRootItem().child(1)
-        for subset_i in range(0, len(self.xc.subset_groups)):
-            for data_i in range(0, len(self.xc)):
-                for comp_i in range(0, len(self.xc[data_i].components)):
-                    d
-        '''
-        np.set_printoptions(threshold=False)
-        print(subsetValues)
         self.widget.close()
-        print(self.state.layers)
-        return columnValues, subsetValues
+        return values
 
     def getActiveDatasetsInPlotLayer(self):
         '''
@@ -629,52 +725,47 @@ class StatsDataViewer(DataViewer):
         print(names)
         return names
 
-    def changeNotationForCustomColumnValues(self, value):
-        if type(value) == str:
+    def itemValue(self, value):
+        '''
+        Converts a calculated value to what is stored in the tree: numbers are kept as raw
+        floats (formatted by StatsItemDelegate when painted), anything else as a string
+        @param value: calculated value
+        '''
+        if isinstance(value, (str, float)):
+            return value
+        if isinstance(value, (int, np.integer, np.floating)) and not isinstance(value, bool):
+            return float(value)
+        return str(value)
+
+    def formatValue(self, value):
+        '''
+        Formats a value of the tree with the current notation and number of decimals,
+        strings (e.g. "NaN" or "Error") are returned unchanged. Estimates of rows that are
+        being calculated are marked as approximate, followed by the half width of their
+        confidence interval.
+        @param value: value stored in the tree
+        '''
+        if isinstance(value, Estimate):
+            text = "\u2248 " + self.formatValue(value.value)
+            if value.half_width() is not None:
+                text += " \u00b1 " + self.formatValue(value.half_width())
+            return text
+        if not isinstance(value, float):
             return value
         if self.isSci:
             # Format in scientific notation
             string = "%." + str(self.num_sigs) + 'E'
         else:
+            # Format in standard notation
             string = "%." + str(self.num_sigs) + 'F'
-
         return string % value
 
-    def getSubsetArray(self, columnIndex):
-        temp = []
-        st = self.subsetTree.invisibleRootItem().child(1)
-        for x in range(0, st.childCount()):
-            for y in range(0, st.child(x).childCount()):
-                for z in range(0, st.child(x).child(y).childCount()):
-                    item = self.subsetTree.indexFromItem(st.child(x).child(y).child(z))
-                    if self.subsetTree.itemFromIndex(item).data(3, 0) is not None:
-                        temp.append(self.subsetTree.itemFromIndex(item).data(columnIndex, 0))
-        temp = [float(x.strip(' "')) for x in temp]
-        return temp
-
-    def getColumnArray(self, columnIndex):
-        '''
-        return the calculated data for a custom column with columnIndex
-        '''
-        temp = []
-        st = self.subsetTree.invisibleRootItem().child(0)
-        for x in range(0, st.childCount()):
-            for y in range(0, st.child(x).childCount()):
-                item = self.subsetTree.indexFromItem(st.child(x).child(y))
-
-                if self.subsetTree.itemFromIndex(item).data(3, 0) is not None:
-                    temp.append(self.subsetTree.itemFromIndex(item).data(columnIndex, 0))
-        # subset
-        # st = self.subsetTree.invisibleRootItem().child(1)
-        # for x in range(0, st.childCount()):
-        #    for y in range(0, st.child(x).childCount()):
-        #        for z in range(0, st.child(x).child(y).childCount()):
-        #            item = self.subsetTree.indexFromItem(st.child(x).child(y).child(z))
-        #            if self.subsetTree.itemFromIndex(item).data(3, 0) is not None:
-        #                temp.append(self.subsetTree.itemFromIndex(item).data(columnIndex, 0))
-        # print(temp)
-        temp = [float(x.strip(' "')) for x in temp]
-        return temp
+    def repaintViewers(self):
+        '''
+        Repaints the rows on screen of both views, used when only the formatting changed
+        '''
+        self.subsetTree.viewport().update()
+        self.componentTree.viewport().update()
 
     def insertAttribute(self):
         print("insert attribute")
@@ -1138,23 +1229,10 @@ class StatsDataViewer(DataViewer):
             # print("input: " , newly_selected[index][1], newly_selected[index][2], newly_selected[index][3] )
             # Finds index of the needed data that is in the data collection. The index of the tree and the data collection is not necessarily the same.
             subset_i, data_i, comp_i = self.findIndexInDc(newly_selected[index][1], newly_selected[index][2], newly_selected[index][3])
-            is_subset = (subset_i != -1)
-
-            # Check if its a subset and if so run subset stats
-            if is_subset:
-                new_data = self.runSubsetStats(subset_i, data_i, comp_i)
-            else:
-                # Run standard data stats
-                new_data = self.runDataStats(data_i, comp_i)
             # populate the subset view
-            for col_index in range(3, len(new_data)):
-                # print(new_data[0], new_data[1], new_data[2])
-                indexItem = self.findIndexItem(new_data[0], new_data[1], new_data[2], 'subsetView')
-                if not indexItem == "Not in viewer":
-                    if new_data[col_index] == "NAN":
-                        self.subsetTree.itemFromIndex(indexItem).setData(col_index-2, 0, "Error")
-                    else:
-                        self.subsetTree.itemFromIndex(indexItem).setData(col_index-2, 0, new_data[col_index])
+            indexItem = self.findIndexItem(*self.rowLabels(subset_i, data_i, comp_i), 'subsetView')
+            if not indexItem == "Not in viewer":
+                self.showStats(self.subsetTree, indexItem, subset_i, data_i, comp_i)
 
         # component view
         newly_selected = self.ctCalculatedItems
@@ -1163,25 +1241,11 @@ class StatsDataViewer(DataViewer):
             # Check which view mode the tree is in to get the correct indices
             # print(newly_selected[index][1])
             subset_i, data_i, comp_i = self.findIndexInDc(newly_selected[index][1], newly_selected[index][2], newly_selected[index][3])
-            is_subset = (subset_i != -1)
-
-            # Check if its a subset and if so run subset stats
-            if is_subset:
-                new_data = self.runSubsetStats(subset_i, data_i, comp_i)
-            else:
-                # Run standard data stats
-                new_data = self.runDataStats(data_i, comp_i)
 
             # populate the Component Tree
-            for col_index in range(3, len(new_data)):
-
-                indexItem = self.findIndexItem(new_data[0], new_data[1], new_data[2], 'componentView')
-                if not indexItem == "Not in viewer":
-                    # print(new_data[0], new_data[1], new_data[2])
-                    if new_data[col_index] == "NAN":
-                        self.componentTree.itemFromIndex(indexItem).setData(col_index-2, 0, "Error")
-                    else:
-                        self.componentTree.itemFromIndex(indexItem).setData(col_index-2, 0, new_data[col_index])
+            indexItem = self.findIndexItem(*self.rowLabels(subset_i, data_i, comp_i), 'componentView')
+            if not indexItem == "Not in viewer":
+                self.showStats(self.componentTree, indexItem, subset_i, data_i, comp_i)
 
     def findIndexItem(self, subsetName, dataName, compName, view):
         # print("find ", subsetName)
@@ -1323,30 +1387,11 @@ class StatsDataViewer(DataViewer):
         # print("closed stats")
         self.decimalWindow.destroy()
         self.manualCalcWindow.destroy()
+        self.computeBackendWindow.destroy()
+        self.diskCacheWindow.destroy()
+        self.performanceWindow.destroy()
         self.instructionWindow.destroy()
 
-    def showLargeDatasetWarning(self):
-        '''
-        shows the QMessageBox popup warning if it has a large dataset
-        '''
-        manualWarning = QMessageBox()  # .question(self, "Warning", "Confirm multiple large dataset calculations", QMessageBox.Yes , QMessageBox.Cancel )
-        manualWarning.setText("There is a dataset with over 1 million values. Manual calculation has been turned on.")
-        manualWarning.setInformativeText("Turn off Manual Calculation in Settings")
-        manualWarning.setWindowTitle("Large Dataset Warning")
-        manualWarning.addButton(QMessageBox.Ok)
-        manualWarning.setDefaultButton(QMessageBox.Ok)
-        # temp = manualWarning.exec()
-        self.isCalcAutomatic = False
-
-    def hasLargeData(self):
-        '''
-        returns true if there is a dataset with size > 1 million. Used to set the default mode for automatic/manual calculation (if large then manual, else automatic)
-        '''
-        for data in self.xc:
-            if data.size > 1000000:
-                return True  # has large data
-        return False
-
     def createEditDecimalWindow(self):
         '''
         Creates the window used to edit decimal points shown on the stats viewer
@@ -1400,8 +1445,19 @@ class StatsDataViewer(DataViewer):
 
         self.vManualCalcLayout.addLayout(self.hManualCalcLayout)
 
+        self.hConfirmLayout = QHBoxLayout()
+        self.hConfirmLayout.addWidget(QLabel("In automatic mode, confirm calculations taking longer than (s):"))
+        self.confirmSpinBox = QSpinBox()
+        self.confirmSpinBox.setRange(1, 24 * 3600)
+        self.confirmSpinBox.setValue(self.confirm_seconds)
+        self.confirmSpinBox.valueChanged.connect(self.confirmSecondsChange)
+        self.hConfirmLayout.addWidget(self.confirmSpinBox)
+
+        layout = QVBoxLayout()
+        layout.addLayout(self.vManualCalcLayout)
+        layout.addLayout(self.hConfirmLayout)
         widget = QWidget()
-        widget.setLayout(self.vManualCalcLayout)
+        widget.setLayout(layout)
         self.manualCalcWindow.setCentralWidget(widget)
 
     def updateToManual(self):
@@ -1416,12 +1472,253 @@ class StatsDataViewer(DataViewer):
         '''
         self.isCalcAutomatic = True
 
+    def confirmSecondsChange(self, i):
+        '''
+        Changes how long a calculation can be expected to take before it has to be confirmed
+        in automatic mode, and remembers it for later sessions
+        @param i: duration in seconds
+        '''
+        self.confirm_seconds = i
+        QSettings('glue', 'glue-statistics').setValue('confirm_seconds', i)
+
     def showManualCalc(self):
         '''
         Shows the Manual Calculation toggle window from the settings menu
         '''
         self.manualCalcWindow.show()
 
+    def createComputeBackendWindow(self):
+        '''
+        Creates the window used to choose whether statistics are computed by worker threads or
+        by worker processes
+        '''
+        self.computeBackendWindow = QMainWindow()
+        self.computeBackendWindow.resize(500, 250)
+        self.computeBackendWindow.setWindowTitle("Select Compute Backend")
+        self.hComputeBackendLayout = QHBoxLayout()
+        self.vComputeBackendLayout = QVBoxLayout()
+
+        computeBackendLabel = QLabel("Compute statistics with worker threads, or with worker processes for "
+                                     "calculations that do not run in parallel on threads:")
+        computeBackendLabel.setWordWrap(True)
+        self.vComputeBackendLayout.addWidget(computeBackendLabel)
+
+        rb1 = QRadioButton("Threads", self)
+        rb1.toggled.connect(lambda checked: checked and self.setComputeBackend('thread'))
+        rb2 = QRadioButton("Processes", self)
+        rb2.toggled.connect(lambda checked: checked and self.setComputeBackend('process'))
+        if self.compute_service.backend == 'process':
+            rb2.setChecked(True)
+        else:
+            rb1.setChecked(True)
+
+        self.hComputeBackendLayout.addWidget(rb1)
+        self.hComputeBackendLayout.addWidget(rb2)
+        self.vComputeBackendLayout.addLayout(self.hComputeBackendLayout)
+
+        widget = QWidget()
+        widget.setLayout(self.vComputeBackendLayout)
+        self.computeBackendWindow.setCentralWidget(widget)
+
+    def setComputeBackend(self, backend):
+        '''
+        Switches the compute service between worker threads and worker processes and remembers
+        the choice for later sessions
+        @param backend: 'thread' or 'process'
+        '''
+        self.compute_service.set_backend(backend)
+        QSettings('glue', 'glue-statistics').setValue('compute_backend', backend)
+
+    def showComputeBackend(self):
+        '''
+        Shows the Compute Backend selection window from the settings menu
+        '''
+        self.computeBackendWindow.show()
+
+    def createDiskCacheWindow(self):
+        '''
+        Creates the window used to toggle and clear the on-disk statistics cache
+        '''
+        self.diskCacheWindow = QMainWindow()
+        self.diskCacheWindow.resize(500, 250)
+        self.diskCacheWindow.setWindowTitle("Toggle Disk Cache")
+        self.hDiskCacheLayout = QHBoxLayout()
+        self.vDiskCacheLayout = QVBoxLayout()
+
+        diskCacheLabel = QLabel("Keep calculated values in " + self.disk_cache_path + " for later sessions:")
+        diskCacheLabel.setWordWrap(True)
+        self.vDiskCacheLayout.addWidget(diskCacheLabel)
+
+        rb1 = QRadioButton("Enabled", self)
+        rb1.toggled.connect(lambda checked: checked and self.setDiskCacheEnabled(True))
+        rb2 = QRadioButton("Disabled", self)
+        rb2.toggled.connect(lambda checked: checked and self.setDiskCacheEnabled(False))
+        if self.disk_cache is not None:
+            rb1.setChecked(True)
+        else:
+            rb2.setChecked(True)
+
+        self.hDiskCacheLayout.addWidget(rb1)
+        self.hDiskCacheLayout.addWidget(rb2)
+        self.vDiskCacheLayout.addLayout(self.hDiskCacheLayout)
+
+        clearButton = QPushButton("Clear Disk Cache")
+        clearButton.clicked.connect(self.clearDiskCache)
+        self.vDiskCacheLayout.addWidget(clearButton)
+
+        widget = QWidget()
+        widget.setLayout(self.vDiskCacheLayout)
+        self.diskCacheWindow.setCentralWidget(widget)
+
+    def setDiskCacheEnabled(self, enabled):
+        '''
+        Opens or closes the on-disk statistics cache and remembers the choice for later sessions
+        @param enabled: True to read and write calculated values on disk
+        '''
+        if enabled and self.disk_cache is None:
+            try:
+                self.disk_cache = PersistentStatsCache(self.disk_cache_path)
+            except Exception:
+                # e.g. a read-only config directory, keep working from memory only
+                self.disk_cache = None
+                return
+        elif not enabled and self.disk_cache is not None:
+            self.disk_cache.close()
+            self.disk_cache = None
+        QSettings('glue', 'glue-statistics').setValue('disk_cache', enabled)
+
+    def clearDiskCache(self):
+        '''
+        Deletes every value stored in the on-disk statistics cache
+        '''
+        if self.disk_cache is not None:
+            self.disk_cache.clear()
+        elif os.path.exists(self.disk_cache_path):
+            cache = PersistentStatsCache(self.disk_cache_path)
+            cache.clear()
+            cache.close()
+
+    def showDiskCache(self):
+        '''
+        Shows the Disk Cache toggle window from the settings menu
+        '''
+        self.diskCacheWindow.show()
+
+    def createPerformanceWindow(self):
+        '''
+        Creates the window used to set how many workers compute the statistics
+        '''
+        self.performanceWindow = QMainWindow()
+        self.performanceWindow.resize(500, 250)
+        self.performanceWindow.setWindowTitle("Performance Settings")
+        self.performanceLayout = QVBoxLayout()
+        self.hWorkersLayout = QHBoxLayout()
+
+        workersLabel = QLabel()
+        workersLabel.setText('Number of workers:')
+        self.hWorkersLayout.addWidget(workersLabel)
+
+        self.workersSpinBox = QSpinBox()
+        self.workersSpinBox.setRange(1, 4 * default_workers())
+        self.workersSpinBox.setValue(self.compute_service.max_workers)
+        self.workersSpinBox.valueChanged.connect(self.workersChange)
+        self.hWorkersLayout.addWidget(self.workersSpinBox)
+        self.performanceLayout.addLayout(self.hWorkersLayout)
+
+        self.hChunkLayout = QHBoxLayout()
+        self.hChunkLayout.addWidget(QLabel('Memory per block read from files (MB):'))
+        self.chunkSpinBox = QSpinBox()
+        self.chunkSpinBox.setRange(16, 65536)
+        self.chunkSpinBox.setValue(self.stream_chunk_bytes // 1024 ** 2)
+        self.chunkSpinBox.valueChanged.connect(self.chunkBudgetChange)
+        self.hChunkLayout.addWidget(self.chunkSpinBox)
+        self.performanceLayout.addLayout(self.hChunkLayout)
+
+        self.progressiveCheckBox = QCheckBox('Show estimates while large rows are calculated')
+        self.progressiveCheckBox.setChecked(self.progressive)
+        self.progressiveCheckBox.toggled.connect(self.progressiveChange)
+        self.performanceLayout.addWidget(self.progressiveCheckBox)
+
+        # settings of the dask scheduler used for data larger than memory
+        if self.dask_scheduler is not None:
+            self.hDaskLayout = QHBoxLayout()
+            self.hDaskLayout.addWidget(QLabel('Out-of-core scheduler:'))
+            self.daskSchedulerBox = QComboBox()
+            self.daskSchedulerBox.addItem("Local threads", 'threads')
+            if cluster_available():
+                self.daskSchedulerBox.addItem("Local cluster", 'cluster')
+            self.daskSchedulerBox.setCurrentIndex(max(0, self.daskSchedulerBox.findData(self.dask_scheduler.kind)))
+            self.daskSchedulerBox.currentIndexChanged.connect(self.daskSchedulerChange)
+            self.hDaskLayout.addWidget(self.daskSchedulerBox)
+            self.performanceLayout.addLayout(self.hDaskLayout)
+
+            self.hMemoryLayout = QHBoxLayout()
+            self.hMemoryLayout.addWidget(QLabel('Cluster memory limit in GB (0 for automatic):'))
+            self.memoryLimitSpinBox = QSpinBox()
+            self.memoryLimitSpinBox.setRange(0, 4096)
+            self.memoryLimitSpinBox.setValue((self.dask_scheduler.memory_limit or 0) // 1024 ** 3)
+            self.memoryLimitSpinBox.valueChanged.connect(self.daskMemoryLimitChange)
+            self.hMemoryLayout.addWidget(self.memoryLimitSpinBox)
+            self.performanceLayout.addLayout(self.hMemoryLayout)
+
+        widget = QWidget()
+        widget.setLayout(self.performanceLayout)
+        self.performanceWindow.setCentralWidget(widget)
+
+    def workersChange(self, i):
+        '''
+        Changes the number of workers and remembers it for later sessions
+        @param i: value of the integer in the QSpinBox determining the number of workers
+        '''
+        self.compute_service.set_max_workers(i)
+        if self.dask_scheduler is not None:
+            self.dask_scheduler.num_workers = i
+        QSettings('glue', 'glue-statistics').setValue('worker_threads', i)
+
+    def chunkBudgetChange(self, i):
+        '''
+        Changes the memory budget of the blocks read when streaming components from files and
+        remembers it for later sessions
+        @param i: budget in MB
+        '''
+        self.stream_chunk_bytes = i * 1024 ** 2
+        QSettings('glue', 'glue-statistics').setValue('stream_chunk_mb', i)
+
+    def progressiveChange(self, checked):
+        '''
+        Turns the estimates of large rows on or off and remembers it for later sessions
+        @param checked: True to show estimates until the exact values are known
+        '''
+        self.progressive = checked
+        QSettings('glue', 'glue-statistics').setValue('progressive', checked)
+
+    def daskSchedulerChange(self, i):
+        '''
+        Switches the dask scheduler used for out-of-core components and remembers it for later
+        sessions
+        @param i: index of the scheduler in the QComboBox
+        '''
+        kind = self.daskSchedulerBox.itemData(i)
+        self.dask_scheduler.close()
+        self.dask_scheduler.kind = kind
+        QSettings('glue', 'glue-statistics').setValue('dask_scheduler', kind)
+
+    def daskMemoryLimitChange(self, i):
+        '''
+        Changes the memory limit of the local dask cluster, which is restarted with the new
+        limit the next time it is used
+        @param i: memory limit in GB, 0 to let dask choose
+        '''
+        self.dask_scheduler.close()
+        self.dask_scheduler.memory_limit = i * 1024 ** 3 or None
+        QSettings('glue', 'glue-statistics').setValue('dask_memory_limit', i)
+
+    def showPerformanceSettings(self):
+        '''
+        Shows the Performance Settings window from the settings menu
+        '''
+        self.performanceWindow.show()
+
     def showInstructions(self):
         '''
         Shows the instructions window from the settings menu
@@ -1483,7 +1780,8 @@ class StatsDataViewer(DataViewer):
         '''
         self.num_sigs = i
         # getcontext().prec = self.num_sigs
-        self.pressedEventCalculate()
+        # values are formatted when painted, nothing has to be recalculated
+        self.repaintViewers()
 
     def refresh(self, message):
         '''
@@ -1569,6 +1867,7 @@ class StatsDataViewer(DataViewer):
         # hub.subscribe(self, SubsetCreateMessage, handler=self.subsetCreatedMessage)
         hub.subscribe(self, SubsetDeleteMessage, handler=self.subsetDeleteMessage)
         hub.subscribe(self, DataUpdateMessage, handler=self.dataUpdateMessage)
+        hub.subscribe(self, NumericalDataChangedMessage, handler=self.numericalDataChangedMessage)
         hub.subscribe(self, SubsetUpdateMessage, handler=self.subsetUpdateMessage)
         hub.subscribe(self, EditSubsetMessage, handler=self.editSubsetMessage)
         hub.subscribe(self, LayerArtistVisibilityMessage, handler=self.layerArtistVisibilityMessage)
@@ -1705,8 +2004,6 @@ class StatsDataViewer(DataViewer):
                 if cTree.child(x).data(0, 0) == dataname:
                     cParentItem = cTree.child(x)
                     # print("found parent")
-                    # the index of the component in dc
-                    k = cTree.child(x).childCount()
 
             # add the component to the viewer
             child = QTreeWidgetItem(cParentItem)
@@ -1721,25 +2018,9 @@ class StatsDataViewer(DataViewer):
             childtwo.setIcon(0, helpers.layer_icon(self.xc[i]))
             childtwo.setCheckState(0, 0)
 
-            # if there are subsets, then add to the new component
-            if not len(self.xc.subset_groups) == 0:
-                disableSubset = False
-                temp = False
-                for j in range(0, len(self.xc.subset_groups)):
-                    childtwo = QTreeWidgetItem(child)
-                    childtwo.setData(0, 0, '{}'.format(self.xc.subset_groups[j].label))
-                    childtwo.setIcon(0, helpers.layer_icon(self.xc.subset_groups[j]))
-                    childtwo.setCheckState(0, 0)
-                    if (not disableSubset) and (not temp):
-                        try:
-                            self.xc[i].compute_statistic('minimum', self.xc[i].subsets[j].components[k], subset_state=self.xc.subset_groups[j].subset_state)
-                            temp = True
-                        except:
-                            disableSubset = True
-                    if disableSubset:
-                        childtwo.setData(0, Qt.CheckStateRole, QVariant())
-                        childtwo.setForeground(0, QtGui.QBrush(Qt.gray))
-                    self.num_rows = self.num_rows + 1
+            # the new component is expanded, so its subset rows are created right away
+            self.markUnpopulated(child, (self.xc[i], self.xc[i].components[j]))
+            self.populateItem(child)
             # print("ended component view")
         self.component_names = self.componentNames()
 
@@ -1768,6 +2049,11 @@ class StatsDataViewer(DataViewer):
         # print(message.sender._edit_subset)
         for x in message.sender._edit_subset:
             editedSubset = x.label
+            # the state may have been edited in place, so its masks and fingerprint must be rebuilt
+            self.mask_cache.invalidate(subset_state=x.subset_state)
+            self.state_fingerprints.pop(id(x.subset_state), None)
+            self.invalidateRows([key for key in self.column_store.keys() if key[0] == id(x)])
+        self.pruneMasks()
 
         # print("subset name: " + str(editedSubset))
         if not editedSubset == '':
@@ -1790,20 +2076,8 @@ class StatsDataViewer(DataViewer):
                                 break  # nothing is calculated, automatically updated
                             elif subset_group.data(0, 0) == editedSubset and self.subsetTree.itemFromIndex(item).data(1, 0) is not None:
                                 # print("remove values")
-                                # item = self.subsetTree.indexFromItem(subset_branch.child(subset_i).child(data).child(component))
-
-                                data_i = item.parent().row()
-                                comp_i = item.row()
-                                subset_i = item.parent().parent().row()
-
-                                subset_label = self.xc[data_i].subsets[subset_i].label
-                                data_label = self.xc[data_i].label
-                                comp_label = self.xc[data_i].components[comp_i].label  # add to the name array to build the table
-                                # Build the cache key
-                                cache_key = subset_label + data_label + comp_label
-
-                                self.cache_stash.pop(cache_key)
-                                for col in range(1, 6):
+                                # the new definition has a new cache key, so only the cells are cleared
+                                for col in range(1, 1 + len(self.statistic_names)):
                                     self.subsetTree.itemFromIndex(item).setData(col, 0, None)
 
             # update the component view
@@ -1815,18 +2089,7 @@ class StatsDataViewer(DataViewer):
                         if self.componentTree.itemFromIndex(item).data(1, 0) is None:
                             break
                         elif ct.child(d).child(c).child(s).data(0, 0) == editedSubset and self.componentTree.itemFromIndex(item).data(1, 0) is not None:
-                            data_i = item.parent().parent().row()
-                            comp_i = item.parent().row()
-                            subset_i = item.row() - 1
-
-                            subset_label = self.xc[data_i].subsets[subset_i].label
-                            data_label = self.xc[data_i].label
-                            comp_label = self.xc[data_i].components[comp_i].label
-
-                            # Build the cache key
-                            cache_key = subset_label + data_label + comp_label
-                            self.cache_stash.pop(cache_key)
-                            for col in range(1, 6):
+                            for col in range(1, 1 + len(self.statistic_names)):
                                 self.componentTree.itemFromIndex(item).setData(col, 0, None)
             self.pressedEventCalculate()
 
@@ -1836,47 +2099,31 @@ class StatsDataViewer(DataViewer):
         @param item: QTreewidgetItem that has been checked/unchecked
         @param col: Column number of the action
         '''
-        if self.isCalcAutomatic:
-            # if being checked
-            if item.checkState(0):
-                # print("checked")
-                # if the data branch is selected, check everything under data branch
-                # print("AIUEFAIWEB")
-                self.check_status_helper(2, item)
-
-            # being unchecked
-            else:
-                # print("OH NO")
-                # print("unchecked")
-                # 0 means to uncheck NOTE: This is different then checkState. 0 for checkState means it is checked
+        if item.checkState(0):
+            self.recentItem = item
+
+        if item.checkState(0):
+            # the rows under the item have to exist for their cost to be estimated
+            self.populateItem(item, recursive=True)
+            estimate = self.batchCost(item)
+            # cheap calculations run right away, unless every batch is confirmed in manual mode
+            confirm = self.isExpensive(estimate) or (not self.isCalcAutomatic and item.childCount() > 0)
+            if estimate.rows and confirm and not self.confirmCalculation(estimate):
+                # calc was cancelled by user, undo check and return
+                item.setCheckState(0, 0)
                 self.check_status_helper(0, item)
+                return
+            self.check_status_helper(2, item)
             self.pressedEventCalculate()
 
-        # if calculation in in manual mode
+        # being unchecked
         else:
-            # if item.childCount() == 0 and
-
-            if item.checkState(0):
-                # if checked before, or has no children(single component calculation) then act like automatic
-                if item in self.alreadyChecked or item.childCount() == 0:
-                    self.check_status_helper(2, item)
-                    self.pressedEventCalculate()
-
-                # if not already checked, show warning
-                elif item not in self.alreadyChecked:
-                    self.showManualWarning()
-                    # if the calc was confirmed by user
-                    if self.confirmedCalc:
-                        self.alreadyChecked.append(item)
-                        self.check_status_helper(2, item)
-                        self.pressedEventCalculate()
-                    # calc was cancelled by user, undo check and return
-                    else:
-                        item.setCheckState(0, 0)
-                        return
-            # if being unchecked
+            # 0 means to uncheck NOTE: This is different then checkState. 0 for checkState means it is checked
+            self.check_status_helper(0, item)
+            if self.isCalcAutomatic:
+                self.pressedEventCalculate()
             else:
-                self.check_status_helper(0, item)
+                self.cancelStaleStats()
 
     def check_status_helper(self, state, dataset):
         '''
@@ -1884,6 +2131,9 @@ class StatsDataViewer(DataViewer):
         @param state: Number representing whether the action was check/uncheck
         @param dataset: QTreewidgetItem that has been checked/unchecked
         '''
+        # every row under a checked item is calculated, so it has to exist
+        if state == 2:
+            self.populateItem(dataset, recursive=True)
         dataset_count = dataset.childCount()
         if state == 2:
             dataset.setExpanded(True)
@@ -1922,26 +2172,123 @@ class StatsDataViewer(DataViewer):
                         else:
                             dataset.child(x).child(y).child(z).setExpanded(False)
 
-    def showManualWarning(self):
-        '''
-        Shows the Manual Calculation confirmation
-        '''
-        if self.notYetManualWarned:
-            manualWarning = QMessageBox()  # .question(self, "Warning", "Confirm multiple large dataset calculations", QMessageBox.Yes , QMessageBox.Cancel )
-            manualWarning.setText("Confirm Calculation of multiple large datasets")
-            manualWarning.setInformativeText("Turn off Manual Calculation in Settings")
-            manualWarning.setStandardButtons(QMessageBox.Cancel)
-            manualWarning.addButton(QMessageBox.Ok)
-            manualWarning.setDefaultButton(QMessageBox.Cancel)
-            temp = manualWarning.exec()
-            # print(temp)
-            if temp == QMessageBox.Ok:
-                # print("ok")
-                self.confirmedCalc = True
-            if temp == QMessageBox.Cancel:
-                # print("cancel")
-                self.confirmedCalc = False
-            self.notYetManualWarned = False
+    def batchCost(self, item):
+        '''
+        Estimates the cost of calculating the rows under an item (or the item itself if it is
+        a row) that are neither cached nor being calculated, see CostModel
+        @param item: QTreeWidgetItem that is being checked
+        '''
+        rows = []
+        stack = [item]
+        while stack:
+            current = stack.pop()
+            stack.extend(current.child(x) for x in range(current.childCount()))
+            if current.foreground(0) == QtGui.QBrush(Qt.gray):
+                continue
+            labels = self.itemRowLabels(current)
+            if labels is None:
+                continue
+            try:
+                indices = self.findIndexInDc(*labels)
+            except Exception:
+                continue
+            work = self.rowWork(*indices)
+            if work is not None:
+                rows.append(work)
+        return self.cost_model.estimate(rows, self.compute_service.max_workers, self.stream_chunk_bytes)
+
+    def itemRowLabels(self, item):
+        '''
+        Returns the (subset, data, component) labels of a row item, as findIndexInDc takes
+        them, or None if the item is not a row
+        @param item: QTreeWidgetItem of subsetTree or componentTree
+        '''
+        ancestors = []
+        parent = item.parent()
+        while parent is not None:
+            ancestors.insert(0, parent)
+            parent = parent.parent()
+        if item.treeWidget() is self.subsetTree:
+            if len(ancestors) == 2 and ancestors[0] is self.subsetTree.invisibleRootItem().child(0):
+                return ("All data", ancestors[1].data(0, 0), item.data(0, 0))
+            if len(ancestors) == 3:
+                return (ancestors[1].data(0, 0), ancestors[2].data(0, 0), item.data(0, 0))
+        elif len(ancestors) == 2:
+            return (item.data(0, 0), ancestors[0].data(0, 0), ancestors[1].data(0, 0))
+        return None
+
+    def rowWork(self, subset_i, data_i, comp_i):
+        '''
+        Returns what the cost model needs to know about a row, see CostModel.estimate, or None
+        if the row costs nothing: cached, being calculated or categorical
+        @param subset_i: subset index from tree, -1 for all data
+        @param data_i: data index from the tree
+        @param comp_i: component index from the tree
+        '''
+        if self.cacheKey(subset_i, data_i, comp_i) in self.pending_stats:
+            return None
+        if self.cachedStats(subset_i, data_i, comp_i) is not None:
+            return None
+        data = self.xc[data_i]
+        cid = data.components[comp_i]
+        component = data.get_component(cid)
+        if component.categorical:
+            return None
+        raw = self.outOfCoreValues(data, cid)
+        if raw is not None:
+            kind, itemsize = 'dask' if is_dask_array(raw) else 'stream', np.dtype(raw.dtype).itemsize
+        elif isinstance(component, (DerivedComponent, CoordinateComponent)):
+            # computed as floats when they are accessed
+            kind, itemsize = 'memory', 8
+        else:
+            kind, itemsize = 'memory', np.dtype(component.data.dtype).itemsize
+        new_mask = None
+        if subset_i != -1:
+            subset_state = self.xc.subset_groups[subset_i].subset_state
+            if not self.mask_cache.has_mask(subset_state, data):
+                # keyed like SubsetMaskCache, one mask serves every component of the dataset
+                new_mask = (id(subset_state), id(data))
+        return (kind, data.size, itemsize, new_mask)
+
+    def isExpensive(self, estimate):
+        '''
+        Returns True if a calculation should be confirmed before it starts: it is estimated to
+        take longer than confirm_seconds or to use too much of the available memory
+        @param estimate: CostEstimate of the calculation
+        '''
+        if estimate.seconds > self.confirm_seconds:
+            return True
+        memory = available_memory()
+        return memory is not None and estimate.memory > self.confirm_memory_fraction * memory
+
+    def confirmCalculation(self, estimate):
+        '''
+        Asks the user to confirm a calculation, showing its estimated cost. Returns True if the
+        calculation was confirmed.
+        @param estimate: CostEstimate of the calculation
+        '''
+        confirmation = QMessageBox()
+        confirmation.setWindowTitle("Confirm Calculation")
+        confirmation.setText(estimate.describe())
+        if self.isCalcAutomatic:
+            confirmation.setInformativeText("Calculations expected to take longer than %d s are confirmed first, "
+                                            "this can be changed in Settings" % self.confirm_seconds)
+        else:
+            confirmation.setInformativeText("Turn off Manual Calculation in Settings")
+        confirmation.setStandardButtons(QMessageBox.Cancel)
+        confirmation.addButton(QMessageBox.Ok)
+        confirmation.setDefaultButton(QMessageBox.Cancel)
+        return confirmation.exec() == QMessageBox.Ok
+
+    def jobMeasured(self, job_id, seconds):
+        '''
+        Feeds the time a job ran to the cost model
+        @param job_id: id of the job
+        @param seconds: time the job ran
+        '''
+        cost = self.job_costs.pop(job_id, None)
+        if cost is not None:
+            self.cost_model.observe(cost[0], cost[1], seconds)
 
     def subsetNames(self):
         '''
@@ -1959,6 +2306,8 @@ class StatsDataViewer(DataViewer):
         '''
         # print(message)
         # print("update detected")
+        if getattr(message, 'attribute', None) == 'subset_state':
+            self.state_fingerprints.pop(id(message.subset.subset_state), None)
         index1 = str(message).index("Subset: ") + len("Subset: ")
         index2 = str(message).index(" (data: ")
         index3 = str(message).index(")")
@@ -2074,6 +2423,32 @@ class StatsDataViewer(DataViewer):
             self.activePlotLayerList.remove("Subset: " + old_name + data_name + ")")
             self.activePlotLayerList.append("Subset: " + new_name + data_name + ")")
 
+    def numericalDataChangedMessage(self, message):
+        '''
+        Bumps the version counters of a dataset whose values changed, so that the rows depending
+        on the changed components get new cache keys, and recalculates the checked rows
+        @param message: Message given by the event, contains details about how it was triggered
+        '''
+        data = message.sender
+        changed = getattr(message, 'components_changed', None)
+        if not changed:
+            changed = data.components
+        for cid in changed:
+            self.data_versions[cid.uuid] = self.data_versions.get(cid.uuid, 0) + 1
+        # subset masks may depend on any changed component
+        self.data_versions[data.uuid] = self.data_versions.get(data.uuid, 0) + 1
+
+        self.mask_cache.invalidate(data=data)
+        for row_key, (group, dataset, mask, aggregate) in list(self.subset_aggregates.items()):
+            if dataset is data:
+                self.subset_aggregates.pop(row_key)
+        # rows of the changed components, and every subset row since their masks may change
+        changed_uuids = set(cid.uuid for cid in changed)
+        self.invalidateRows([key for key in self.column_store.keys()
+                             if key[1] == data.uuid and (key[0] != -1 or key[2] in changed_uuids)])
+
+        self.pressedEventCalculate()
+
     def dataUpdateMessage(self, message):
         '''
         Updates the attributes of the edited dataset (glue's left side panel info - names and color), size doesnt matter for this viewer
@@ -2279,6 +2654,8 @@ class StatsDataViewer(DataViewer):
             child.setData(0, 0, '{}'.format('All data (' + self.xc.labels[i] + ')'))
             child.setIcon(0, helpers.layer_icon(self.xc[i]))
             child.setCheckState(0, 0)
+            # the subset rows of the component are created when it is expanded
+            self.markUnpopulated(parent, (self.xc[i], self.xc[i].components[k]))
 
             self.num_rows = self.num_rows + 1
             # disableSubset = False
@@ -2305,11 +2682,12 @@ class StatsDataViewer(DataViewer):
         self.data_names = self.xc.labels
         self.subsetTree.expandToDepth(1)
         self.componentTree.expandToDepth(1)
+        # expandToDepth does not emit itemExpanded
+        self.populateExpanded(self.subsetTree.invisibleRootItem())
+        self.populateExpanded(self.componentTree.invisibleRootItem())
         self.subsetViewDataLevel = 1
         self.componentViewLevel = 2
         self.minimizeGrayedData()
-        if self.xc[i].size > 1000000:
-            self.showLargeDatasetWarning()
         self.component_names = self.componentNames()
         dummy, self.plotlayer_names = self.plotLayerNames()
 
@@ -2362,33 +2740,9 @@ class StatsDataViewer(DataViewer):
                 parent.setData(0, 0, '{}'.format(self.xc.subset_groups[j].label) + ' (' + '{}'.format(self.xc[i].label) + ')')
                 parent.setIcon(0, helpers.layer_icon(self.xc.subset_groups[j]))
                 parent.setCheckState(0, 0)
-                parent.setExpanded(True)
-
-                disableSubset1 = False
-                temp1 = False
-
-                for k in range(0, len(self.xc[i].components)):
-                    # print("added:", i, j, k)
-                    child = QTreeWidgetItem(parent)
-                    child.setData(0, 0, '{}'.format(str(self.xc[i].components[k])))
-                    child.setIcon(0, helpers.layer_icon(self.xc.subset_groups[j]))
-                    child.setCheckState(0, 0)
-                    child.setExpanded(True)
-
-                    if (not disableSubset1) and (not temp1):
-                        try:
-                            # x = self.xc[i].compute_statistic('minimum', self.xc[i].subsets[j].components[k], subset_state=self.xc.subset_groups[j].subset_state)
-                            temp1 = True
-
-                        except:
-                            parent.setData(0, Qt.CheckStateRole, QVariant())
-                            parent.setForeground(0, QtGui.QBrush(Qt.gray))
-                            parent.setExpanded(False)
-                            disableSubset1 = True
-                    if disableSubset1:
-                        # print("disabled subsetview")
-                        child.setData(0, Qt.CheckStateRole, QVariant())
-                        child.setForeground(0, QtGui.QBrush(Qt.gray))
+                # the component rows are created when the subset is expanded or checked,
+                # so the subsets branch does not hold every subset x dataset x component row
+                self.markUnpopulated(parent, (self.xc.subset_groups[j], self.xc[i]))
 
             # print("component view making")
             '''Component View'''
@@ -2402,6 +2756,9 @@ class StatsDataViewer(DataViewer):
                 for k in range(0, parent.childCount()):
                     # print("component made")
                     component = parent.child(k)
+                    # components that were never expanded get every subset when they are
+                    if component.data(0, self.unpopulated_role) is not None:
+                        continue
 
                     childtwo = QTreeWidgetItem(component)
                     childtwo.setData(0, 0, '{}'.format(current_subset))
@@ -2410,7 +2767,8 @@ class StatsDataViewer(DataViewer):
 
                     if (not disableSubset2) and (not temp2):
                         try:
-                            self.xc[i].compute_statistic('minimum', self.xc[i].subsets[j].components[k], subset_state=self.xc.subset_groups[j].subset_state)
+                            # evaluating the mask checks the subset applies to the dataset and warms the mask cache
+                            self.mask_cache.get_mask(self.xc.subset_groups[j].subset_state, self.xc[i])
                             temp2 = True
                         except:
                             disableSubset2 = True
@@ -2531,6 +2889,9 @@ class StatsDataViewer(DataViewer):
         if temp == -1:
             raise Exception("invalid error code, method deleteHelper not called properly")
 
+        self.pruneMasks()
+        self.cancelStaleStats()
+
         '''Subset view'''
         # data branch of tree
         data_branch = self.subsetTree.invisibleRootItem().child(temp)
@@ -2592,6 +2953,9 @@ class StatsDataViewer(DataViewer):
         if it is newly deselected, remove it from the table
         '''
 
+        # rows that were unchecked or superseded since the last calculation stop computing
+        self.cancelStaleStats()
+
         self.selected_indices = []
         showNANPopup = False
         # determines whether or not to show the NAN error: the subset is too small/no intersection and has no values to calculate
@@ -2633,6 +2997,7 @@ class StatsDataViewer(DataViewer):
             for x in self.selected_indices:
                 self.stCalculatedItems.append(x)
             newly_selected = self.selected_indices  # self.setdiff2d(self.selected_indices, self.past_selected)
+            self.prefetchStats(newly_selected)
 
             for index in range(0, len(newly_selected)):
 
@@ -2643,22 +3008,10 @@ class StatsDataViewer(DataViewer):
                 # Finds index of the needed data that is in the data collection. The index of the tree and the data collection is not necessarily the same.
                 subset_i, data_i, comp_i = self.findIndexInDc(newly_selected[index][1], newly_selected[index][2], newly_selected[index][3])
 
-                is_subset = (subset_i != -1)
-
-                # Check if its a subset and if so run subset stats
-                if is_subset:
-                    new_data = self.runSubsetStats(subset_i, data_i, comp_i)
-                else:
-                    # Run standard data stats
-                    new_data = self.runDataStats(data_i, comp_i)
-
-                # populate the subset view
-                for col_index in range(3, len(new_data)):
-                    if new_data[col_index] == "NAN":
-                        showNANPopup = True
-                        self.subsetTree.itemFromIndex(newly_selected[index][0]).setData(col_index-2, 0, "Error")
-                    else:
-                        self.subsetTree.itemFromIndex(newly_selected[index][0]).setData(col_index-2, 0, new_data[col_index])
+                # populate the subset view, rows that are not cached are filled in when the
+                # worker thread is done with them
+                if self.showStats(self.subsetTree, newly_selected[index][0], subset_i, data_i, comp_i):
+                    showNANPopup = True
 
         # if calculating component view
         elif self.tabs.currentIndex() == 1:
@@ -2678,35 +3031,147 @@ class StatsDataViewer(DataViewer):
             newly_selected = self.selected_indices
             for x in self.selected_indices:
                 self.ctCalculatedItems.append(x)
+            self.prefetchStats(newly_selected)
 
             for index in range(0, len(newly_selected)):
 
                 # Check which view mode the tree is in to get the correct indices
                 subset_i, data_i, comp_i = self.findIndexInDc(newly_selected[index][1], newly_selected[index][2], newly_selected[index][3])
 
-                is_subset = (subset_i != -1)
-
-                # Check if its a subset and if so run subset stats
-                if is_subset:
-                    new_data = self.runSubsetStats(subset_i, data_i, comp_i)
-
-                else:
-                    # Run standard data stats
-                    new_data = self.runDataStats(data_i, comp_i)
                 # self.nestedtree.itemFromIndex(newly_selected[0]).setData(0, 0, new_data[0][0])
 
                 # populate the Component Tree
-                for col_index in range(3, len(new_data)):
-                    if new_data[col_index] == "NAN":
-                        showNANPopup = True
-                        self.componentTree.itemFromIndex(newly_selected[index][0]).setData(col_index-2, 0, "Error")
-                    else:
-                        self.componentTree.itemFromIndex(newly_selected[index][0]).setData(col_index-2, 0, new_data[col_index])
-                        # Removes numerical values for categorical variables and replace with NAN
+                if self.showStats(self.componentTree, newly_selected[index][0], subset_i, data_i, comp_i):
+                    showNANPopup = True
 
         if showNANPopup:
             self.showNANPopup()
 
+    def prefetchStats(self, rows):
+        '''
+        Sends the checked rows that are not cached to the worker thread in batches, so that the
+        rows populated one by one afterwards only wait for (or read) the batched results
+        @param rows: list of [index, subset label, data label, component label] checked rows
+        '''
+        tree = self.subsetTree if self.tabs.currentIndex() == 0 else self.componentTree
+        # rows are batched separately for each priority, so that visible rows are not held up
+        # by the jobs of rows further down the tree
+        pending = dict()
+        pending_subsets = dict()
+        plans = dict()
+        checked_keys = set()
+        for row in rows:
+            subset_i, data_i, comp_i = self.findIndexInDc(row[1], row[2], row[3])
+            cache_key = self.cacheKey(subset_i, data_i, comp_i)
+            checked_keys.add(cache_key)
+            priority = self.rowPriority(tree, row[0])
+            if cache_key in self.pending_stats:
+                self.raisePriority(cache_key, priority)
+                continue
+            plan = self.missingPlan(subset_i, data_i, comp_i)
+            if plan is None:
+                continue
+            # rows missing the same statistics are batched together
+            plans[plan.names] = plan
+            if subset_i == -1:
+                if comp_i not in pending.setdefault((priority, data_i, plan.names), []):
+                    pending[(priority, data_i, plan.names)].append(comp_i)
+            elif subset_i not in pending_subsets.setdefault((priority, data_i, comp_i, plan.names), []):
+                pending_subsets[(priority, data_i, comp_i, plan.names)].append(subset_i)
+
+        # the checked rows of both tabs stay in the cache whatever the budget
+        self.pinned_keys[self.tabs.currentIndex()] = checked_keys
+        self.cache_stash.set_pinned(self.pinned_keys[0] | self.pinned_keys[1])
+
+        for (priority, data_i, names), comp_indices in sorted(pending.items()):
+            self.scheduleDatasetStats(data_i, comp_indices, priority, plans[names])
+        for (priority, data_i, comp_i, names), subset_indices in sorted(pending_subsets.items()):
+            self.scheduleSubsetStats(subset_indices, data_i, comp_i, priority, plans[names])
+
+    def rowPriority(self, tree, index):
+        '''
+        Returns the priority of the jobs of a row: rows visible in the viewport first, then the
+        rows of the item checked most recently, then the others
+        @param tree: subsetTree or componentTree
+        @param index: QModelIndex of the row
+        '''
+        item = tree.itemFromIndex(index)
+        if item is None:
+            return ROW_PRIORITY_OTHER
+        # the rectangle of rows under collapsed items is empty
+        if tree.isVisible() and tree.visualItemRect(item).intersects(tree.viewport().rect()):
+            return ROW_PRIORITY_VISIBLE
+        parent = item
+        while parent is not None:
+            if parent is self.recentItem:
+                return ROW_PRIORITY_RECENT
+            parent = parent.parent()
+        return ROW_PRIORITY_OTHER
+
+    def raisePriority(self, cache_key, priority):
+        '''
+        Moves the queued jobs of a pending row forward if the row now has a higher priority,
+        e.g. because it was scrolled into view
+        @param cache_key: key of the pending row
+        @param priority: priority of the row, see rowPriority
+        '''
+        pending = self.pending_stats[cache_key]
+        if priority >= pending.get('priority', ROW_PRIORITY_OTHER):
+            return
+        pending['priority'] = priority
+        for job_id in pending.get('jobs', ()):
+            self.compute_service.reprioritize(job_id, priority)
+
+    def cancelStaleStats(self):
+        '''
+        Cancels the jobs of pending rows that are no longer needed: rows that were unchecked,
+        rows whose subset, dataset or component was deleted and rows superseded by an edit
+        (their cache key changed). Jobs shared with rows that are still needed keep running.
+        '''
+        cancelled_jobs = set()
+        for cache_key, pending in list(self.pending_stats.items()):
+            group, data, cid = pending['row']
+            indices = self.rowIndices(group, data, cid)
+            live = indices is not None and self.cacheKey(*indices) == cache_key
+            rows = []
+            for tree, index in pending['rows']:
+                if not index.isValid():
+                    continue
+                item = tree.itemFromIndex(QModelIndex(index))
+                if live and item.checkState(0):
+                    rows.append((tree, index))
+                elif any(item.data(col, 0) == "Computing\u2026" or isinstance(item.data(col, 0), Estimate)
+                         for col in range(1, 1 + len(self.statistic_names))):
+                    for col in range(1, 1 + len(self.statistic_names)):
+                        item.setData(col, 0, None)
+                        item.setData(col, Qt.ToolTipRole, None)
+            pending['rows'] = rows
+            if not rows:
+                self.pending_stats.pop(cache_key)
+                cancelled_jobs.update(pending.get('jobs', ()))
+
+        needed = set()
+        for pending in self.pending_stats.values():
+            needed.update(pending.get('jobs', ()))
+        for job_id in cancelled_jobs - needed:
+            self.compute_service.cancel(job_id)
+            self.job_costs.pop(job_id, None)
+
+    def showProgress(self, done, total, eta):
+        '''
+        Shows how many jobs are done and the estimated time left in the status bar
+        @param done: number of jobs done since the queue was last empty
+        @param total: number of jobs submitted since the queue was last empty
+        @param eta: estimated seconds left, NaN until a job has finished
+        '''
+        if total == 0 or done >= total:
+            self.statusBar().clearMessage()
+            return
+        message = "Computing statistics: %d of %d jobs done" % (done, total)
+        if not np.isnan(eta):
+            message += ", about %d s left" % max(1, round(eta))
+        self.statusBar().showMessage(message)
+
     def findIndexInDc(self, subsetName, dataName, compName):
         '''
         Finds the index of the subset, data, and component in the data collection that corresponds to the item in the viewer.
@@ -2775,7 +3240,9 @@ class StatsDataViewer(DataViewer):
         # if the open tab is subset view
         if self.tabs.currentIndex() == 0:
             # data
-            exportHeading = ['Subset', 'Dataset', 'Component'] + self.headings[1:]
+            # hidden statistics are not exported
+            columns = [t for t in range(0, len(self.headings)) if not self.subsetTree.isColumnHidden(t)]
+            exportHeading = ['Subset', 'Dataset', 'Component'] + [self.headings[t] for t in columns[1:]]
             currentCalculated.append(exportHeading)
             st = self.subsetTree.invisibleRootItem().child(0)
             for x in range(0, st.childCount()):
@@ -2787,7 +3254,7 @@ class StatsDataViewer(DataViewer):
                         temp = []
                         temp.append('All data')  # no subset
                         temp.append(st.child(x).data(0, 0))  # dataset
-                        for t in range(0, len(self.headings)):
+                        for t in columns:
                             temp.append(self.subsetTree.itemFromIndex(item).data(t, 0))
                         currentCalculated.append(temp)
             # subset
@@ -2806,12 +3273,13 @@ class StatsDataViewer(DataViewer):
                             index2 = tempStr.index(")")
                             dataset_name = tempStr[index1:index2]
                             temp.append(dataset_name)  # dataset name
-                            for t in range(0, len(self.headings)):
+                            for t in columns:
                                 temp.append(self.subsetTree.itemFromIndex(item).data(t, 0))
                             currentCalculated.append(temp)
         # if component view is open
         elif self.tabs.currentIndex() == 1:
-            exportHeading = ['Dataset', 'Component', 'Subset'] + self.headings[1:]
+            columns = [t for t in range(0, len(self.headings)) if not self.componentTree.isColumnHidden(t)]
+            exportHeading = ['Dataset', 'Component', 'Subset'] + [self.headings[t] for t in columns[1:]]
             currentCalculated.append(exportHeading)
             ct = self.componentTree.invisibleRootItem()
             for x in range(0, ct.childCount()):
@@ -2824,7 +3292,7 @@ class StatsDataViewer(DataViewer):
                             temp = []
                             temp.append(ct.child(x).data(0, 0))  # dataset
                             temp.append(ct.child(x).child(y).data(0, 0))  # component
-                            for t in range(0, len(self.headings)):
+                            for t in columns:
                                 if t == 0 and (not self.componentTree.itemFromIndex(item).data(0, 0) == "All data (" + ct.child(x).data(0, 0) + ")"):
                                     temp.append(self.componentTree.itemFromIndex(item).data(t, 0) + " (" + ct.child(x).data(0, 0) + ")")
                                 else:
@@ -2837,7 +3305,7 @@ class StatsDataViewer(DataViewer):
         '''
         Checks if there is a calculated item in the given dataItem
         '''
-        for x in range(3, len(self.headings)):
+        for x in range(1, len(self.headings)):
             if dataItem.data(x, 0) is not None:
                 print("ITEM", dataItem.data(x, 0))
                 return True
@@ -2847,8 +3315,9 @@ class StatsDataViewer(DataViewer):
         '''
         Exports the current calculated values of the tab that is open
         '''
-        # get all values calculated in the open viewer
+        # get all values calculated in the open viewer, formatted as they are shown
         df = self.getCurrentCalculated()
+        df = [[self.formatValue(value) for value in row] for row in df]
         # print(df)
         file_name, fltr = compat.getsavefilename(caption="Choose an output filename")
         try:
@@ -2863,49 +3332,9 @@ class StatsDataViewer(DataViewer):
         Converts from scientific to decimal and vice versa
         '''
         self.isSci = bool
-        # left or right justify the text data so the decimal point lines up for easy reading
-        if bool:
-            self.leftOrRightJustifyViewers(Qt.AlignLeft)
-            # print("left")
-        else:
-            # print("right")
-            self.leftOrRightJustifyViewers(Qt.AlignRight)
-
-        # recalculate with new notation,
-        # data is cached already so it should be quick
-        self.pressedEventCalculate()
-
-    def leftOrRightJustifyViewers(self, justification):
-
-        # subset view
-        #    - dataset
-        dataset_count = self.subsetTree.invisibleRootItem().child(0).childCount()
-        data = self.subsetTree.invisibleRootItem().child(0)
-        for x in range(dataset_count):
-            attribute_count = data.child(x).childCount()
-            for y in range(attribute_count):
-                for col in range(1, len(self.headings)):
-                    self.subsetTree.invisibleRootItem().child(0).child(x).child(y).setTextAlignment(col, justification)
-        #    - subsets
-        # subset_count = self.subsetTree.invisibleRootItem().child(1).childCount()
-        for x in range(dataset_count):
-            attribute_count = data.child(x).childCount()
-            for y in range(attribute_count):
-                sub_attribute_count = data.child(x).child(y).childCount()
-                # Only the subset section of the tree should be able to reach here
-                for z in range(sub_attribute_count):
-                    for col in range(1, len(self.headings)):
-                        self.subsetTree.invisibleRootItem().child(0).child(x).child(y).child(z).setTextAlignment(col, justification)
-        # component view
-        dataset_count = self.componentTree.invisibleRootItem().childCount()
-        data = self.componentTree.invisibleRootItem()
-        for x in range(dataset_count):
-            attribute_count = data.child(x).childCount()
-            for y in range(attribute_count):
-                sub_attribute_count = data.child(x).child(y).childCount()
-                for z in range(sub_attribute_count):
-                    for col in range(1, len(self.headings)):
-                        self.componentTree.invisibleRootItem().child(x).child(y).child(z).setTextAlignment(col, justification)
+        # values are formatted when painted, so this is only a repaint. StatsItemDelegate also
+        # left or right justifies the values so the decimal point lines up for easy reading
+        self.repaintViewers()
 
     def runDataStats(self, data_i, comp_i):
         '''
@@ -2921,12 +3350,8 @@ class StatsDataViewer(DataViewer):
         # print("hihihi")
         # print(data_label)
         # print(comp_label)
-        # Build the cache key
-        cache_key = subset_label + data_label + comp_label
-
-        if cache_key in self.cache_stash:
-            column_data = self.cache_stash[cache_key]
-        else:
+        column_data = self.cachedStats(-1, data_i, comp_i)
+        if column_data is None:
             column_data = self.newDataStats(data_i, comp_i)
         # print(cache_key)
         # See if the values have already been cached
@@ -2942,33 +3367,11 @@ class StatsDataViewer(DataViewer):
         # column_df = pd.DataFrame(column_data, columns=self.headings)
         # self.data_accurate = self.data_accurate.append(column_df, ignore_index=True)
 
-        if self.isSci:
-            # Format in scientific notation
-            string = "%." + str(self.num_sigs) + 'E'
-        else:
-            # Format in standard notation
-            string = "%." + str(self.num_sigs) + 'F'
-
-        # print("xxyyzz")
-        # print(string)
-
-        # if the values of the stats are not NAN
-        if not column_data[3] == "NaN":
-            mean_val = string % column_data[3]
-            # print(mean_val)
-            # print("mean_val ^^")
-            median_val = string % column_data[4]
-            min_val = string % column_data[5]
-            max_val = string % column_data[6]
-            sum_val = string % column_data[7]
-
-            # Create the column data array and append it to the data frame
-            column_data = (subset_label, data_label, comp_label, mean_val, median_val, min_val, max_val, sum_val)
-            # column_df = pd.DataFrame(column_data, columns=self.headings)
-            # # self.data_frame = self.data_frame.append(column_df, ignore_index=True)
-            return column_data
+        # The raw values go in the tree, StatsItemDelegate formats them when they are painted
+        if not column_data[3:4] == ("NaN",):
+            return (subset_label, data_label, comp_label) + tuple(self.itemValue(value) for value in column_data[3:])
         else:
-            return (subset_label, data_label, comp_label, "NaN", "NaN", "NaN", "NaN", "NaN")
+            return (subset_label, data_label, comp_label) + ("NaN",) * len(self.plan)
 
     def newDataStats(self, data_i, comp_i):
         '''
@@ -2983,29 +3386,65 @@ class StatsDataViewer(DataViewer):
         data_label = self.xc[data_i].label
         comp_label = self.xc[data_i].components[comp_i].label  # add to the name array to build the table
 
-        # Build the cache key
-        cache_key = subset_label + data_label + comp_label
-
         # NOTE: This section is only necessary because glue's compute_statistics method will return numerical values for categorical variables instead of NaN.
         # This if statement can be removed when this bug is fixed.
         if self.xc[data_i].get_component(self.xc[data_i].components[comp_i]).categorical:
             # print("Detected categorical")
-            return (subset_label, data_label, comp_label, "NaN", "NaN", "NaN", "NaN", "NaN")
+            return (subset_label, data_label, comp_label) + ("NaN",) * len(self.plan)
 
-        # Find the stat values
+        # Find the stat values in a single pass over the component
         # Save the data in the cache
-        mean_val = self.xc[data_i].compute_statistic('mean', self.xc[data_i].components[comp_i])
-        median_val = self.xc[data_i].compute_statistic('median', self.xc[data_i].components[comp_i])
-        min_val = self.xc[data_i].compute_statistic('minimum', self.xc[data_i].components[comp_i])
-        max_val = self.xc[data_i].compute_statistic('maximum', self.xc[data_i].components[comp_i])
-        sum_val = self.xc[data_i].compute_statistic('sum', self.xc[data_i].components[comp_i])
-
-        column_data = (subset_label, data_label, comp_label, mean_val, median_val, min_val, max_val, sum_val)
+        column_data = (subset_label, data_label, comp_label) + tuple(self.fusedStatistics(data_i, comp_i))
 
-        self.cache_stash[cache_key] = column_data
+        self.storeStats(-1, data_i, comp_i, column_data)
 
         return column_data
 
+    def scheduleDatasetStats(self, data_i, comp_indices, priority=ROW_PRIORITY_OTHER, plan=None):
+        '''
+        Sends the components comp_indices of data set data_i to the worker thread. The float
+        components are stacked and reduced together, so a whole dataset costs a handful of NumPy
+        calls instead of one pass per component. Categorical and non-numeric components are
+        left to newDataStats.
+        @param data_i: data index from the tree
+        @param comp_indices: component indices from the tree
+        @param priority: priority of the jobs, see rowPriority
+        @param plan: StatisticPlan of the statistics to calculate, the current one by default
+        '''
+        if plan is None:
+            plan = self.plan
+        data = self.xc[data_i]
+        columns = []
+        for comp_i in comp_indices:
+            cid = data.components[comp_i]
+            # Categorical components are skipped up front, see newDataStats
+            if data.get_component(cid).categorical:
+                continue
+            cache_key = self.cacheKey(-1, data_i, comp_i)
+            if cache_key in self.pending_stats:
+                continue
+            pending = dict(row=(None, data, cid), rows=[], priority=priority, plan=plan)
+            # components larger than memory are never loaded, they are read chunk by chunk
+            raw = self.outOfCoreValues(data, cid)
+            if raw is not None:
+                self.scheduleOutOfCoreStats(cache_key, pending, raw, None, priority)
+                continue
+            values = data.get_data(cid)
+            if not is_numeric(values):
+                continue
+            if self.isSplitRow(values):
+                self.scheduleSplitStats(cache_key, pending, values, None, priority)
+                continue
+            self.pending_stats[cache_key] = pending
+            columns.append((cache_key, values))
+
+        # one job per worker, each stacking its share of the components
+        for chunk in split_jobs(columns, self.compute_service.max_workers):
+            job_id = self.compute_service.submit(dataset_job, chunk, plan.quantiles, priority=priority)
+            self.job_costs[job_id] = ('memory', sum(values.nbytes for cache_key, values in chunk))
+            for cache_key, values in chunk:
+                self.pending_stats[cache_key]['jobs'] = [job_id]
+
     def runSubsetStats(self, subset_i, data_i, comp_i):
         '''
         Runs statistics for the subset subset_i with respect to the component comp_i of data set data_i
@@ -3018,38 +3457,17 @@ class StatsDataViewer(DataViewer):
         data_label = self.xc[data_i].label
         comp_label = self.xc[data_i].components[comp_i].label  # add to the name array to build the table
 
-        # Build the cache key
-        cache_key = subset_label + data_label + comp_label
-
         # See if the statistics are already in the cache if nothing needs to be updated
 
-        if cache_key in self.cache_stash:
-            column_data = self.cache_stash[cache_key]
-        else:
+        column_data = self.cachedStats(subset_i, data_i, comp_i)
+        if column_data is None:
             column_data = self.newSubsetStats(subset_i, data_i, comp_i)
 
-        if self.isSci:
-            # Format in scientific notation
-            string = "%." + str(self.num_sigs) + 'E'
+        # The raw values go in the tree, StatsItemDelegate formats them when they are painted
+        if not column_data[3:4] == ("NaN",):
+            return (subset_label, data_label, comp_label) + tuple(self.itemValue(value) for value in column_data[3:])
         else:
-            # Format in standard notation
-            string = "%." + str(self.num_sigs) + 'F'
-
-        # if the values of the stats are not NAN
-        if not column_data[3] == "NaN":
-            mean_val = string % column_data[3]
-            # print(mean_val)
-            # print("mean_val ^")
-            median_val = string % column_data[4]
-            min_val = string % column_data[5]
-            max_val = string % column_data[6]
-            sum_val = string % column_data[7]
-
-            # Create the column data array and append it to the data frame
-            column_data = (subset_label, data_label, comp_label, mean_val, median_val, min_val, max_val, sum_val)
-            return column_data
-        else:
-            return (subset_label, data_label, comp_label, "NaN", "NaN", "NaN", "NaN", "NaN")
+            return (subset_label, data_label, comp_label) + ("NaN",) * len(self.plan)
 
     def newSubsetStats(self, subset_i, data_i, comp_i):
 
@@ -3064,44 +3482,824 @@ class StatsDataViewer(DataViewer):
         data_label = self.xc[data_i].label
         comp_label = self.xc[data_i].components[comp_i].label  # add to the name array to build the table
 
-        # Build the cache key
-        cache_key = subset_label + data_label + comp_label
-
         # NOTE: This section is only necessary because glue's compute_statistics method will return numerical values for categorical variables instead of NaN.
         # This if statement can be removed when this bug is fixed.
         if self.xc[data_i].get_component(self.xc[data_i].components[comp_i]).categorical:
-            return (subset_label, data_label, comp_label, "NaN", "NaN", "NaN", "NaN", "NaN")
-
-        mean_val = self.xc[data_i].compute_statistic(
-            'mean',
-            self.xc[data_i].subsets[subset_i].components[comp_i],
-            subset_state=self.xc[data_i].subsets[subset_i].subset_state)
-        median_val = self.xc[data_i].compute_statistic(
-            'median',
-            self.xc[data_i].subsets[subset_i].components[comp_i],
-            subset_state=self.xc.subset_groups[subset_i].subset_state)
-        min_val = self.xc[data_i].compute_statistic(
-            'minimum',
-            self.xc[data_i].subsets[subset_i].components[comp_i],
-            subset_state=self.xc.subset_groups[subset_i].subset_state)
-        max_val = self.xc[data_i].compute_statistic(
-            'maximum',
-            self.xc[data_i].subsets[subset_i].components[comp_i],
-            subset_state=self.xc.subset_groups[subset_i].subset_state)
-        sum_val = self.xc[data_i].compute_statistic(
-            'sum',
-            self.xc[data_i].subsets[subset_i].components[comp_i],
-            subset_state=self.xc.subset_groups[subset_i].subset_state)
-
-        column_data = (subset_label, data_label, comp_label, mean_val, median_val, min_val, max_val, sum_val)
-
-        self.cache_stash[cache_key] = column_data
+            return (subset_label, data_label, comp_label) + ("NaN",) * len(self.plan)
+
+        column_data = (subset_label, data_label, comp_label) + tuple(self.subsetStatistics(subset_i, data_i, comp_i))
+
+        self.storeStats(subset_i, data_i, comp_i, column_data)
 
         return column_data
 
+    def scheduleSubsetStats(self, subset_indices, data_i, comp_i, priority=ROW_PRIORITY_OTHER, plan=None):
+        '''
+        Sends several subsets of the component comp_i of data set data_i to the worker thread,
+        where they are reduced in one pass over the component instead of one scan per
+        (subset, component) pair. Rows computed before for an earlier definition of the same
+        subset are updated incrementally from their accumulators.
+        @param subset_indices: subset indices from the tree
+        @param data_i: data index from the tree
+        @param comp_i: component index from the tree
+        @param priority: priority of the jobs, see rowPriority
+        @param plan: StatisticPlan of the statistics to calculate, the current one by default
+        '''
+        if plan is None:
+            plan = self.plan
+        data = self.xc[data_i]
+        cid = data.components[comp_i]
+        # categorical components are NaN anyway
+        if data.get_component(cid).categorical:
+            return
+        raw = self.outOfCoreValues(data, cid)
+        if raw is not None:
+            for subset_i in subset_indices:
+                group = self.xc.subset_groups[subset_i]
+                cache_key = self.cacheKey(subset_i, data_i, comp_i)
+                if cache_key in self.pending_stats:
+                    continue
+                try:
+                    mask = self.mask_cache.get_mask(group.subset_state, data)
+                except Exception:
+                    continue
+                self.scheduleOutOfCoreStats(cache_key, dict(row=(group, data, cid), rows=[], priority=priority,
+                                                            plan=plan), raw, mask, priority)
+            return
+        values = data.get_data(cid)
+        if not is_numeric(values):
+            return
+
+        subsets = []
+        for subset_i in subset_indices:
+            group = self.xc.subset_groups[subset_i]
+            cache_key = self.cacheKey(subset_i, data_i, comp_i)
+            if cache_key in self.pending_stats:
+                continue
+            try:
+                mask = self.mask_cache.get_mask(group.subset_state, data)
+            except Exception:
+                # the subset does not apply to this dataset, leave it to newSubsetStats
+                continue
+            row_key = self.rowKey(subset_i, data_i, comp_i)
+            previous = self.subset_aggregates.get(row_key)
+            if previous is not None and previous[0] is group and previous[1] is data:
+                previous = (previous[3], previous[2])
+            else:
+                previous = None
+            pending = dict(row=(group, data, cid), rows=[], mask=mask, row_key=row_key, priority=priority,
+                           plan=plan)
+            if previous is None and self.isSplitRow(values):
+                self.scheduleSplitStats(cache_key, pending, values, mask, priority)
+                continue
+            self.pending_stats[cache_key] = pending
+            subsets.append((cache_key, mask, previous))
+
+        if subsets:
+            job_id = self.compute_service.submit(subset_job, values, subsets, plan.quantiles, priority=priority)
+            self.job_costs[job_id] = ('memory', values.nbytes * len(subsets))
+            for cache_key, mask, previous in subsets:
+                self.pending_stats[cache_key]['jobs'] = [job_id]
+
+    def outOfCoreValues(self, data, cid):
+        '''
+        Returns the raw values of a component if they should be read chunk by chunk instead of
+        being loaded in memory, or None. These are dask arrays (when dask is installed) and
+        file-backed arrays larger than one streamed block: memory-mapped FITS HDUs and arrays,
+        and HDF5 datasets.
+        @param data: glue Data the component belongs to
+        @param cid: ComponentID of the component
+        '''
+        component = data.get_component(cid)
+        # derived and coordinate components are computed in memory when they are accessed
+        if component.categorical or isinstance(component, (DerivedComponent, CoordinateComponent)):
+            return None
+        raw = component.data
+        if np.dtype(raw.dtype).kind not in NUMERIC_KINDS:
+            return None
+        if is_dask_array(raw):
+            return raw
+        if is_file_backed(raw) and raw.size * np.dtype(raw.dtype).itemsize > self.stream_chunk_bytes:
+            return raw
+        return None
+
+    def outOfCoreStatistics(self, raw, mask):
+        '''
+        Computes the statistics of an out-of-core component: dask arrays with dask reductions
+        (see dask_statistics), file-backed arrays by streaming them through the fused reducer
+        with exact order statistics (see streaming_statistics)
+        @param raw: out-of-core values returned by outOfCoreValues
+        @param mask: boolean subset mask, or None for all data
+        '''
+        if is_dask_array(raw):
+            return dask_statistics(raw, mask, self.plan, self.dask_scheduler)
+        return streaming_statistics(raw, mask, self.plan, self.stream_chunk_bytes)
+
+    def scheduleOutOfCoreStats(self, cache_key, pending, raw, mask, priority=ROW_PRIORITY_OTHER):
+        '''
+        Computes the statistics of a row over an out-of-core component on a worker thread, see
+        outOfCoreStatistics. Dask spreads the reads over its own scheduler, streamed files are
+        read sequentially in their storage order.
+        @param cache_key: key of the row
+        @param pending: pending_stats entry of the row
+        @param raw: out-of-core values returned by outOfCoreValues
+        @param mask: boolean subset mask, or None for all data
+        @param priority: priority of the job, see rowPriority
+        '''
+        pending['estimate'] = self.sampleEstimate(raw, mask)
+        self.pending_stats[cache_key] = pending
+        if is_dask_array(raw):
+            job_id = self.compute_service.submit_local(dask_job, cache_key, raw, mask, pending['plan'].quantiles,
+                                                       self.dask_scheduler, priority=priority)
+        else:
+            job_id = self.compute_service.submit_local(stream_job, cache_key, raw, mask, pending['plan'].quantiles,
+                                                       self.stream_chunk_bytes, priority=priority)
+        pending['jobs'] = [job_id]
+        self.job_costs[job_id] = ('dask' if is_dask_array(raw) else 'stream', raw.size * np.dtype(raw.dtype).itemsize)
+
+    def isSplitRow(self, values):
+        '''
+        Returns True if a row over values is large enough to be split between the workers, or
+        to be refined chunk by chunk from its first estimate
+        @param values: component values of the row
+        '''
+        if self.progressive and values.size >= self.progressive_elements:
+            return True
+        return values.size >= self.split_row_elements and self.compute_service.max_workers > 1
+
+    def sampleEstimate(self, values, mask):
+        '''
+        Returns the ProgressiveEstimate of a large row, drawn from a random sample of its
+        values, or None if the row is small, estimates are turned off or the values cannot be
+        sampled. Only the sampled elements are read, so the first estimate takes about the
+        same time whatever the size of the component. This runs on the GUI thread, so values
+        backed by a file are sampled from a few contiguous blocks rather than from scattered
+        elements that would each be a read.
+        @param values: numeric component values, in memory or file-backed
+        @param mask: boolean subset mask, or None for all data
+        '''
+        if not self.progressive or values.size < self.progressive_elements:
+            return None
+        # sampling a dask array would compute every chunk
+        if is_dask_array(values):
+            return None
+        try:
+            if is_file_backed(values):
+                return draw_blocks(values, mask, self.progressive_sample_size, self.progressive_sample_blocks)
+            return draw_sample(values, mask, self.progressive_sample_size)
+        except (TypeError, ValueError, IndexError):
+            # e.g. h5py datasets only take sorted indices along a single axis
+            return None
+
+    def scheduleSplitStats(self, cache_key, pending, values, mask, priority=ROW_PRIORITY_OTHER):
+        '''
+        Splits a single large row into one chunk per worker. Each chunk is reduced to a mergeable
+        accumulator, so the mean, sum, minimum and maximum of the row scale with the number of
+        workers; the order statistics, if any are shown, run as a separate job alongside the
+        chunks. statsComputed merges the chunk accumulators with tree_merge once every job of the
+        row is done.
+        Rows shown progressively are split into smaller chunks, each refining the estimate of
+        the row when it is done (see sampleEstimate).
+        @param cache_key: key of the row
+        @param pending: pending_stats entry of the row
+        @param values: numeric component values
+        @param mask: boolean subset mask, or None for all data
+        @param priority: priority of the jobs, see rowPriority
+        '''
+        parts = self.compute_service.max_workers
+        estimate = self.sampleEstimate(values, mask)
+        if estimate is not None:
+            parts = max(parts, min(1024, -(-values.size // self.progressive_chunk_elements)))
+        bounds = chunk_bounds(values.size, parts)
+        quantiles = pending['plan'].quantiles
+        pending.update(parts=[], order=(), remaining=len(bounds) + bool(quantiles), jobs=[], chunks=dict(),
+                       estimate=estimate)
+        self.pending_stats[cache_key] = pending
+        if quantiles:
+            # the order job is the longest, it starts first so the chunks run alongside it
+            job_id = self.compute_service.submit(order_job, cache_key, values, mask, quantiles, priority=priority)
+            pending['jobs'].append(job_id)
+            # the order job gathers the whole row, which is what a row costs in the cost model,
+            # the chunks without it would overestimate the throughput
+            self.job_costs[job_id] = ('memory', values.nbytes)
+        for start, stop in bounds:
+            job_id = self.compute_service.submit(chunk_job, cache_key, values, mask, start, stop, priority=priority)
+            pending['jobs'].append(job_id)
+            pending['chunks'][job_id] = (start, stop)
+            if not quantiles:
+                self.job_costs[job_id] = ('memory', (stop - start) * values.itemsize)
+
+    def showStats(self, tree, index, subset_i, data_i, comp_i):
+        '''
+        Fills a row of a tree with its statistics. Rows that are not cached are computed on
+        the worker thread, they show "Computing..." (or the estimates of large rows) until
+        statsComputed fills them in.
+        Returns True if a value could not be calculated.
+        @param tree: subsetTree or componentTree
+        @param index: QModelIndex of the row
+        @param subset_i: subset index from tree, -1 for all data
+        @param data_i: data index from the tree
+        @param comp_i: component index from the tree
+        '''
+        cache_key = self.cacheKey(subset_i, data_i, comp_i)
+        if cache_key not in self.pending_stats:
+            # only the statistics the row does not have yet are calculated
+            plan = self.missingPlan(subset_i, data_i, comp_i)
+            if plan is not None:
+                priority = self.rowPriority(tree, index)
+                if subset_i == -1:
+                    self.scheduleDatasetStats(data_i, [comp_i], priority, plan)
+                else:
+                    self.scheduleSubsetStats([subset_i], data_i, comp_i, priority, plan)
+
+        if cache_key in self.pending_stats:
+            pending = self.pending_stats[cache_key]
+            pending['rows'].append((tree, QPersistentModelIndex(index)))
+            plan = pending['plan']
+            cached = self.cache_stash.get(cache_key, {})
+            names = [name for name in self.plan.names if name in cached and name not in plan.names]
+            self.fillRow(tree, index, (None, None, None) + tuple(self.itemValue(cached[name]) for name in names), names)
+            if pending.get('estimate') is not None:
+                self.fillEstimate(tree, index, pending['estimate'].statistics(plan), plan.names)
+            else:
+                for name in plan.names:
+                    tree.itemFromIndex(index).setData(self.statisticColumn(name), 0, "Computing\u2026")
+            return False
+
+        # cached, categorical or handled by glue's compute_statistic
+        if subset_i == -1:
+            new_data = self.runDataStats(data_i, comp_i)
+        else:
+            new_data = self.runSubsetStats(subset_i, data_i, comp_i)
+        self.storeRow(subset_i, data_i, comp_i, new_data[3:])
+        return self.fillRow(tree, index, new_data)
+
+    def fillRow(self, tree, index, new_data, names=None):
+        '''
+        Writes the statistic values of new_data into a row, returns True if one of them could
+        not be calculated
+        @param tree: subsetTree or componentTree
+        @param index: QModelIndex of the row
+        @param new_data: (subset, data, component) + statistics tuple, in the order of names
+        @param names: names of the statistics, those of the plan by default
+        '''
+        showNANPopup = False
+        for name, value in zip(self.plan.names if names is None else names, new_data[3:]):
+            col = self.statisticColumn(name)
+            # drop the confidence interval of an estimate shown before
+            tree.itemFromIndex(index).setData(col, Qt.ToolTipRole, None)
+            if value == "NAN":
+                showNANPopup = True
+                tree.itemFromIndex(index).setData(col, 0, "Error")
+            else:
+                tree.itemFromIndex(index).setData(col, 0, value)
+        return showNANPopup
+
+    def fillEstimate(self, tree, index, stats, names):
+        '''
+        Writes the current estimates of a row that is being calculated, with their confidence
+        interval as tool tip. Statistics that cannot be estimated yet show "Computing...".
+        @param tree: subsetTree or componentTree
+        @param index: QModelIndex of the row
+        @param stats: values returned by ProgressiveEstimate.statistics
+        @param names: names of the statistics, those of the plan of the pending row
+        '''
+        item = tree.itemFromIndex(index)
+        for name, value in zip(names, stats):
+            col = self.statisticColumn(name)
+            if value is None:
+                item.setData(col, 0, "Computing\u2026")
+                item.setData(col, Qt.ToolTipRole, None)
+                continue
+            item.setData(col, 0, value)
+            if isinstance(value, Estimate):
+                tip = "Estimated from a random sample"
+                if value.low is not None and value.high is not None:
+                    tip += ", 95%% confidence interval [%s, %s]" % (self.formatValue(value.low),
+                                                                   self.formatValue(value.high))
+                elif value.high is not None:
+                    tip += ", at most %s" % self.formatValue(value.high)
+                elif value.low is not None:
+                    tip += ", at least %s" % self.formatValue(value.low)
+                item.setData(col, Qt.ToolTipRole, tip)
+            else:
+                item.setData(col, Qt.ToolTipRole, None)
+
+    def statsComputed(self, job_id, results):
+        '''
+        Receives the results of a worker job on the GUI thread: stores them in the caches and
+        fills in the rows that were waiting for them
+        @param job_id: id of the job
+        @param results: list of (key, PartialAggregate, values at the quantiles) returned by
+                        dataset_job, subset_job, chunk_job, order_job, stream_job or dask_job
+        '''
+        if job_id in self.column_jobs:
+            self.columnsComputed(job_id, results)
+            return
+        for result in results:
+            cache_key = result[0]
+            pending = self.pending_stats.get(cache_key)
+            if pending is None:
+                continue
+            if 'parts' in pending:
+                # one chunk or the order statistics of a split row, see scheduleSplitStats
+                if result[1] is not None:
+                    pending['parts'].append(result[1])
+                else:
+                    pending['order'] = result[2]
+                pending['remaining'] -= 1
+                if pending['remaining']:
+                    estimate = pending.get('estimate')
+                    if estimate is not None and result[1] is not None:
+                        # refine the estimates shown with the chunk that is done
+                        estimate.add_chunk(*(pending['chunks'][job_id] + (result[1],)))
+                        self.showEstimate(pending)
+                    continue
+                result = (cache_key, tree_merge(pending['parts']), pending['order'])
+            self.pending_stats.pop(cache_key)
+            group, data, cid = pending['row']
+            indices = self.rowIndices(group, data, cid)
+
+            aggregate, order = result[1], result[2]
+            plan = pending['plan']
+            stats = plan.finish(aggregate, order)
+            if group is not None and indices is not None and 'row_key' in pending:
+                self.subset_aggregates[pending['row_key']] = (group, data, pending['mask'], aggregate)
+
+            if indices is None or self.cacheKey(*indices) != cache_key:
+                # the row was edited or removed meanwhile, the values still belong to the key
+                self.cacheStats(cache_key, plan.names, stats)
+                continue
+            self.storeStats(*(indices + (self.rowLabels(*indices) + stats,)), plan=plan)
+
+            rows = [(tree, QModelIndex(index)) for tree, index in pending['rows'] if index.isValid()]
+            for tree, index in rows:
+                self.fillRow(tree, index, (None, None, None) + tuple(self.itemValue(value) for value in stats), plan.names)
+            if rows and self.missingPlan(*indices) is not None:
+                # columns shown while the row was being calculated
+                for tree, index in rows:
+                    self.showStats(tree, index, *indices)
+
+    def showEstimate(self, pending):
+        '''
+        Shows the current estimates of a pending row in the rows waiting for it
+        @param pending: pending_stats entry of the row
+        '''
+        stats = pending['estimate'].statistics(pending['plan'])
+        for tree, index in pending['rows']:
+            if index.isValid():
+                self.fillEstimate(tree, QModelIndex(index), stats, pending['plan'].names)
+
+    def statsFailed(self, job_id, error):
+        '''
+        Marks the rows of a failed worker job as errors
+        @param job_id: id of the job
+        @param error: exception raised by the job
+        '''
+        self.column_jobs.discard(job_id)
+        self.job_costs.pop(job_id, None)
+        for cache_key in list(self.pending_stats):
+            pending = self.pending_stats[cache_key]
+            if job_id not in pending.get('jobs', ()):
+                continue
+            self.pending_stats.pop(cache_key)
+            for tree, index in pending['rows']:
+                if index.isValid():
+                    for name in pending['plan'].names:
+                        col = self.statisticColumn(name)
+                        tree.itemFromIndex(QModelIndex(index)).setData(col, 0, "Error")
+                        tree.itemFromIndex(QModelIndex(index)).setData(col, Qt.ToolTipRole, None)
+
+    def rowIndices(self, group, data, cid):
+        '''
+        Returns the current (subset_i, data_i, comp_i) indices of a row, or None if the subset,
+        dataset or component was removed
+        @param group: subset group of the row, or None for all data
+        @param data: dataset of the row
+        @param cid: component ID of the row
+        '''
+        data_i = next((i for i, d in enumerate(self.xc) if d is data), None)
+        comp_i = next((i for i, c in enumerate(data.components) if c is cid), None)
+        if data_i is None or comp_i is None:
+            return None
+        if group is None:
+            return (-1, data_i, comp_i)
+        subset_i = next((i for i, g in enumerate(self.xc.subset_groups) if g is group), None)
+        if subset_i is None:
+            return None
+        return (subset_i, data_i, comp_i)
+
+    def rowLabels(self, subset_i, data_i, comp_i):
+        '''
+        Returns the (subset, dataset, component) labels of a row
+        @param subset_i: subset index from tree, -1 for all data
+        @param data_i: data index from the tree
+        @param comp_i: component index from the tree
+        '''
+        data = self.xc[data_i]
+        subset_label = "All data" if subset_i == -1 else data.subsets[subset_i].label
+        return (subset_label, data.label, data.components[comp_i].label)
+
+    def subsetStatistics(self, subset_i, data_i, comp_i):
+        '''
+        Computes the statistics of a subset row. If the row was computed before for an earlier
+        definition of the same subset, only the elements that entered or left the subset are
+        applied to the stored accumulators instead of rescanning the whole subset.
+        @param subset_i: subset index from tree
+        @param data_i: data index from the tree
+        @param comp_i: component index from the tree
+        '''
+        group = self.xc.subset_groups[subset_i]
+        data = self.xc[data_i]
+        values = data.get_data(data.components[comp_i])
+        if not is_numeric(values):
+            return self.fusedStatistics(data_i, comp_i, subset_state=group.subset_state)
+
+        mask = self.mask_cache.get_mask(group.subset_state, data)
+        row_key = self.rowKey(subset_i, data_i, comp_i)
+        previous = self.subset_aggregates.get(row_key)
+        if previous is not None and previous[0] is group and previous[1] is data:
+            aggregate, order = incremental_aggregate(values, previous[3], previous[2], mask, self.plan.quantiles)
+        else:
+            aggregate, order = fused_aggregate(values, mask, self.plan.quantiles)
+
+        self.subset_aggregates[row_key] = (group, data, mask, aggregate)
+        return self.plan.finish(aggregate, order)
+
+    def fusedStatistics(self, data_i, comp_i, subset_state=None):
+        '''
+        Computes the statistics shown of a component with one pass over its values (and one
+        partition for the order statistics) instead of one compute_statistic call (and one
+        full scan) per statistic
+        @param data_i: data index from the tree
+        @param comp_i: component index from the tree
+        @param subset_state: subset state restricting the values, or None for all data
+        '''
+        data = self.xc[data_i]
+        cid = data.components[comp_i]
+        raw = self.outOfCoreValues(data, cid)
+        if raw is not None:
+            mask = None if subset_state is None else self.mask_cache.get_mask(subset_state, data)
+            return self.outOfCoreStatistics(raw, mask)
+        values = data.get_data(cid)
+
+        # Non-numeric dtypes (e.g. datetimes) keep using glue's own statistics, where it has them
+        if not is_numeric(values):
+            return tuple(np.nan if statistic.glue_name is None else
+                         data.compute_statistic(statistic.glue_name, cid, subset_state=subset_state)
+                         for statistic in self.plan.statistics)
+
+        mask = None if subset_state is None else self.mask_cache.get_mask(subset_state, data)
+        return fused_statistics(values, mask, self.plan)
+
+    def cacheKey(self, subset_i, data_i, comp_i):
+        '''
+        Builds the cache key of a row from what its statistics depend on rather than from labels:
+        the structural fingerprint of the subset state (or "All data"), the uuids of the dataset
+        and component and their version counters. Renaming keeps the key, identically defined
+        subsets share it and changing the values of the component bumps it.
+        @param subset_i: subset index from tree, -1 for all data
+        @param data_i: data index from the tree
+        @param comp_i: component index from the tree
+        '''
+        data = self.xc[data_i]
+        cid = data.components[comp_i]
+        if subset_i == -1:
+            return ("All data", data.uuid, cid.uuid, self.data_versions.get(cid.uuid, 0))
+        # the subset mask may depend on any component of the dataset, not only on cid
+        return (self.subsetFingerprint(data.subsets[subset_i].subset_state), data.uuid, cid.uuid,
+                self.data_versions.get(cid.uuid, 0), self.data_versions.get(data.uuid, 0))
+
+    def cachedStats(self, subset_i, data_i, comp_i):
+        '''
+        Returns the cached (subset, data, component) + statistics tuple of a row, with the
+        statistics in the order of the plan, looking in memory first and then in the disk
+        cache, or None if one of them has to be calculated
+        @param subset_i: subset index from tree, -1 for all data
+        @param data_i: data index from the tree
+        @param comp_i: component index from the tree
+        '''
+        if self.missingPlan(subset_i, data_i, comp_i) is not None:
+            return None
+        data = self.xc[data_i]
+        cid = data.components[comp_i]
+        labels = ("All data" if subset_i == -1 else data.subsets[subset_i].label, data.label, cid.label)
+        cached = self.cache_stash.get(self.cacheKey(subset_i, data_i, comp_i), {})
+        if any(name not in cached for name in self.plan.names):
+            return None
+        return labels + tuple(cached[name] for name in self.plan.names)
+
+    def missingPlan(self, subset_i, data_i, comp_i):
+        '''
+        Returns a StatisticPlan of the statistics of the plan a row does not have yet, looking
+        in memory first and then in the disk cache, or None if it has all of them. Only these
+        are calculated, e.g. when a hidden column is shown again.
+        @param subset_i: subset index from tree, -1 for all data
+        @param data_i: data index from the tree
+        @param comp_i: component index from the tree
+        '''
+        cache_key = self.cacheKey(subset_i, data_i, comp_i)
+        cached = self.cache_stash.get(cache_key, {})
+        missing = [statistic for statistic in self.plan.statistics if statistic.name not in cached]
+        if not missing:
+            return None
+        data = self.xc[data_i]
+        if self.disk_cache is not None and not data.get_component(data.components[comp_i]).categorical:
+            names = [statistic.name for statistic in missing]
+            disk_key = self.diskCacheKey(subset_i, data_i, comp_i)
+            stats = None if disk_key is None else self.disk_cache.get(disk_key, names)
+            if stats is not None:
+                self.cacheStats(cache_key, names, stats)
+                return None
+        return StatisticPlan(missing)
+
+    def cacheStats(self, cache_key, names, stats):
+        '''
+        Adds statistics of a row to the memory cache, which holds a dict statistic name ->
+        value per row so that rows computed for other statistics are completed, not replaced.
+        Returns the dict of the row.
+        @param cache_key: key of the row, see cacheKey
+        @param names: names of the statistics
+        @param stats: values in the order of names
+        '''
+        cached = dict(self.cache_stash.get(cache_key, {}))
+        cached.update(zip(names, stats))
+        self.cache_stash[cache_key] = cached
+        return cached
+
+    def storeStats(self, subset_i, data_i, comp_i, column_data, plan=None):
+        '''
+        Saves the statistics of a row in the memory cache and, if enabled, in the disk cache
+        @param subset_i: subset index from tree, -1 for all data
+        @param data_i: data index from the tree
+        @param comp_i: component index from the tree
+        @param column_data: (subset, data, component) + statistics tuple
+        @param plan: StatisticPlan the statistics were computed for, the current one by default
+        '''
+        names = (self.plan if plan is None else plan).names
+        self.cacheStats(self.cacheKey(subset_i, data_i, comp_i), names, column_data[3:])
+        self.storeRow(subset_i, data_i, comp_i, column_data[3:], names)
+        disk_key = None if self.disk_cache is None else self.diskCacheKey(subset_i, data_i, comp_i)
+        if disk_key is not None:
+            self.disk_cache.set(disk_key, names, column_data[3:])
+
+    def diskCacheKey(self, subset_i, data_i, comp_i):
+        '''
+        Builds the disk cache key of a row, which has to be the same in any session: the content
+        fingerprint of the component and, for subsets, the structural fingerprint of the subset
+        state in which the components of the dataset are identified by their content too.
+        Subsets using components of other (linked) datasets keep their uuid, so they are only
+        reused within the session. Returns None if the component cannot be fingerprinted without
+        reading it or the subset state holds callables that are only identified within the
+        session, the row is then not kept in the disk cache.
+        @param subset_i: subset index from tree, -1 for all data
+        @param data_i: data index from the tree
+        @param comp_i: component index from the tree
+        '''
+        data = self.xc[data_i]
+        component = self.componentFingerprint(data, data.components[comp_i])
+        if component is None:
+            return None
+        if subset_i == -1:
+            return "All data:" + component
+
+        def identify(value):
+            if isinstance(value, ComponentID) and value.parent is data:
+                return self.componentFingerprint(data, value)
+            return None
+
+        state = subset_state_fingerprint(data.subsets[subset_i].subset_state, identify=identify, shareable=True)
+        if state is None:
+            return None
+        return state + ":" + component
+
+    def componentFingerprint(self, data, cid):
+        '''
+        Returns the content fingerprint of the values of a component, hashed once per version.
+        Components read chunk by chunk are fingerprinted from their file or dask graph, or not
+        at all (None), e.g. arrays mapped from a file whose name is not known.
+        @param data: glue Data the component belongs to
+        @param cid: ComponentID of the component
+        '''
+        key = (cid.uuid, self.data_versions.get(cid.uuid, 0))
+        if key not in self.content_fingerprints:
+            raw = self.outOfCoreValues(data, cid)
+            if raw is not None:
+                # hashing the values would read the whole file on the GUI thread
+                self.content_fingerprints[key] = out_of_core_fingerprint(raw) if is_dask_array(raw) \
+                    else file_fingerprint(raw)
+            else:
+                self.content_fingerprints[key] = array_fingerprint(data.get_data(cid))
+        return self.content_fingerprints[key]
+
+    def storeRow(self, subset_i, data_i, comp_i, stats, names=None):
+        '''
+        Writes the statistics of a row into column_store, and recomputes the custom cells of
+        the row that depend on them if they changed
+        @param subset_i: subset index from tree, -1 for all data
+        @param data_i: data index from the tree
+        @param comp_i: component index from the tree
+        @param stats: values in the order of names
+        @param names: names of the statistics, those of the plan by default
+        '''
+        key = self.storeKey(subset_i, data_i, comp_i)
+        names = list(self.plan.names if names is None else names)
+        old = np.array([self.column_store.get(key, name) for name in names])
+        self.column_store.set_row(key, names, stats)
+        new = np.array([self.column_store.get(key, name) for name in names])
+        if not np.array_equal(old, new, equal_nan=True):
+            self.recomputeColumns([key], self.column_graph.dependents(names))
+
+    def invalidateRows(self, keys):
+        '''
+        Called when the values a set of rows are calculated from changed (subset edited or
+        new data values). Their statistics are cleared with the custom cells depending on
+        them, which are recomputed once the new statistics are stored (see storeRow); custom
+        cells that only depend on the component values are recomputed right away.
+        @param keys: store keys of the rows, see storeKey
+        '''
+        if not keys:
+            return
+        names = list(self.statistic_names)
+        stale = self.column_graph.dependents(names)
+        self.column_store.clear(keys, names + stale)
+        self.setColumnCells(dict((key, dict((name, None) for name in stale)) for key in keys))
+        self.recomputeColumns(keys, [name for name in self.column_graph.dependents([COMPONENT]) if name not in stale])
+
+    def recomputeColumns(self, keys, names):
+        '''
+        Marks custom cells to recompute. They are gathered until control returns to the event
+        loop and recomputed together in the background, see flushColumns.
+        @param keys: store keys of the rows
+        @param names: custom columns to recompute, with the columns depending on them
+        '''
+        if not keys or not names:
+            return
+        if not self.dirty_columns:
+            QTimer.singleShot(0, self.flushColumns)
+        for key in keys:
+            self.dirty_columns.setdefault(key, set()).update(names)
+
+    def flushColumns(self):
+        '''
+        Sends the custom cells marked by recomputeColumns to a worker thread, in one job. The
+        columns of each row are evaluated in topological order; the values they use and the
+        component values are gathered here, on the GUI thread.
+        '''
+        dirty, self.dirty_columns = self.dirty_columns, dict()
+        rows = []
+        for key, names in dirty.items():
+            indices = self.storeKeyIndices(key)
+            if indices is None:
+                continue
+            names = self.column_graph.order(names)
+            columns = [(name, self.column_graph.expression(name)) for name in names]
+            bindings = dict((name, self.column_store.get(key, name))
+                            for name in self.column_graph.uses(names) if name != COMPONENT)
+            values = mask = None
+            if COMPONENT in self.column_graph.uses(names):
+                subset_i, data_i, comp_i = indices
+                data = self.xc[data_i]
+                cid = data.components[comp_i]
+                try:
+                    if not data.get_component(cid).categorical:
+                        values = data.get_data(cid)
+                        if subset_i != -1:
+                            mask = self.mask_cache.get_mask(self.xc.subset_groups[subset_i].subset_state, data)
+                except Exception:
+                    values = mask = None
+            version = self.column_versions[key] = self.column_versions.get(key, 0) + 1
+            rows.append((key, version, columns, bindings, values, mask))
+        if rows:
+            # evaluating expressions needs the namespace of the GUI process, so a thread
+            self.column_jobs.add(self.compute_service.submit_local(column_job, rows, priority=ROW_PRIORITY_OTHER))
+
+    def columnsComputed(self, job_id, results):
+        '''
+        Receives the recomputed custom cells from column_job and writes the ones that are still
+        current into column_store and the trees
+        @param job_id: id of the job
+        @param results: list returned by column_job
+        '''
+        self.column_jobs.discard(job_id)
+        cells = dict()
+        for key, version, values in results:
+            if self.column_versions.get(key) != version:
+                # recomputed again meanwhile
+                continue
+            for name, value in values.items():
+                self.column_store.set(key, name, value)
+            cells[key] = values
+        self.setColumnCells(cells)
+
+    def setColumnCells(self, cells):
+        '''
+        Writes custom cells into the rows of both views
+        @param cells: dict store key -> {column name: value}, None clears a cell
+        '''
+        if not cells:
+            return
+        for indices, items in self.rowItems().items():
+            values = cells.get(self.storeKey(*indices))
+            if values is None:
+                continue
+            for name, value in values.items():
+                if name not in self.headings:
+                    continue
+                column = self.headings.index(name)
+                for item in items:
+                    item.setData(column, 0, None if value is None else self.itemValue(value))
+
+    def storeKeyIndices(self, key):
+        '''
+        Returns the current (subset_i, data_i, comp_i) indices of a store key, or None if its
+        subset, dataset or component was removed
+        @param key: store key, see storeKey
+        '''
+        group, data_uuid, comp_uuid = key
+        data_i = next((i for i, data in enumerate(self.xc) if data.uuid == data_uuid), None)
+        if data_i is None:
+            return None
+        comp_i = next((i for i, cid in enumerate(self.xc[data_i].components) if cid.uuid == comp_uuid), None)
+        if comp_i is None:
+            return None
+        if group == -1:
+            return (-1, data_i, comp_i)
+        subset_i = next((i for i, g in enumerate(self.xc.subset_groups) if id(g) == group), None)
+        return None if subset_i is None else (subset_i, data_i, comp_i)
+
+    def storeKey(self, subset_i, data_i, comp_i):
+        '''
+        Identifies a row in column_store, independently of the subset definition and of the
+        position of the row in the trees
+        @param subset_i: subset index from tree, -1 for all data
+        @param data_i: data index from the tree
+        @param comp_i: component index from the tree
+        '''
+        data = self.xc[data_i]
+        group = -1 if subset_i == -1 else id(self.xc.subset_groups[subset_i])
+        return (group, data.uuid, data.components[comp_i].uuid)
+
+    def rowKey(self, subset_i, data_i, comp_i):
+        '''
+        Identifies a subset row independently of the subset definition, used for the accumulators
+        that are updated incrementally when the subset is edited
+        @param subset_i: subset index from tree
+        @param data_i: data index from the tree
+        @param comp_i: component index from the tree
+        '''
+        data = self.xc[data_i]
+        return (id(self.xc.subset_groups[subset_i]), data.uuid, data.components[comp_i].uuid)
+
+    def subsetFingerprint(self, subset_state):
+        '''
+        Returns the structural fingerprint of a subset state, computed once per state and
+        forgotten when subsets are edited or updated
+        @param subset_state: glue SubsetState
+        '''
+        entry = self.state_fingerprints.get(id(subset_state))
+        if entry is None or entry[0] is not subset_state:
+            entry = (subset_state, subset_state_fingerprint(subset_state))
+            self.state_fingerprints[id(subset_state)] = entry
+        return entry[1]
+
+    def pruneMasks(self):
+        '''
+        Drops the cached subset masks of replaced/deleted subset states and deleted datasets,
+        and the accumulators of rows whose subset or dataset was deleted
+        '''
+        self.mask_cache.prune([group.subset_state for group in self.xc.subset_groups], self.xc)
+
+        live = set(id(group) for group in self.xc.subset_groups)
+        live.update(id(data) for data in self.xc)
+        for row_key, (group, data, mask, aggregate) in list(self.subset_aggregates.items()):
+            if id(group) not in live or id(data) not in live:
+                self.subset_aggregates.pop(row_key)
+
+        live_states = set(id(group.subset_state) for group in self.xc.subset_groups)
+        for state_id in list(self.state_fingerprints):
+            if state_id not in live_states:
+                self.state_fingerprints.pop(state_id)
+
+        # rows of deleted subsets, datasets and components
+        live.add(-1)
+        live_uuids = set(data.uuid for data in self.xc)
+        live_uuids.update(cid.uuid for data in self.xc for cid in data.components)
+        self.column_store.discard([key for key in self.column_store.keys()
+                                   if key[0] not in live or key[1] not in live_uuids or key[2] not in live_uuids])
+
     def mousePressEvent(self, event):
         pass
 
+    def closeEvent(self, event):
+        '''
+        Stops the worker thread when the viewer is closed
+        '''
+        self.compute_service.shutdown()
+        if self.dask_scheduler is not None:
+            self.dask_scheduler.close()
+        super(StatsDataViewer, self).closeEvent(event)
+
     def sortBySubsets(self):
         '''
         Sorts the treeview by subsets- Dataset then subset then component.
@@ -3283,6 +4481,72 @@ class StatsDataViewer(DataViewer):
                     self.num_rows = self.num_rows + 1
         '''
 
+    def markUnpopulated(self, item, source):
+        '''
+        Defers the creation of the children of an item until it is expanded or checked
+        @param item: QTreeWidgetItem whose children are created lazily
+        @param source: (subset group, dataset) for a subset of a dataset in the subset view,
+                       (dataset, component ID) for a component in the component view
+        '''
+        item.setData(0, self.unpopulated_role, source)
+        item.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
+
+    def populateItem(self, item, recursive=False):
+        '''
+        Creates the deferred children of an item, see markUnpopulated. The new rows are checked
+        if the item is, and grayed out if they cannot be calculated.
+        @param item: QTreeWidgetItem that is expanded or checked
+        @param recursive: also populate the items below it
+        '''
+        source = item.data(0, self.unpopulated_role)
+        if source is not None:
+            item.setData(0, self.unpopulated_role, None)
+            item.setChildIndicatorPolicy(QTreeWidgetItem.DontShowIndicatorWhenChildless)
+            state = item.checkState(0)
+            gray = item.foreground(0) == QtGui.QBrush(Qt.gray)
+
+            if item.treeWidget() is self.subsetTree:
+                # component rows of a subset of a dataset
+                group, data = source
+                if any(g is group for g in self.xc.subset_groups) and any(d is data for d in self.xc):
+                    for cid in data.components:
+                        child = QTreeWidgetItem(item)
+                        child.setData(0, 0, '{}'.format(str(cid)))
+                        child.setIcon(0, helpers.layer_icon(group))
+                        if gray:
+                            child.setForeground(0, QtGui.QBrush(Qt.gray))
+                        else:
+                            child.setCheckState(0, state)
+            else:
+                # subset rows of a component, after its "All data" row
+                data, cid = source
+                for group in self.xc.subset_groups:
+                    child = QTreeWidgetItem(item)
+                    child.setData(0, 0, '{}'.format(group.label))
+                    child.setIcon(0, helpers.layer_icon(group))
+                    try:
+                        # the subset must apply to the dataset, this also warms the mask cache
+                        self.mask_cache.get_mask(group.subset_state, data)
+                        child.setCheckState(0, state)
+                    except Exception:
+                        child.setForeground(0, QtGui.QBrush(Qt.gray))
+                    self.num_rows = self.num_rows + 1
+
+        if recursive:
+            for x in range(item.childCount()):
+                self.populateItem(item.child(x), recursive=True)
+
+    def populateExpanded(self, item):
+        '''
+        Populates the expanded items below item, for expansions that do not emit itemExpanded
+        @param item: QTreeWidgetItem to start from, e.g. the invisible root item of a tree
+        '''
+        for x in range(item.childCount()):
+            child = item.child(x)
+            if child.isExpanded():
+                self.populateItem(child)
+                self.populateExpanded(child)
+
     def minimizeGrayedData(self):
         '''
         minimizes any subsets/components that have no calculable children
@@ -3319,6 +4583,33 @@ class StatsDataViewer(DataViewer):
                     child.setExpanded(False)
 
 
+class StatsItemDelegate(QStyledItemDelegate):
+    '''
+    Formats the raw statistic values stored in the trees when they are painted, using the
+    notation and number of decimals of the viewer. Scientific notation is left justified and
+    decimal notation right justified so the decimal points line up.
+    '''
+
+    def __init__(self, viewer, parent=None):
+        '''
+        @param viewer: the StatsDataViewer whose settings are used
+        @param parent: the tree widget the delegate paints
+        '''
+        super(StatsItemDelegate, self).__init__(parent)
+        self.viewer = viewer
+
+    def displayText(self, value, locale):
+        if isinstance(value, (float, Estimate)):
+            return self.viewer.formatValue(value)
+        return super(StatsItemDelegate, self).displayText(value, locale)
+
+    def initStyleOption(self, option, index):
+        super(StatsItemDelegate, self).initStyleOption(option, index)
+        if index.column() > 0 and isinstance(index.data(Qt.DisplayRole), (float, Estimate)):
+            alignment = Qt.AlignLeft if self.viewer.isSci else Qt.AlignRight
+            option.displayAlignment = alignment | Qt.AlignVCenter
+
+
 class ModifiedTreeWidget(QTreeWidget):
 
     def dragEnterEvent(self, event):
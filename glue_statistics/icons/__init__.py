@@ -18,3 +18,4 @@ SAVE_LOGO = icon_path('glue_filesave.png')
 EXPAND_LOGO = icon_path('glue_expand.png')
 COLLAPSE_LOGO = icon_path('glue_collapse.png')
 CUSTOM_COLUMN_LOGO = icon_path('glue_addcolumn.png')
+COLUMNS_LOGO = icon_path('glue_columns.png')
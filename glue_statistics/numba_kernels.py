@@ -0,0 +1,81 @@
+import numpy as np
+
+# numba is optional (see the 'numba' extra), without it the NumPy reductions are used
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def available():
+    '''
+    Returns True if numba is installed and the compiled kernels can be used
+    '''
+    return numba is not None
+
+
+if numba is not None:
+
+    @numba.njit(nogil=True, cache=True)
+    def _fused_kernel(values, mask, use_mask, out):
+        count = 0
+        nan_count = 0
+        total = 0.
+        compensation = 0.
+        minimum = np.inf
+        maximum = -np.inf
+        mean = 0.
+        m2 = 0.
+        for i in range(values.size):
+            if use_mask and not mask[i]:
+                continue
+            x = values[i]
+            if not np.isfinite(x):
+                nan_count += 1
+                continue
+            out[count] = x
+            count += 1
+            # Neumaier compensated sum
+            t = total + x
+            if abs(total) >= abs(x):
+                compensation += (total - t) + x
+            else:
+                compensation += (x - t) + total
+            total = t
+            if x < minimum:
+                minimum = x
+            if x > maximum:
+                maximum = x
+            # Welford moments
+            delta = x - mean
+            mean += delta / count
+            m2 += delta * (x - mean)
+        return count, total, compensation, minimum, maximum, mean, m2, nan_count
+
+
+def fused_gather(values, mask=None):
+    '''
+    Gathers the finite (and masked) values of a float array and reduces them in one compiled
+    loop, without the temporary arrays of the NumPy path (finiteness mask, combined mask,
+    float copy, deviations). Returns the gathered values, which the median is selected from,
+    and a dict with the count, compensated sum, minimum, maximum, Welford moments and the
+    number of non-finite values that were skipped.
+    Only call when available() is True and values has a float dtype.
+    @param values: float array of component values
+    @param mask: boolean array with the same shape as values, or None for the whole component
+    '''
+    values = np.ascontiguousarray(values).reshape(-1)
+    if mask is None:
+        flat_mask = np.empty(0, dtype=np.bool_)
+    else:
+        flat_mask = np.ascontiguousarray(mask, dtype=np.bool_).reshape(-1)
+    out = np.empty(values.size, dtype=values.dtype)
+    count, total, compensation, minimum, maximum, mean, m2, nan_count = \
+        _fused_kernel(values, flat_mask, mask is not None, out)
+    moments = dict(count=count, total=total, compensation=compensation, minimum=minimum,
+                   maximum=maximum, mean=mean, m2=m2, nan_count=nan_count)
+    kept = out[:count]
+    if count < values.size // 2:
+        # do not hold on to a buffer mostly unused, e.g. for small subsets
+        kept = kept.copy()
+    return kept, moments
@@ -0,0 +1,199 @@
+import threading
+
+import numpy as np
+
+from glue_statistics.reductions import PartialAggregate, gather_aggregate, tree_merge
+
+# dask is optional (see the 'dask' extra), without it every component is loaded in memory
+try:
+    import dask
+    import dask.array as da
+except ImportError:
+    dask = None
+    da = None
+
+# Size of the dask chunks used when wrapping memory-mapped or lazily loaded arrays
+DASK_CHUNK_BYTES = 2 ** 27
+
+# Schedulers of DaskScheduler
+SCHEDULERS = ('threads', 'cluster')
+
+
+def dask_available():
+    '''
+    Returns True if dask is installed
+    '''
+    return da is not None
+
+
+def cluster_available():
+    '''
+    Returns True if dask.distributed is installed, which the 'cluster' scheduler needs
+    '''
+    if da is None:
+        return False
+    try:
+        import distributed  # noqa
+    except ImportError:
+        return False
+    return True
+
+
+def is_dask_array(values):
+    '''
+    Returns True if the values of a component are a dask array
+    @param values: raw data of a component
+    '''
+    return da is not None and isinstance(values, da.Array)
+
+
+def as_dask_array(values, chunk_bytes=DASK_CHUNK_BYTES):
+    '''
+    Wraps an out-of-core array (e.g. a memory-mapped array or an h5py dataset) as a dask array. Chunks follow the native chunks of the file when
+    it has some (e.g. HDF5) and hold about chunk_bytes each.
+    @param values: dask array, memory-mapped array or lazily read array-like
+    @param chunk_bytes: approximate size of a chunk
+    '''
+    if isinstance(values, da.Array):
+        return values
+    with dask.config.set({'array.chunk-size': chunk_bytes}):
+        # array-likes reading from a file are not thread-safe, memory maps are
+        return da.from_array(values, chunks='auto', lock=not isinstance(values, np.ndarray))
+
+
+def out_of_core_fingerprint(values):
+    '''
+    Fingerprint of an out-of-core array that does not read its values: the name of the dask
+    graph, which for memory-mapped files depends on the file name and modification time
+    @param values: dask array, memory-mapped array or lazily read array-like
+    '''
+    return dask.base.tokenize(as_dask_array(values))
+
+
+class DaskScheduler(object):
+    '''
+    Runs dask computations either on the local threaded scheduler, where the memory used is
+    bounded by the chunk size times the number of workers, or on a distributed LocalCluster
+    that spills intermediate results to disk above memory_limit. The cluster is started the
+    first time it is needed; jobs running on several worker threads share it.
+    '''
+
+    def __init__(self, kind='threads', num_workers=None, memory_limit=None):
+        '''
+        @param kind: 'threads' or 'cluster', see SCHEDULERS
+        @param num_workers: number of threads, one per core by default
+        @param memory_limit: memory budget of the cluster in bytes, or None for no limit
+        '''
+        if kind not in SCHEDULERS:
+            raise ValueError("kind should be one of " + ", ".join(SCHEDULERS))
+        self.kind = kind
+        self.num_workers = num_workers
+        self.memory_limit = memory_limit
+        self._client = None
+        # guards the creation and closing of the client, which concurrent jobs share
+        self._lock = threading.Lock()
+
+    def compute(self, *collections):
+        '''
+        Computes dask collections together, sharing the reads of their common inputs
+        @param collections: dask arrays or delayed values
+        '''
+        if self.kind == 'cluster' and cluster_available():
+            with self._lock:
+                if self._client is None:
+                    from distributed import Client, LocalCluster
+                    # a single in-process worker can read from h5py datasets, which cannot be pickled
+                    cluster = LocalCluster(n_workers=1, threads_per_worker=self.num_workers, processes=False,
+                                           memory_limit=self.memory_limit or 'auto')
+                    self._client = Client(cluster, set_as_default=False)
+                client = self._client
+            return client.compute(list(collections), sync=True)
+        return dask.compute(*collections, scheduler='threads', num_workers=self.num_workers)
+
+    def close(self):
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+            client.cluster.close()
+
+
+def _block_aggregate(block, mask):
+    '''
+    Reduces one chunk of a dask array into a PartialAggregate, see dask_aggregate
+    @param block: chunk of component values
+    @param mask: matching chunk of the subset mask, or None
+    '''
+    return gather_aggregate(block, mask)[1]
+
+
+def dask_aggregate(values, mask=None, quantiles=(), scheduler=None):
+    '''
+    Computes the accumulator of an out-of-core component with dask, in one pass over the file,
+    together with its order statistics. Each chunk is reduced into a PartialAggregate, with its
+    own Welford moments, and these are merged like the chunks of the in-memory and streaming
+    paths, so offsets do not cancel in the variance. The order statistics are approximated
+    from per-chunk percentiles.
+    Returns the PartialAggregate and the values at the quantiles.
+    @param values: dask array, memory-mapped array or lazily read array-like
+    @param mask: boolean array or dask array with the same shape as values, or None
+    @param quantiles: quantiles of the order statistics, see StatisticPlan
+    @param scheduler: DaskScheduler running the computation, the local threads by default
+    '''
+    empty = (PartialAggregate(), (np.nan,) * len(quantiles))
+    if isinstance(mask, np.ndarray) and not mask.any():
+        return empty
+    array = as_dask_array(values)
+    blocks = array.to_delayed().ravel()
+    if mask is None:
+        partials = [dask.delayed(_block_aggregate)(block, None) for block in blocks]
+        keep = da.isfinite(array)
+    else:
+        mask = da.asarray(mask).rechunk(array.chunks)
+        partials = [dask.delayed(_block_aggregate)(block, mask_block)
+                    for block, mask_block in zip(blocks, mask.to_delayed().ravel())]
+        keep = da.isfinite(array) & mask
+    collections = list(partials)
+    if quantiles:
+        # boolean indexing gives chunks of unknown size, which percentile handles chunk by chunk
+        collections.append(da.percentile(array[keep], [100. * q for q in quantiles]))
+
+    if scheduler is None:
+        scheduler = DaskScheduler()
+    try:
+        computed = scheduler.compute(*collections)
+    except ValueError:
+        # percentile fails when no finite value is selected, check that this is the reason
+        if tree_merge(scheduler.compute(*partials)).count:
+            raise
+        return empty
+    aggregate = tree_merge(computed[:len(partials)])
+    if aggregate.count == 0:
+        return empty
+    return aggregate, tuple(float(value) for value in computed[-1]) if quantiles else ()
+
+
+def dask_statistics(values, mask, plan, scheduler=None):
+    '''
+    Computes the statistics of a plan for an out-of-core component with dask, see
+    dask_aggregate. Returns the values in the order of the plan, all NaN if nothing is
+    selected.
+    @param values: dask array, memory-mapped array or lazily read array-like
+    @param mask: boolean array or dask array with the same shape as values, or None
+    @param plan: StatisticPlan of the statistics to compute
+    @param scheduler: DaskScheduler running the computation, the local threads by default
+    '''
+    return plan.finish(*dask_aggregate(values, mask, plan.quantiles, scheduler))
+
+
+def dask_job(key, values, mask, quantiles, scheduler):
+    '''
+    Worker job computing the accumulator of an out-of-core row with dask_aggregate. Returns
+    [(key, PartialAggregate, values at the quantiles)], like dataset_job.
+    @param key: key of the row
+    @param values: dask array, memory-mapped array or lazily read array-like
+    @param mask: boolean subset mask, or None for the whole component
+    @param quantiles: quantiles of the order statistics, see StatisticPlan
+    @param scheduler: DaskScheduler running the computation
+    '''
+    return [(key,) + dask_aggregate(values, mask, quantiles, scheduler)]
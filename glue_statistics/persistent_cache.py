@@ -0,0 +1,134 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+import numpy as np
+
+# Size of the blocks hashed at once when fingerprinting non-contiguous arrays
+FINGERPRINT_BLOCK_BYTES = 2 ** 26
+
+
+def array_fingerprint(values):
+    '''
+    Content fingerprint of an array: identical dtype, shape and values give the same digest
+    in any process, whatever the dataset or component is called
+    @param values: NumPy array to fingerprint
+    '''
+    values = np.asanyarray(values)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(('%s%r' % (values.dtype.str, values.shape)).encode('utf8'))
+    if values.dtype.hasobject:
+        digest.update(repr(values.tolist()).encode('utf8'))
+    elif values.flags.c_contiguous:
+        digest.update(memoryview(values.reshape(-1).view(np.uint8)))
+    else:
+        # hash blocks of leading-axis slices in C order, so that a strided view is never
+        # copied whole and gives the same digest as a contiguous copy
+        row_bytes = max(1, values[:1].nbytes)
+        step = max(1, FINGERPRINT_BLOCK_BYTES // row_bytes)
+        for start in range(0, values.shape[0], step):
+            digest.update(np.ascontiguousarray(values[start:start + step]).reshape(-1).view(np.uint8))
+    return digest.hexdigest()
+
+
+class PersistentStatsCache(object):
+    '''
+    On-disk cache of raw statistic values shared between sessions and between glue processes.
+    Entries are stored in an SQLite database in WAL mode: readers never block, concurrent
+    writers wait for each other (busy timeout) and every write is a single atomic statement,
+    so several processes can safely use the same file. Values are stored one per statistic,
+    so rows computed for different sets of statistics complete each other. The oldest values
+    are dropped once the database holds more than max_entries of them.
+    '''
+
+    def __init__(self, path, max_entries=5000000, timeout=10.0):
+        '''
+        @param path: path of the SQLite database, created if needed
+        @param max_entries: maximum number of stored values
+        @param timeout: seconds to wait for a lock held by another process
+        '''
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self._connection = sqlite3.connect(path, timeout=timeout, isolation_level=None,
+                                           check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS statistic_values ('
+                                 'key TEXT, statistic TEXT, value REAL, stored REAL, '
+                                 'PRIMARY KEY (key, statistic))')
+
+    def get(self, key, names):
+        '''
+        Returns the stored values of statistics of key, or None if one of them is not stored
+        @param key: fingerprint of the row
+        @param names: names of the statistics
+        '''
+        with self._lock:
+            try:
+                rows = self._connection.execute('SELECT statistic, value FROM statistic_values '
+                                                'WHERE key = ?', (key,)).fetchall()
+            except sqlite3.Error:
+                return None
+        stored = dict(rows)
+        if any(name not in stored for name in names):
+            return None
+        # SQLite stores NaN (empty subsets) as NULL
+        return tuple(np.nan if stored[name] is None else stored[name] for name in names)
+
+    def set(self, key, names, stats):
+        '''
+        Stores statistics of a row. Failures (e.g. a read-only config directory or a lock
+        held for too long) are ignored, the values are simply not shared.
+        @param key: fingerprint of the row
+        @param names: names of the statistics
+        @param stats: values in the order of names
+        '''
+        stored = time.time()
+        parameters = []
+        for name, value in zip(names, stats):
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                value = np.nan
+            parameters.extend((key, name, value, stored))
+        if not parameters:
+            return
+        with self._lock:
+            try:
+                # one statement, so the values of a row are written atomically
+                self._connection.execute('INSERT OR REPLACE INTO statistic_values VALUES ' +
+                                         ', '.join(['(?, ?, ?, ?)'] * (len(parameters) // 4)), parameters)
+                self._writes += 1
+                if self._writes % 1000 == 0:
+                    self._trim()
+            except sqlite3.Error:
+                pass
+
+    def _trim(self):
+        count = self._connection.execute('SELECT COUNT(*) FROM statistic_values').fetchone()[0]
+        if count > self.max_entries:
+            self._connection.execute('DELETE FROM statistic_values WHERE rowid IN (SELECT rowid FROM '
+                                     'statistic_values ORDER BY stored LIMIT ?)', (count - self.max_entries,))
+
+    def clear(self):
+        '''
+        Deletes every stored row, for all processes using the file
+        '''
+        with self._lock:
+            try:
+                self._connection.execute('DELETE FROM statistic_values')
+            except sqlite3.Error:
+                pass
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
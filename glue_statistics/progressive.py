@@ -0,0 +1,259 @@
+import numpy as np
+
+from glue_statistics.reductions import PartialAggregate, tree_merge
+from glue_statistics.registry import ORDER
+
+# Number of values drawn for the first estimate of a row
+SAMPLE_SIZE = 100000
+
+# Number of contiguous blocks read for the first estimate of a row backed by a file
+SAMPLE_BLOCKS = 32
+
+# z score of the two-sided 95% confidence intervals of the estimates
+CONFIDENCE_Z = 1.959963984540054
+
+
+class Estimate(object):
+    '''
+    A statistic estimated from a random sample while its exact value is being computed, with
+    the bounds of its 95% confidence interval. A bound is None when it is not known, e.g. the
+    minimum of a sample is an upper bound of the minimum but gives no lower bound.
+    '''
+    __slots__ = ('value', 'low', 'high')
+
+    def __init__(self, value, low=None, high=None):
+        '''
+        @param value: estimated value
+        @param low: lower bound of the confidence interval, or None
+        @param high: upper bound of the confidence interval, or None
+        '''
+        self.value = float(value)
+        self.low = None if low is None else float(low)
+        self.high = None if high is None else float(high)
+
+    def __float__(self):
+        return self.value
+
+    def half_width(self):
+        '''
+        Returns the largest distance from the value to a bound of the interval, or None if a
+        bound is not known
+        '''
+        if self.low is None or self.high is None:
+            return None
+        return max(self.high - self.value, self.value - self.low)
+
+    def __repr__(self):
+        return 'Estimate(%r, low=%r, high=%r)' % (self.value, self.low, self.high)
+
+
+def sample_indices(size, sample_size=SAMPLE_SIZE, seed=None):
+    '''
+    Returns the sorted flat indices of a uniform random sample of about sample_size elements
+    without repetition, or every index if there are fewer elements. Indices are drawn with
+    replacement and the duplicates dropped, which costs O(sample_size) whatever the size.
+    @param size: number of elements
+    @param sample_size: number of elements wanted
+    @param seed: seed of the random generator, random by default
+    '''
+    if size <= sample_size:
+        return np.arange(size)
+    return np.unique(np.random.default_rng(seed).integers(0, size, sample_size))
+
+
+def draw_sample(values, mask=None, sample_size=SAMPLE_SIZE, seed=None):
+    '''
+    Reads a random sample of a row and returns its ProgressiveEstimate. Only the sampled
+    elements are read, so this is fast for memory-mapped values as well.
+    @param values: numeric array of component values
+    @param mask: boolean array with the same shape as values, or None for the whole component
+    @param sample_size: number of elements drawn
+    @param seed: seed of the random generator, random by default
+    '''
+    indices = sample_indices(values.size, sample_size, seed)
+    view = np.unravel_index(indices, values.shape)
+    sample = np.asarray(values[view])
+    selected = np.ones(indices.size, dtype=bool) if mask is None else np.asarray(mask[view], dtype=bool)
+    return ProgressiveEstimate(values.size, indices, sample, selected)
+
+
+def sample_blocks(shape, sample_size=SAMPLE_SIZE, blocks=SAMPLE_BLOCKS, seed=None):
+    '''
+    Returns the sorted, non-overlapping (start, stop) ranges along the first axis of about
+    blocks slabs at random positions, holding about sample_size elements altogether (at least
+    one slab, however large it is)
+    @param shape: shape of the values
+    @param sample_size: number of elements wanted
+    @param blocks: number of slabs wanted
+    @param seed: seed of the random generator, random by default
+    '''
+    length = shape[0] if shape else 1
+    inner = max(1, int(np.prod(shape[1:], dtype=np.int64)))
+    blocks = max(1, min(blocks, sample_size // inner))
+    rows = max(1, sample_size // (blocks * inner))
+    if length <= rows * blocks:
+        return [(0, length)]
+    starts = np.unique(np.random.default_rng(seed).integers(0, length - rows + 1, blocks))
+    ranges = []
+    for start in starts.tolist():
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], start + rows)
+        else:
+            ranges.append((start, start + rows))
+    return ranges
+
+
+def draw_blocks(values, mask=None, sample_size=SAMPLE_SIZE, blocks=SAMPLE_BLOCKS, seed=None):
+    '''
+    Reads a sample of a row made of a few contiguous slabs at random positions and returns
+    its ProgressiveEstimate. Scattered elements of values backed by a file each cost a read
+    (draw_sample), slabs are read with a handful of sequential reads. Neighbouring elements
+    are often alike, so the confidence intervals are narrower than they should be.
+    @param values: numeric array-like of component values, e.g. np.memmap or h5py dataset
+    @param mask: boolean array with the same shape as values, or None for the whole component
+    @param sample_size: number of elements read, about
+    @param blocks: number of slabs read
+    @param seed: seed of the random generator, random by default
+    '''
+    shape = tuple(values.shape)
+    inner = max(1, int(np.prod(shape[1:], dtype=np.int64)))
+    indices, sample, selected = [], [], []
+    for start, stop in sample_blocks(shape, sample_size, blocks, seed):
+        indices.append(np.arange(start * inner, stop * inner))
+        sample.append(np.reshape(np.asarray(values[start:stop]), -1))
+        if mask is not None:
+            selected.append(np.reshape(np.asarray(mask[start:stop], dtype=bool), -1))
+    indices = np.concatenate(indices)
+    selected = np.ones(indices.size, dtype=bool) if mask is None else np.concatenate(selected)
+    return ProgressiveEstimate(int(np.prod(shape, dtype=np.int64)), indices, np.concatenate(sample), selected)
+
+
+class ProgressiveEstimate(object):
+    '''
+    Estimates the statistics of a row from a random sample of its elements, refined as the
+    exact aggregates of chunks of the row come in: chunks that are done count exactly and only
+    the sample points outside them are extrapolated, so the confidence intervals shrink to
+    nothing as the row completes. Order statistics stay sample estimates until they are
+    computed.
+    The mean, sum, minimum and maximum get confidence intervals (or bounds); other moment
+    statistics are evaluated on the extrapolated aggregate, without an interval.
+    '''
+
+    def __init__(self, size, indices, values, selected):
+        '''
+        @param size: number of elements of the row
+        @param indices: sorted flat indices of the sample, see sample_indices
+        @param values: values of the row at indices
+        @param selected: boolean array, True where the subset selects the sampled element
+        '''
+        self.size = size
+        self.indices = np.asarray(indices)
+        self.values = np.asarray(values, dtype=float)
+        self.kept = np.asarray(selected, dtype=bool) & np.isfinite(self.values)
+        # sample points and elements covered by the chunks done
+        self.done = np.zeros(self.indices.size, dtype=bool)
+        self.done_size = 0
+        self.parts = []
+        self.sorted = np.sort(self.values[self.kept])
+
+    def _sample_quantile(self, q):
+        '''
+        Quantile of the selected sample values with the distribution-free interval given by
+        the order statistics around it, as (value, low, high)
+        @param q: quantile between 0 and 1
+        '''
+        n = self.sorted.size
+        spread = CONFIDENCE_Z * np.sqrt(n * q * (1. - q))
+        low = self.sorted[max(0, int(np.floor(n * q - spread)))]
+        high = self.sorted[min(n - 1, int(np.ceil(n * q + spread)))]
+        return np.quantile(self.sorted, q), low, high
+
+    def _order_estimate(self, statistic):
+        '''
+        Sample estimate of an order statistic. The interval is given for statistics of a
+        single quantile, through their reducer, which is assumed to be increasing.
+        @param statistic: Statistic that needs ORDER
+        '''
+        if self.sorted.size == 0:
+            return None
+        estimates = [self._sample_quantile(q) for q in statistic.quantiles]
+        value = statistic.reducer(*[estimate[0] for estimate in estimates])
+        if len(estimates) == 1:
+            return Estimate(value, statistic.reducer(estimates[0][1]), statistic.reducer(estimates[0][2]))
+        return Estimate(value)
+
+    def add_chunk(self, start, stop, aggregate):
+        '''
+        Accounts for the exact aggregate of a chunk of the row
+        @param start: first flat index of the chunk
+        @param stop: flat index after the chunk
+        @param aggregate: PartialAggregate of the chunk
+        '''
+        first, last = np.searchsorted(self.indices, (start, stop))
+        self.done[first:last] = True
+        self.done_size += stop - start
+        self.parts.append(aggregate)
+
+    def statistics(self, plan):
+        '''
+        Returns the current estimates in the order of a plan. Values that are exact already
+        are floats, the others Estimate objects, or None when nothing selected was seen yet.
+        @param plan: StatisticPlan of the statistics shown
+        '''
+        exact = tree_merge(self.parts)
+        remaining = self.size - self.done_size
+        # order statistics are estimated separately, see _order_estimate
+        unknown = (np.nan,) * len(plan.quantiles)
+        if remaining == 0:
+            if exact.count == 0:
+                return (None,) * len(plan)
+            return tuple(self._order_estimate(statistic) if statistic.needs == ORDER else float(value)
+                         for statistic, value in zip(plan.statistics, plan.finish(exact, unknown)))
+
+        # extrapolate the sample points outside the chunks done to the rest of the row
+        rest = ~self.done
+        m = int(np.count_nonzero(rest))
+        kept = self.values[rest & self.kept]
+        if m == 0 or (exact.count == 0 and kept.size == 0):
+            return (None,) * len(plan)
+        scale = remaining / float(m)
+        correction = max(0., 1. - m / float(remaining))
+        count = exact.count + scale * kept.size
+        total = exact.sum + scale * kept.sum()
+        # Horvitz-Thompson variance of the extrapolated sum, the unselected points count as 0
+        spread = (np.sum(kept ** 2) / m - (kept.sum() / m) ** 2) * m / max(1, m - 1)
+        sum_width = CONFIDENCE_Z * remaining * np.sqrt(max(0., spread) * correction / m)
+
+        mean = total / count
+        if kept.size > 1:
+            # ratio estimate, only the extrapolated share of the selection is uncertain
+            share = scale * kept.size / count
+            mean_width = CONFIDENCE_Z * share * np.std(kept, ddof=1) * np.sqrt(correction / kept.size)
+            mean = Estimate(mean, mean - mean_width, mean + mean_width)
+        else:
+            mean = Estimate(mean)
+
+        if kept.size:
+            minimum = min(exact.minimum, kept.min())
+            maximum = max(exact.maximum, kept.max())
+            minimum, maximum = Estimate(minimum, None, minimum), Estimate(maximum, maximum, None)
+        else:
+            # the rest of the row may hold selected values the sample missed
+            minimum, maximum = Estimate(exact.minimum, None, exact.minimum), Estimate(exact.maximum, exact.maximum, None)
+        total = Estimate(total, total - sum_width, total + sum_width)
+        known = dict(Mean=mean, Minimum=minimum, Maximum=maximum, Sum=total)
+
+        # the sample stands for the rest of the row, scaled up to its share of the elements
+        guess = exact.copy()
+        if kept.size:
+            sample = PartialAggregate.from_values(kept)
+            guess.merge(PartialAggregate(sample.count * scale, sample.total * scale, sample.minimum,
+                                         sample.maximum, sample.compensation * scale, sample.mean,
+                                         sample.m2 * scale))
+        values = []
+        for statistic, value in zip(plan.statistics, plan.finish(guess, unknown)):
+            if statistic.needs == ORDER:
+                values.append(self._order_estimate(statistic))
+            else:
+                values.append(known.get(statistic.name, Estimate(value)))
+        return tuple(values)
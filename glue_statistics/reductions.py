@@ -0,0 +1,573 @@
+import warnings
+import numpy as np
+
+from glue_statistics import numba_kernels
+
+# dtype kinds the fused kernels can reduce directly (bool, signed/unsigned int, float)
+NUMERIC_KINDS = 'buif'
+
+# Use the compiled kernels of numba_kernels for float components when numba is installed.
+# Both paths give the same results, this can be switched off to compare them.
+USE_NUMBA = numba_kernels.available()
+
+# float dtypes the compiled kernels support; float16 and long double use the NumPy path
+NUMBA_DTYPES = (np.dtype(np.float32), np.dtype(np.float64))
+
+
+def is_numeric(values):
+    '''
+    Returns True if the fused kernels can reduce the given array
+    @param values: array of component values
+    '''
+    return np.asarray(values).dtype.kind in NUMERIC_KINDS
+
+
+def finite_values(values, mask=None):
+    '''
+    Returns a flat copy of the finite values of an array, optionally restricted to a mask.
+    This mirrors the finite=True behaviour of glue's compute_statistic.
+    @param values: array of component values
+    @param mask: boolean array with the same shape as values, or None to keep every element
+    '''
+    values = np.asarray(values)
+    keep = np.isfinite(values)
+    if mask is not None:
+        keep &= mask
+    return values[keep]
+
+
+def quantile_ranks(size, quantiles):
+    '''
+    Returns the positions of the given quantiles among size sorted values, as (low, high,
+    fraction) tuples: the quantile lies between the values of rank low and high, linearly
+    interpolated as numpy.quantile does
+    @param size: number of values, must not be 0
+    @param quantiles: quantiles between 0 and 1
+    '''
+    ranks = []
+    for q in quantiles:
+        position = q * (size - 1)
+        low = int(np.floor(position))
+        ranks.append((low, min(low + 1, size - 1), position - low))
+    return ranks
+
+
+def interpolate(low, high, fraction):
+    '''
+    Returns the value a fraction of the way from low to high, see quantile_ranks
+    '''
+    if fraction == 0:
+        return low
+    return (1. - fraction) * float(low) + fraction * float(high)
+
+
+def quantiles_in_place(kept, quantiles):
+    '''
+    Returns the values of a flat array at the given quantiles (e.g. 0.5 for the median),
+    finding all of them with a single selection step.
+    The array is partially reordered in place, so only pass arrays that are owned by the caller.
+    @param kept: flat array of finite values
+    @param quantiles: quantiles between 0 and 1
+    '''
+    if not quantiles:
+        return ()
+    if kept.size == 0:
+        return (np.nan,) * len(quantiles)
+    ranks = quantile_ranks(kept.size, quantiles)
+    kept.partition(sorted(set(rank for low, high, fraction in ranks for rank in (low, high))))
+    return tuple(interpolate(kept[low], kept[high], fraction) for low, high, fraction in ranks)
+
+
+def _two_sum(a, b):
+    '''
+    Returns a + b rounded and the rounding error of that addition (Knuth's TwoSum)
+    '''
+    total = a + b
+    b_virtual = total - a
+    return total, (a - (total - b_virtual)) + (b - b_virtual)
+
+
+def _signed_sum(kept):
+    '''
+    Returns the sum of a flat array of values as a signed number, so that it can be negated
+    and combined with other sums: unsigned integers are summed as int64 instead of wrapping
+    around, and float16 values as float64 instead of overflowing
+    @param kept: flat array of finite values
+    '''
+    if kept.dtype.kind == 'u':
+        return kept.sum(dtype=np.int64)
+    if kept.dtype == np.float16:
+        return kept.sum(dtype=np.float64)
+    return kept.sum()
+
+
+def _moments(kept):
+    '''
+    Returns the mean and the sum of squared deviations from the mean of a flat array of finite
+    values, computed in two passes so that large offsets do not cancel
+    @param kept: flat array of finite values, must not be empty
+    '''
+    as_float = kept.astype(float, copy=False)
+    mean = as_float.mean()
+    deviations = as_float - mean
+    return mean, np.dot(deviations, deviations)
+
+
+class PartialAggregate(object):
+    '''
+    Mergeable partial state of the moment and extremum statistics of a set of finite values:
+    count, sum with its compensation term, minimum, maximum and the Welford moments (mean and
+    sum of squared deviations). Aggregates of disjoint sets of values can be merged, and values
+    can be added to or removed from an aggregate, which is what makes incremental updates of
+    subset statistics and chunk-parallel reductions possible.
+    Sums are merged with compensated (Neumaier) summation and the moments with Chan's parallel
+    update, so merging many chunk aggregates is as accurate as reducing the values at once.
+    '''
+
+    def __init__(self, count=0, total=0, minimum=np.inf, maximum=-np.inf, compensation=0.,
+                 mean=0., m2=0.):
+        self.count = count
+        self.total = total
+        self.minimum = minimum
+        self.maximum = maximum
+        self.compensation = compensation
+        self.mean = mean
+        self.m2 = m2
+
+    @classmethod
+    def from_values(cls, kept):
+        '''
+        Creates the aggregate of a flat array of finite values
+        @param kept: flat array of finite values
+        '''
+        aggregate = cls()
+        aggregate.add(kept)
+        return aggregate
+
+    def copy(self):
+        return PartialAggregate(self.count, self.total, self.minimum, self.maximum,
+                                self.compensation, self.mean, self.m2)
+
+    @property
+    def sum(self):
+        '''
+        Compensated sum of the values
+        '''
+        # integer sums are exact and stay integers
+        if not self.compensation:
+            return self.total
+        return self.total + self.compensation
+
+    def variance(self):
+        '''
+        Population variance of the values, NaN if the aggregate is empty
+        '''
+        if self.count == 0:
+            return np.nan
+        return self.m2 / self.count
+
+    def _add_sum(self, value):
+        self.total, error = _two_sum(self.total, value)
+        self.compensation += error
+
+    def add(self, kept):
+        '''
+        Adds values to the aggregate
+        @param kept: flat array of finite values
+        '''
+        if kept.size == 0:
+            return
+        mean, m2 = _moments(kept)
+        self._merge_moments(kept.size, mean, m2)
+        self._add_sum(_signed_sum(kept))
+        self.minimum = min(self.minimum, kept.min())
+        self.maximum = max(self.maximum, kept.max())
+
+    def remove(self, kept):
+        '''
+        Removes values that were previously added to the aggregate. Returns False if one of
+        the removed values was the minimum or maximum, in which case the extrema are no longer
+        known and have to be rescanned by the caller.
+        @param kept: flat array of finite values
+        '''
+        if kept.size == 0:
+            return True
+        mean, m2 = _moments(kept)
+        remaining = self.count - kept.size
+        if remaining == 0:
+            self.mean, self.m2 = 0., 0.
+        else:
+            # inverse of Chan's update in _merge_moments
+            new_mean = (self.count * self.mean - kept.size * mean) / remaining
+            delta = mean - new_mean
+            self.m2 = max(0., self.m2 - m2 - delta * delta * remaining * kept.size / self.count)
+            self.mean = new_mean
+        self.count = remaining
+        self._add_sum(-_signed_sum(kept))
+        return not (kept.min() <= self.minimum or kept.max() >= self.maximum)
+
+    def _merge_moments(self, count, mean, m2):
+        total_count = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total_count
+        self.m2 += m2 + delta * delta * self.count * count / total_count
+        self.count = total_count
+
+    def merge(self, other):
+        '''
+        Merges the aggregate of a disjoint set of values into this one
+        @param other: PartialAggregate to merge
+        '''
+        if other.count == 0:
+            return
+        self._merge_moments(other.count, other.mean, other.m2)
+        self._add_sum(other.total)
+        self.compensation += other.compensation
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+
+def tree_merge(aggregates):
+    '''
+    Merges the aggregates of disjoint sets of values pairwise, level by level, so that the
+    rounding error grows with the logarithm of the number of aggregates. The aggregates passed
+    in are not modified and can be merged again later.
+    @param aggregates: list of PartialAggregate
+    '''
+    level = [aggregate.copy() for aggregate in aggregates]
+    if not level:
+        return PartialAggregate()
+    while len(level) > 1:
+        merged = []
+        for i in range(0, len(level) - 1, 2):
+            level[i].merge(level[i + 1])
+            merged.append(level[i])
+        if len(level) % 2:
+            merged.append(level[-1])
+        level = merged
+    return level[0]
+
+
+def chunk_bounds(size, parts):
+    '''
+    Splits range(size) into at most parts consecutive (start, stop) ranges of nearly equal length
+    @param size: number of elements
+    @param parts: number of ranges wanted
+    '''
+    parts = max(1, min(parts, size))
+    edges = np.linspace(0, size, parts + 1).astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(edges[:-1], edges[1:])]
+
+
+def chunk_aggregate(values, mask, start, stop):
+    '''
+    Creates the aggregate of the finite (and masked) values in the flat range [start, stop) of
+    an array. Aggregates of the chunks given by chunk_bounds are merged with tree_merge.
+    @param values: numeric array of component values
+    @param mask: boolean array with the same shape as values, or None for the whole component
+    @param start: first flat index of the chunk
+    @param stop: flat index after the chunk
+    '''
+    chunk = np.reshape(values, -1)[start:stop]
+    if mask is not None:
+        mask = np.reshape(mask, -1)[start:stop]
+    return gather_aggregate(chunk, mask)[1]
+
+
+def gather_aggregate(values, mask=None):
+    '''
+    Gathers the finite (and masked) values of an array into a compact copy and reduces them
+    into a PartialAggregate. float32 and float64 arrays go through one compiled loop when numba
+    is installed (see USE_NUMBA), other arrays through finite_values and
+    PartialAggregate.from_values.
+    Returns the gathered values and the aggregate.
+    @param values: numeric array of component values
+    @param mask: boolean array with the same shape as values, or None for the whole component
+    '''
+    values = np.asarray(values)
+    if USE_NUMBA and values.dtype in NUMBA_DTYPES:
+        kept, moments = numba_kernels.fused_gather(values, mask)
+        if kept.size == 0:
+            return kept, PartialAggregate()
+        return kept, PartialAggregate(moments['count'], moments['total'], moments['minimum'],
+                                      moments['maximum'], moments['compensation'],
+                                      moments['mean'], moments['m2'])
+    kept = finite_values(values, mask)
+    return kept, PartialAggregate.from_values(kept)
+
+
+def fused_aggregate(values, mask=None, quantiles=()):
+    '''
+    Gathers the finite (and masked) values of an array once, reduces the aggregate from that
+    compact copy and finds the values at the quantiles by partitioning the same copy.
+    Returns the PartialAggregate and the values at the quantiles (NaN if nothing is selected).
+    @param values: numeric array of component values
+    @param mask: boolean array with the same shape as values, or None for the whole component
+    @param quantiles: quantiles of the order statistics, see StatisticPlan
+    '''
+    kept, aggregate = gather_aggregate(values, mask)
+    # partitioning reorders the copy, which is fine since the aggregate is already known
+    return aggregate, quantiles_in_place(kept, quantiles)
+
+
+def fused_statistics(values, mask, plan):
+    '''
+    Computes the statistics of a plan in one pass over the data, see fused_aggregate.
+    Returns the values in the order of the plan, all NaN if nothing is selected.
+    @param values: numeric array of component values
+    @param mask: boolean array with the same shape as values, or None for the whole component
+    @param plan: StatisticPlan of the statistics to compute
+    '''
+    return plan.finish(*fused_aggregate(values, mask, plan.quantiles))
+
+
+def incremental_aggregate(values, aggregate, old_mask, new_mask, quantiles=()):
+    '''
+    Updates the aggregate of the values selected by old_mask so that it describes the values
+    selected by new_mask, by only adding the elements that entered the selection and removing
+    the ones that left it. The extrema are rescanned only if a removed element was the
+    current minimum or maximum. Order statistics have no mergeable state, so they are still
+    found with one selection over the new subset, if there are any.
+    Returns the updated PartialAggregate and the values at the quantiles.
+    @param values: numeric array of component values
+    @param aggregate: PartialAggregate of the values selected by old_mask
+    @param old_mask: boolean mask the aggregate was computed for
+    @param new_mask: boolean mask with the same shape as old_mask
+    @param quantiles: quantiles of the order statistics, see StatisticPlan
+    '''
+    values = np.asarray(values)
+    finite = np.isfinite(values)
+    changed = (old_mask != new_mask) & finite
+
+    updated = aggregate.copy()
+    updated.add(values[changed & new_mask])
+    extrema_known = updated.remove(values[changed & old_mask])
+    if updated.count == 0:
+        return PartialAggregate(), (np.nan,) * len(quantiles)
+    if extrema_known and not quantiles:
+        # nothing left that needs the selected values themselves
+        return updated, ()
+
+    kept = values[finite & new_mask]
+    if not extrema_known:
+        updated.minimum = kept.min()
+        updated.maximum = kept.max()
+    return updated, quantiles_in_place(kept, quantiles)
+
+
+def _root_buffer(values):
+    '''
+    Returns the array that ultimately owns the memory of values
+    @param values: numpy array, possibly a view
+    '''
+    while isinstance(values.base, np.ndarray):
+        values = values.base
+    return values
+
+
+def _strided_columns(flat):
+    '''
+    Returns equally sized flat columns that are evenly spaced fields of one contiguous buffer
+    (for example the columns of a FITS binary table) as a 2-D strided view of that buffer, or
+    None if they are not
+    @param flat: list of 1-D arrays with the same dtype and size
+    '''
+    first = flat[0]
+    if len(flat) > 1 and all(column.dtype == first.dtype and column.strides == first.strides and
+                             column.size == first.size for column in flat):
+        root = _root_buffer(first)
+        addresses = [column.__array_interface__['data'][0] for column in flat]
+        step = addresses[1] - addresses[0]
+        if (root.flags.c_contiguous and step != 0 and
+                all(_root_buffer(column) is root for column in flat) and
+                all(b - a == step for a, b in zip(addresses, addresses[1:]))):
+            start = root.__array_interface__['data'][0]
+            lowest = min(addresses[0], addresses[-1])
+            highest = (max(addresses[0], addresses[-1]) +
+                       (first.size - 1) * first.strides[0] + first.itemsize)
+            if lowest >= start and highest <= start + root.nbytes:
+                return np.lib.stride_tricks.as_strided(first, shape=(len(flat), first.size),
+                                                       strides=(step, first.strides[0]),
+                                                       writeable=False)
+    return None
+
+
+def stack_columns(columns):
+    '''
+    Stacks equally sized columns into a 2-D (n_columns, n_values) array.
+    Columns that are evenly spaced fields of one contiguous buffer (for example the columns
+    of a FITS binary table) are returned as a strided view of that buffer without copying,
+    anything else is copied into a new array.
+    @param columns: list of arrays with the same dtype and size
+    '''
+    flat = [np.reshape(column, -1) for column in columns]
+    stacked = _strided_columns(flat)
+    return np.stack(flat) if stacked is None else stacked
+
+
+def batch_aggregates(columns, quantiles=(), block_bytes=2 ** 28):
+    '''
+    Computes the aggregates of many float columns of one dataset together. The columns
+    are processed in blocks stacked into 2-D arrays, and every moment is a single NumPy
+    reduction along the value axis; the quantiles of the columns of a block are found with
+    one nanquantile call. Columns that are fields of one buffer are viewed in place, others
+    are only stacked one block at a time, and blocks are sized so that the stacked copy and
+    the temporaries of the reductions stay below block_bytes.
+    Returns one (PartialAggregate, values at the quantiles) pair per column.
+    @param columns: list of float arrays with the same size
+    @param quantiles: quantiles of the order statistics, see StatisticPlan
+    @param block_bytes: approximate memory budget of the working arrays of one block
+    '''
+    flat = [np.reshape(column, -1) for column in columns]
+    strided = _strided_columns(flat)
+    n_columns, n_values = len(flat), flat[0].size
+    itemsize = np.result_type(*[column.dtype for column in flat]).itemsize
+    # finiteness mask, working copy, squared deviations and the NaN-filled copy that the
+    # nan-reductions make, plus the stacked copy if the columns are not a strided view
+    per_value = 1 + 3 * itemsize + (itemsize if strided is None else 0)
+    per_block = max(1, block_bytes // max(1, n_values * per_value))
+
+    results = []
+    with warnings.catch_warnings():
+        # all-NaN columns are expected and become NaN statistics below
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        for start in range(0, n_columns, per_block):
+            if strided is None:
+                block = np.stack(flat[start:start + per_block])
+            else:
+                block = strided[start:start + per_block]
+            finite = np.isfinite(block)
+            count = finite.sum(axis=1)
+            work = np.where(finite, block, np.nan)
+            del block, finite
+
+            sum_val = np.nansum(work, axis=1)
+            min_val = np.nanmin(work, axis=1)
+            max_val = np.nanmax(work, axis=1)
+            mean_val = sum_val / np.maximum(count, 1)
+            deviations = work - mean_val[:, None]
+            np.multiply(deviations, deviations, out=deviations)
+            m2_val = np.nansum(deviations, axis=1)
+            del deviations
+            if quantiles:
+                # the quantiles reorder the working copy, so they come last
+                order = np.nanquantile(work, quantiles, axis=1, overwrite_input=True)
+
+            for i in range(work.shape[0]):
+                if count[i] == 0:
+                    results.append((PartialAggregate(), (np.nan,) * len(quantiles)))
+                    continue
+                aggregate = PartialAggregate(count[i], sum_val[i], min_val[i], max_val[i],
+                                             mean=mean_val[i], m2=m2_val[i])
+                results.append((aggregate, tuple(order[:, i]) if quantiles else ()))
+
+    return results
+
+
+def _segment_aggregates(grouped, starts, ends, quantiles):
+    '''
+    Computes the aggregate and order statistics of consecutive segments of a flat array of
+    finite values, where segment i is grouped[starts[i]:ends[i]]. Segments are reordered in
+    place.
+    @param grouped: flat array of finite values sorted by group
+    @param starts: start offset of each segment
+    @param ends: end offset of each segment
+    @param quantiles: quantiles of the order statistics, see StatisticPlan
+    '''
+    results = []
+    for start, end in zip(starts, ends):
+        segment = grouped[start:end]
+        aggregate = PartialAggregate.from_values(segment)
+        results.append((aggregate, quantiles_in_place(segment, quantiles)))
+    return results
+
+
+def grouped_aggregates(values, masks, quantiles=(), chunk_bytes=2 ** 26):
+    '''
+    Computes the aggregates and order statistics of one component for many subsets at once.
+    When the subsets are disjoint they are encoded as one label array and the values are
+    gathered, grouped by label and reduced segment by segment in a single pass. Overlapping
+    subsets use a chunked mask-matrix product for the counts, sums and second moments and
+    masked reductions for the extrema, so they cost one pass whatever their number; only
+    their order statistics need the values of each subset gathered.
+    Returns one (PartialAggregate, values at the quantiles) pair per mask.
+    @param values: numeric array of component values
+    @param masks: list of boolean arrays with the same shape as values
+    @param quantiles: quantiles of the order statistics, see StatisticPlan
+    @param chunk_bytes: memory budget of the mask matrix chunks in the overlapping case
+    '''
+    values = np.reshape(np.asarray(values), -1)
+    finite = np.isfinite(values)
+    n_groups = len(masks)
+
+    # Try to build a label array, which only works if no element is in two subsets
+    labels = np.full(values.size, -1, dtype=np.int16 if n_groups < 2 ** 15 else np.int32)
+    disjoint = True
+    for i, mask in enumerate(masks):
+        mask = np.reshape(mask, -1)
+        if np.any(labels[mask] >= 0):
+            disjoint = False
+            break
+        labels[mask] = i
+
+    if disjoint:
+        selected = finite & (labels >= 0)
+        labels = labels[selected]
+        # stable sort of small integers is a linear-time radix sort
+        order = np.argsort(labels, kind='stable')
+        grouped = values[selected][order]
+        counts = np.bincount(labels, minlength=n_groups)
+        ends = np.cumsum(counts)
+        return _segment_aggregates(grouped, ends - counts, ends, quantiles)
+
+    filled = np.where(finite, values, 0)
+    # the second moments are accumulated about the mean of the component, so that large
+    # offsets do not cancel when the sums of squares are turned into deviations
+    n_finite = np.count_nonzero(finite)
+    center = filled.sum() / n_finite if n_finite else 0.
+    counts = np.zeros(n_groups, dtype=np.int64)
+    sums = np.zeros(n_groups)
+    shifted_sums = np.zeros(n_groups)
+    shifted_squares = np.zeros(n_groups)
+    mins = np.full(n_groups, np.inf)
+    maxs = np.full(n_groups, -np.inf)
+    step = max(1, chunk_bytes // (8 * n_groups))
+    for start in range(0, values.size, step):
+        chunk = slice(start, start + step)
+        matrix = np.stack([np.reshape(mask, -1)[chunk] for mask in masks]) & finite[chunk]
+        counts += matrix.sum(axis=1)
+        weights = matrix.astype(float)
+        sums += weights @ filled[chunk]
+        deviations = filled[chunk] - center
+        shifted_sums += weights @ deviations
+        shifted_squares += weights @ (deviations * deviations)
+        mins = np.minimum(mins, np.where(matrix, filled[chunk], np.inf).min(axis=1))
+        maxs = np.maximum(maxs, np.where(matrix, filled[chunk], -np.inf).max(axis=1))
+
+    results = []
+    for i, mask in enumerate(masks):
+        if counts[i] == 0:
+            results.append((PartialAggregate(), (np.nan,) * len(quantiles)))
+            continue
+        offset = shifted_sums[i] / counts[i]
+        m2 = max(0., shifted_squares[i] - shifted_sums[i] * offset)
+        aggregate = PartialAggregate(counts[i], sums[i], mins[i], maxs[i], mean=center + offset, m2=m2)
+        order = (np.nan,) * len(quantiles)
+        if quantiles:
+            # only the order statistics need the values of the subset gathered
+            order = quantiles_in_place(values[finite & np.reshape(mask, -1)], quantiles)
+        results.append((aggregate, order))
+    return results
+
+
+def grouped_statistics(values, masks, plan, chunk_bytes=2 ** 26):
+    '''
+    Computes the statistics of a plan for one component and many subsets at once, see
+    grouped_aggregates. Returns one tuple per mask, in the order of the plan.
+    @param values: numeric array of component values
+    @param masks: list of boolean arrays with the same shape as values
+    @param plan: StatisticPlan of the statistics to compute
+    @param chunk_bytes: memory budget of the mask matrix chunks in the overlapping case
+    '''
+    return [plan.finish(aggregate, order)
+            for aggregate, order in grouped_aggregates(values, masks, plan.quantiles, chunk_bytes)]
@@ -0,0 +1,225 @@
+import warnings
+
+import numpy as np
+
+# What a statistic needs from the values of a row. Moment statistics are derived from the
+# PartialAggregate of the fused pass (count, compensated sum, extrema, Welford moments), which
+# every row computes anyway and which is merged exactly across chunks. Order statistics are
+# derived from values at given quantiles, all found with one partition of the gathered values.
+MOMENTS = 'moments'
+ORDER = 'order'
+NEEDS = (MOMENTS, ORDER)
+
+# Entry point group through which installed packages register statistics
+ENTRY_POINT_GROUP = 'glue_statistics.statistics'
+
+
+class Statistic(object):
+    '''
+    A statistic the viewer can show as a column. Its reducer turns the partial state of a row
+    into a value: the PartialAggregate of the row for moment statistics, the values at its
+    quantiles for order statistics, e.g. Statistic('IQR', lambda q1, q3: q3 - q1, ORDER,
+    quantiles=(0.25, 0.75)). Reducers run on the GUI thread on these few numbers, so they can
+    be any Python function.
+    A statistic cannot declare partial state of its own: the only mergeable state is the
+    PartialAggregate (count, sum, minimum, maximum, mean and second moment of the finite
+    values), which is what chunks, workers, dask, streamed files and incremental subset
+    updates carry and merge. Statistics needing anything else, such as the number of NaNs or
+    the third and fourth moments, cannot be registered as reducers.
+    '''
+
+    def __init__(self, name, reducer, needs=MOMENTS, quantiles=(), default=True, glue_name=None):
+        '''
+        @param name: name of the column, unique among the registered statistics
+        @param reducer: function of the PartialAggregate (MOMENTS) or of the values at each
+                        quantile (ORDER) returning the value of the statistic
+        @param needs: MOMENTS or ORDER
+        @param quantiles: quantiles (between 0 and 1) an ORDER statistic is computed from
+        @param default: True if the column is shown in new viewers
+        @param glue_name: name of the statistic in glue's compute_statistic, used for the
+                          components the fused reductions cannot read (e.g. datetimes)
+        '''
+        if needs not in NEEDS:
+            raise ValueError("needs should be one of %s" % ", ".join(NEEDS))
+        quantiles = tuple(float(q) for q in quantiles)
+        if needs == ORDER and not quantiles:
+            raise ValueError("Order statistic %s needs at least one quantile" % name)
+        if any(not 0 <= q <= 1 for q in quantiles):
+            raise ValueError("Quantiles should be between 0 and 1")
+        self.name = name
+        self.reducer = reducer
+        self.needs = needs
+        self.quantiles = quantiles if needs == ORDER else ()
+        self.default = default
+        self.glue_name = glue_name
+
+    def reduce(self, aggregate, order):
+        '''
+        Returns the value of the statistic for a row
+        @param aggregate: PartialAggregate of the row
+        @param order: dict quantile -> value of the row, see StatisticPlan
+        '''
+        if self.needs == MOMENTS:
+            return self.reducer(aggregate)
+        return self.reducer(*[order[q] for q in self.quantiles])
+
+    def __repr__(self):
+        return 'Statistic(%r, needs=%r)' % (self.name, self.needs)
+
+
+class StatisticRegistry(object):
+    '''
+    The statistics available in the viewer, in the order of their columns. Statistics are
+    added with add or with the registry as a decorator of their reducer:
+
+        @statistic_registry('Range')
+        def value_range(aggregate):
+            return aggregate.maximum - aggregate.minimum
+
+    from a glue config.py, a glue plugin, or a package declaring a function in the
+    glue_statistics.statistics entry point group, which is called with the registry.
+    '''
+
+    def __init__(self):
+        self._statistics = []
+        self._loaded = False
+
+    def __iter__(self):
+        return iter(list(self._statistics))
+
+    def __len__(self):
+        return len(self._statistics)
+
+    def __contains__(self, name):
+        return any(statistic.name == name for statistic in self._statistics)
+
+    def add(self, statistic):
+        '''
+        Registers a statistic, replacing a statistic registered before with the same name
+        @param statistic: Statistic to register
+        '''
+        for i, registered in enumerate(self._statistics):
+            if registered.name == statistic.name:
+                self._statistics[i] = statistic
+                return statistic
+        self._statistics.append(statistic)
+        return statistic
+
+    def __call__(self, name, needs=MOMENTS, quantiles=(), default=True):
+        '''
+        Decorator registering a reducer as a statistic, see Statistic
+        '''
+        def decorator(reducer):
+            self.add(Statistic(name, reducer, needs, quantiles, default))
+            return reducer
+        return decorator
+
+    def get(self, name):
+        '''
+        Returns the statistic registered with a name, or None
+        @param name: name of the statistic
+        '''
+        return next((statistic for statistic in self._statistics if statistic.name == name), None)
+
+    def names(self):
+        return [statistic.name for statistic in self._statistics]
+
+    def defaults(self):
+        '''
+        Returns the statistics shown in new viewers
+        '''
+        return [statistic for statistic in self._statistics if statistic.default]
+
+    def load_plugins(self):
+        '''
+        Calls the functions registered in the glue_statistics.statistics entry point group,
+        once. A plugin that fails to load is skipped with a warning.
+        '''
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            from importlib.metadata import entry_points
+        except ImportError:
+            return
+        found = entry_points()
+        if hasattr(found, 'select'):
+            found = found.select(group=ENTRY_POINT_GROUP)
+        else:
+            found = found.get(ENTRY_POINT_GROUP, [])
+        for entry_point in found:
+            try:
+                entry_point.load()(self)
+            except Exception as error:
+                warnings.warn("Could not load statistics from %s: %s" % (entry_point.name, error))
+
+
+def percentile(q, name=None, default=False):
+    '''
+    Returns an order statistic giving the q-th percentile, e.g. percentile(90), interpolated
+    linearly between the closest values like numpy.percentile
+    @param q: percentile between 0 and 100
+    @param name: name of the column, "P90" for the 90th percentile by default
+    @param default: True if the column is shown in new viewers
+    '''
+    return Statistic(name or 'P%g' % q, lambda value: value, ORDER, quantiles=(q / 100.,), default=default)
+
+
+class StatisticPlan(object):
+    '''
+    Groups the selected statistics by what they need, so that computing a row costs one
+    fused pass for all the moment statistics and, only if order statistics are selected,
+    one partition of the gathered values for all their quantiles together, however many
+    statistics are selected. Jobs receive the quantiles of the plan and return the partial
+    state of their rows, finish turns it into the values of the columns.
+    '''
+
+    def __init__(self, statistics):
+        '''
+        @param statistics: selected Statistic objects, in the order of their columns
+        '''
+        self.statistics = tuple(statistics)
+        self.names = tuple(statistic.name for statistic in self.statistics)
+        self.quantiles = tuple(sorted(set(q for statistic in self.statistics for q in statistic.quantiles)))
+
+    def __len__(self):
+        return len(self.statistics)
+
+    def __eq__(self, other):
+        return isinstance(other, StatisticPlan) and self.statistics == other.statistics
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.names)
+
+    def finish(self, aggregate, order):
+        '''
+        Returns the values of the statistics of a row, all NaN if nothing is selected. A
+        statistic whose reducer fails is NaN.
+        @param aggregate: PartialAggregate of the row
+        @param order: values at the quantiles of the plan, in the order of self.quantiles
+        '''
+        if aggregate.count == 0:
+            return (np.nan,) * len(self.statistics)
+        order = dict(zip(self.quantiles, order))
+        values = []
+        with np.errstate(all='ignore'):
+            for statistic in self.statistics:
+                try:
+                    values.append(statistic.reduce(aggregate, order))
+                except Exception:
+                    values.append(np.nan)
+        return tuple(values)
+
+
+statistic_registry = StatisticRegistry()
+
+# Built-in statistics
+statistic_registry.add(Statistic('Mean', lambda aggregate: aggregate.sum / aggregate.count, glue_name='mean'))
+statistic_registry.add(Statistic('Median', lambda median: median, ORDER, quantiles=(0.5,), glue_name='median'))
+statistic_registry.add(Statistic('Minimum', lambda aggregate: aggregate.minimum, glue_name='minimum'))
+statistic_registry.add(Statistic('Maximum', lambda aggregate: aggregate.maximum, glue_name='maximum'))
+statistic_registry.add(Statistic('Sum', lambda aggregate: aggregate.sum, glue_name='sum'))
+statistic_registry.add(Statistic('Std', lambda aggregate: np.sqrt(aggregate.variance()), default=False))
@@ -0,0 +1,255 @@
+import os
+import mmap
+import hashlib
+
+import numpy as np
+
+from glue_statistics.reductions import PartialAggregate, finite_values, gather_aggregate, quantile_ranks, \
+    interpolate, quantiles_in_place
+
+# Default memory budget of one block read from a file
+STREAM_CHUNK_BYTES = 256 * 1024 ** 2
+
+# Number of histogram bins per refinement pass of streaming_quantiles
+MEDIAN_BINS = 4096
+
+
+def _mapped_buffer(values):
+    '''
+    Returns the mmap object an array is a view of, or None
+    @param values: numpy array
+    '''
+    base = values
+    while isinstance(base, np.ndarray):
+        base = base.base
+    return base if isinstance(base, mmap.mmap) else None
+
+
+def is_file_backed(values):
+    '''
+    Returns True if the values of a component are read from a file on access rather than held
+    in memory: memory-mapped arrays (np.memmap or arrays over an mmap, which is how astropy
+    maps FITS HDUs) and lazily read array-likes such as h5py datasets
+    @param values: raw data of a component
+    '''
+    if isinstance(values, np.memmap):
+        return True
+    if isinstance(values, np.ndarray):
+        return _mapped_buffer(values) is not None
+    return hasattr(values, 'shape') and hasattr(values, 'dtype') and hasattr(values, '__getitem__')
+
+
+def mapped_file(values):
+    '''
+    Returns (filename, byte offset) of the values of an np.memmap in its file, or None. Views
+    of a memmap keep the offset of the memmap they were taken from, so the offset is found
+    from the address of the view in the mapping instead.
+    @param values: numpy array
+    '''
+    if not isinstance(values, np.memmap):
+        return None
+    root = values
+    while isinstance(root.base, np.ndarray):
+        root = root.base
+    if not isinstance(root, np.memmap) or not root.filename or root.offset is None:
+        return None
+    address = values.__array_interface__['data'][0] - root.__array_interface__['data'][0]
+    return root.filename, root.offset + address
+
+
+def file_fingerprint(values):
+    '''
+    Fingerprint of a file-backed array that does not read its values: the file, position,
+    shape, dtype and modification time, or None if the file is not known (arrays over an mmap
+    that is not an np.memmap do not tell which file they map)
+    @param values: file-backed array, see is_file_backed
+    '''
+    mapped = mapped_file(values)
+    if mapped is not None:
+        filename, offset = mapped
+    elif hasattr(values, 'file') and hasattr(values, 'name'):
+        # h5py dataset
+        filename, offset = getattr(values.file, 'filename', None), values.name
+    else:
+        return None
+    try:
+        modified = os.path.getmtime(filename)
+    except (OSError, TypeError):
+        return None
+    description = '%s:%s:%r:%s:%r' % (filename, offset, tuple(values.shape), np.dtype(values.dtype).str, modified)
+    return hashlib.blake2b(description.encode('utf8'), digest_size=20).hexdigest()
+
+
+def _release(values):
+    '''
+    Drops the pages of a memory-mapped array that were read so far, so that streaming over a
+    file does not keep it resident. The pages are read again from the file if needed.
+    @param values: file-backed array
+    '''
+    buffer = _mapped_buffer(values) if isinstance(values, np.ndarray) else None
+    if buffer is not None and hasattr(buffer, 'madvise') and hasattr(mmap, 'MADV_DONTNEED'):
+        try:
+            buffer.madvise(mmap.MADV_DONTNEED)
+        except (OSError, ValueError):
+            pass
+
+
+def iter_blocks(values, chunk_bytes=STREAM_CHUNK_BYTES, index=()):
+    '''
+    Yields (index, block) pairs covering a file-backed array in its storage order, each block
+    holding at most about chunk_bytes. Blocks are slices along the leading axis, aligned on the
+    native chunks of HDF5 datasets so that every chunk is read once; rows that are larger than
+    the budget are split further along the next axes. values[index] is block, and the same
+    index selects the matching part of a subset mask.
+    @param values: file-backed array, see is_file_backed
+    @param chunk_bytes: memory budget of a block
+    @param index: leading integer indices of the part of values to stream, used by the recursion
+    '''
+    shape = values.shape[len(index):]
+    if len(shape) == 0:
+        yield index, np.asarray(values[index])
+        return
+    row_bytes = int(np.prod(shape[1:], dtype=np.int64)) * np.dtype(values.dtype).itemsize
+    if len(shape) > 1 and row_bytes > chunk_bytes:
+        # values is only indexed when a block is read, indexing h5py datasets reads them
+        for i in range(shape[0]):
+            yield from iter_blocks(values, chunk_bytes, index + (i,))
+        return
+
+    step = max(1, chunk_bytes // max(1, row_bytes))
+    native = getattr(values, 'chunks', None)
+    axis = len(index)
+    if isinstance(native, tuple) and len(native) > axis and step > native[axis]:
+        step -= step % native[axis]
+    for start in range(0, shape[0], step):
+        part = index + (slice(start, start + step),)
+        yield part, np.asarray(values[part])
+        _release(values)
+
+
+def _mask_block(mask, index):
+    return None if mask is None else np.asarray(mask[index])
+
+
+def streaming_aggregate(values, mask=None, chunk_bytes=STREAM_CHUNK_BYTES):
+    '''
+    Reduces a file-backed array block by block into a PartialAggregate, so the memory used
+    stays within chunk_bytes whatever the size of the file
+    @param values: file-backed array, see is_file_backed
+    @param mask: boolean array with the same shape as values, or None for the whole component
+    @param chunk_bytes: memory budget of a block
+    '''
+    aggregate = PartialAggregate()
+    for index, block in iter_blocks(values, chunk_bytes):
+        aggregate.merge(gather_aggregate(block, _mask_block(mask, index))[1])
+    return aggregate
+
+
+def _select_rank(values, mask, rank, low, high, chunk_bytes):
+    '''
+    Returns the value of the given rank (0 based) among the finite selected values, knowing
+    that it lies in [low, high]. Each pass counts the values of the current range in
+    MEDIAN_BINS histogram bins and narrows the range to the bin holding the rank, until the
+    values of that bin fit in the memory budget and are selected exactly. Refining stops early
+    when every value left in the range is the same, e.g. zero padding or integer data with more
+    ties than the budget holds, since that value is the one of the rank.
+    @param values: file-backed array
+    @param mask: boolean array with the same shape as values, or None
+    @param rank: rank of the wanted value among the finite selected values
+    @param low: lower bound of the value
+    @param high: upper bound of the value
+    @param chunk_bytes: memory budget of a block, also bounds the values gathered at the end
+    '''
+    below = 0
+    # the range is [low, high) except at the top of the data, where it is [low, high]
+    closed = True
+    max_gathered = max(1, chunk_bytes // 8)
+    while True:
+        if low >= high:
+            return low
+        edges = np.linspace(low, high, MEDIAN_BINS + 1)
+        counts = np.zeros(MEDIAN_BINS, dtype=np.int64)
+        smallest, largest = np.inf, -np.inf
+        for index, block in iter_blocks(values, chunk_bytes):
+            kept = finite_values(block, _mask_block(mask, index)).astype(float, copy=False)
+            kept = kept[(kept >= low) & ((kept < high) | (closed & (kept == high)))]
+            if kept.size:
+                smallest, largest = min(smallest, kept.min()), max(largest, kept.max())
+            counts += np.histogram(kept, edges)[0]
+        if smallest == largest:
+            # the range only holds ties, no bin can separate them
+            return smallest
+
+        cumulative = below + np.cumsum(counts)
+        b = int(np.searchsorted(cumulative, rank, side='right'))
+        below = int(cumulative[b - 1]) if b else below
+        closed = closed and b == MEDIAN_BINS - 1
+        low, high = edges[b], edges[b + 1]
+        if counts[b] <= max_gathered:
+            break
+        if low == high:
+            # the bin is too narrow to be split any further, its values all equal low
+            return low
+
+    gathered = []
+    for index, block in iter_blocks(values, chunk_bytes):
+        kept = finite_values(block, _mask_block(mask, index)).astype(float, copy=False)
+        gathered.append(kept[(kept >= low) & ((kept < high) | (closed & (kept == high)))])
+    gathered = np.concatenate(gathered)
+    gathered.partition(rank - below)
+    return gathered[rank - below]
+
+
+def streaming_quantiles(values, mask, aggregate, quantiles, chunk_bytes=STREAM_CHUNK_BYTES):
+    '''
+    Exact values at the given quantiles of a file-backed array, found with a few histogram
+    refinement passes over the file per rank instead of loading it, see _select_rank. Ranks
+    shared by several quantiles are selected once. Returns NaN values if nothing is selected.
+    @param values: file-backed array, see is_file_backed
+    @param mask: boolean array with the same shape as values, or None
+    @param aggregate: PartialAggregate of the selected values, gives their count and extrema
+    @param quantiles: quantiles of the order statistics, see StatisticPlan
+    @param chunk_bytes: memory budget of a block
+    '''
+    count = int(aggregate.count)
+    if not quantiles or count == 0:
+        return (np.nan,) * len(quantiles)
+    # small selections are simply gathered
+    if count * 8 <= chunk_bytes:
+        kept = np.concatenate([finite_values(block, _mask_block(mask, index))
+                               for index, block in iter_blocks(values, chunk_bytes)])
+        return quantiles_in_place(kept, quantiles)
+    low, high = float(aggregate.minimum), float(aggregate.maximum)
+    ranks = quantile_ranks(count, quantiles)
+    selected = dict((rank, _select_rank(values, mask, rank, low, high, chunk_bytes))
+                    for rank in sorted(set(rank for first, last, fraction in ranks for rank in (first, last))))
+    return tuple(interpolate(selected[first], selected[last], fraction) for first, last, fraction in ranks)
+
+
+def streaming_statistics(values, mask, plan, chunk_bytes=STREAM_CHUNK_BYTES):
+    '''
+    Computes the statistics of a plan for a file-backed array with bounded memory: one pass
+    for the fused reduction, then a few passes for the exact order statistics if the plan has
+    any. Returns the values in the order of the plan, all NaN if nothing is selected.
+    @param values: file-backed array, see is_file_backed
+    @param mask: boolean array with the same shape as values, or None for the whole component
+    @param plan: StatisticPlan of the statistics to compute
+    @param chunk_bytes: memory budget of a block
+    '''
+    aggregate = streaming_aggregate(values, mask, chunk_bytes)
+    return plan.finish(aggregate, streaming_quantiles(values, mask, aggregate, plan.quantiles, chunk_bytes))
+
+
+def stream_job(key, values, mask, quantiles, chunk_bytes):
+    '''
+    Worker job computing the accumulator and order statistics of a file-backed row, see
+    streaming_statistics. Returns [(key, PartialAggregate, values at the quantiles)], like
+    dataset_job.
+    @param key: key of the row
+    @param values: file-backed array
+    @param mask: boolean subset mask, or None for the whole component
+    @param quantiles: quantiles of the order statistics, see StatisticPlan
+    @param chunk_bytes: memory budget of a block
+    '''
+    aggregate = streaming_aggregate(values, mask, chunk_bytes)
+    return [(key, aggregate, streaming_quantiles(values, mask, aggregate, quantiles, chunk_bytes))]
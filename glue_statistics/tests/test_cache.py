@@ -0,0 +1,28 @@
+from glue_statistics.cache import subset_state_fingerprint
+
+
+class FunctionState(object):
+
+    def __init__(self, function):
+        self.function = function
+
+
+def make_threshold(limit):
+    return lambda x: x > limit
+
+
+def test_functions_are_fingerprinted_by_code_and_closure():
+    first = subset_state_fingerprint(FunctionState(lambda x: x > 1))
+    second = subset_state_fingerprint(FunctionState(lambda x: x < 1))
+    assert first != second
+    assert subset_state_fingerprint(FunctionState(make_threshold(1))) != \
+        subset_state_fingerprint(FunctionState(make_threshold(2)))
+    assert subset_state_fingerprint(FunctionState(make_threshold(1))) == \
+        subset_state_fingerprint(FunctionState(make_threshold(1)))
+    assert subset_state_fingerprint(FunctionState(make_threshold(1)), shareable=True) is not None
+
+
+def test_bound_builtins_are_not_shareable():
+    state = FunctionState([1, 2].__contains__)
+    assert subset_state_fingerprint(state) != subset_state_fingerprint(FunctionState([3].__contains__))
+    assert subset_state_fingerprint(state, shareable=True) is None
@@ -0,0 +1,13 @@
+import pytest
+
+from glue_statistics.cost import CostModel
+
+
+def test_shared_subset_mask_is_counted_once():
+    model = CostModel()
+    with_mask = [('memory', 1000, 8, ('state', 'data'))] * 4
+    without_mask = [('memory', 1000, 8, None)] * 4
+    shared = model.estimate(with_mask, 1, 2 ** 20)
+    plain = model.estimate(without_mask, 1, 2 ** 20)
+    assert shared.seconds - plain.seconds == pytest.approx(1000 * model.mask_seconds)
+    assert shared.memory - plain.memory == 1000
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from glue_statistics import reductions
+from glue_statistics.reductions import chunk_aggregate, chunk_bounds, tree_merge, gather_aggregate, \
+    fused_statistics
+from glue_statistics.registry import StatisticPlan, percentile, statistic_registry
+
+pytest.importorskip('numba')
+
+PLAN = StatisticPlan(list(statistic_registry) + [percentile(90)])
+
+
+def make_values(dtype):
+    rng = np.random.default_rng(0)
+    values = rng.normal(1000, 50, size=(100, 200))
+    if np.dtype(dtype).kind == 'f':
+        values[3, ::7] = np.nan
+        values[5, 10] = np.inf
+        values[6, 20] = -np.inf
+    return values.astype(dtype)
+
+
+def make_masks(values):
+    rng = np.random.default_rng(1)
+    return [None, rng.random(values.shape) < 0.3, np.zeros(values.shape, dtype=bool)]
+
+
+def both_backends(monkeypatch, function):
+    '''
+    Returns the results of function with the numba kernels and with NumPy
+    '''
+    results = []
+    for use_numba in (True, False):
+        monkeypatch.setattr(reductions, 'USE_NUMBA', use_numba)
+        results.append(function())
+    return results
+
+
+def tolerance(dtype):
+    # NumPy sums float32 values in float32, the kernels in float64
+    return 1e-5 if dtype == np.float32 else 1e-10
+
+
+def assert_same_aggregate(compiled, plain, rtol=1e-10):
+    assert compiled.count == plain.count
+    np.testing.assert_allclose([compiled.sum, compiled.mean, compiled.variance()],
+                               [plain.sum, plain.mean, plain.variance()], rtol=rtol)
+    assert (compiled.minimum, compiled.maximum) == (plain.minimum, plain.maximum)
+
+
+# float16 and long double are not supported by the kernels and always use the NumPy path
+@pytest.mark.parametrize('dtype', [np.float64, np.float32, np.int64, np.float16, np.longdouble])
+def test_gather_aggregate(monkeypatch, dtype):
+    values = make_values(dtype)
+    for mask in make_masks(values):
+        compiled, plain = both_backends(monkeypatch, lambda: gather_aggregate(values, mask))
+        np.testing.assert_array_equal(np.sort(compiled[0]), np.sort(plain[0]))
+        assert_same_aggregate(compiled[1], plain[1], tolerance(dtype))
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32, np.int64])
+def test_fused_statistics(monkeypatch, dtype):
+    values = make_values(dtype)
+    for mask in make_masks(values):
+        compiled, plain = both_backends(monkeypatch, lambda: fused_statistics(values, mask, PLAN))
+        np.testing.assert_allclose(compiled, plain, rtol=tolerance(dtype), equal_nan=True)
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32, np.int64])
+def test_chunk_merge(monkeypatch, dtype):
+    values = make_values(dtype)
+    for mask in make_masks(values):
+        def merged():
+            return tree_merge([chunk_aggregate(values, mask, start, stop)
+                               for start, stop in chunk_bounds(values.size, 7)])
+        compiled, plain = both_backends(monkeypatch, merged)
+        assert_same_aggregate(compiled, plain, tolerance(dtype))
+        # merging the chunks matches reducing the values at once
+        assert_same_aggregate(compiled, gather_aggregate(values, mask)[1], tolerance(dtype))
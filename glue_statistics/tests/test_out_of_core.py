@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from glue_statistics.out_of_core import dask_aggregate
+
+da = pytest.importorskip('dask.array')
+
+
+def test_variance_of_offset_values():
+    rng = np.random.default_rng(0)
+    values = 1e8 + rng.normal(size=200000)
+    values[::101] = np.nan
+    mask = rng.random(values.size) < 0.5
+    for selection in (None, mask):
+        aggregate, order = dask_aggregate(da.from_array(values, chunks=30000), selection, (0.5,))
+        kept = values[np.isfinite(values) & (True if selection is None else selection)]
+        assert aggregate.count == kept.size
+        np.testing.assert_allclose(aggregate.sum, kept.sum())
+        np.testing.assert_allclose(aggregate.variance(), kept.var(), rtol=1e-6)
+        assert (aggregate.minimum, aggregate.maximum) == (kept.min(), kept.max())
+        np.testing.assert_allclose(order, np.median(kept), rtol=1e-6)
+
+
+def test_empty_selection():
+    values = da.from_array(np.arange(100.), chunks=30)
+    aggregate, order = dask_aggregate(values, np.zeros(100, dtype=bool), (0.5,))
+    assert aggregate.count == 0 and np.isnan(order[0])
+    aggregate, order = dask_aggregate(da.from_array(np.full(100, np.nan), chunks=30), None, (0.5,))
+    assert aggregate.count == 0 and np.isnan(order[0])
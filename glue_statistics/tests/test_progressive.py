@@ -0,0 +1,21 @@
+import numpy as np
+
+from glue_statistics.progressive import draw_blocks, sample_blocks
+
+
+def test_sample_blocks_are_sorted_and_disjoint():
+    ranges = sample_blocks((100000, 10), sample_size=5000, blocks=20, seed=1)
+    assert all(start < stop for start, stop in ranges)
+    assert all(previous[1] < start for previous, (start, stop) in zip(ranges, ranges[1:]))
+    assert 0 < sum(stop - start for start, stop in ranges) * 10 <= 5000
+
+
+def test_draw_blocks_of_a_memmap(tmp_path):
+    values = np.memmap(str(tmp_path / 'values.dat'), dtype=np.float32, mode='w+', shape=(20000, 50))
+    values[:] = np.arange(values.size, dtype=np.float32).reshape(values.shape) % 97
+    mask = np.zeros(values.shape, dtype=bool)
+    mask[:, ::2] = True
+    estimate = draw_blocks(values, mask, sample_size=10000, blocks=8, seed=2)
+    assert estimate.size == values.size
+    np.testing.assert_array_equal(estimate.values, values.ravel()[estimate.indices])
+    np.testing.assert_array_equal(estimate.kept, mask.ravel()[estimate.indices])
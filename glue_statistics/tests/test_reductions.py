@@ -0,0 +1,55 @@
+import warnings
+
+import numpy as np
+
+from glue_statistics.reductions import PartialAggregate, batch_aggregates, grouped_aggregates
+
+
+def test_remove_unsigned_values():
+    values = np.arange(1, 101, dtype=np.uint16)
+    aggregate = PartialAggregate.from_values(values)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        aggregate.remove(values[60:])
+    expected = values[:60].astype(float)
+    assert aggregate.count == 60
+    assert aggregate.sum == expected.sum()
+    np.testing.assert_allclose(aggregate.mean, expected.mean())
+    np.testing.assert_allclose(aggregate.variance(), expected.var())
+
+
+def test_grouped_aggregates_of_overlapping_subsets():
+    rng = np.random.default_rng(0)
+    values = 1e6 + rng.normal(size=10000)
+    values[::97] = np.nan
+    masks = [rng.random(10000) < 0.5 for i in range(5)] + [np.zeros(10000, dtype=bool)]
+    for quantiles in ((), (0.5,)):
+        results = grouped_aggregates(values, masks, quantiles, chunk_bytes=8000)
+        for mask, (aggregate, order) in zip(masks, results):
+            kept = values[mask & np.isfinite(values)]
+            if kept.size == 0:
+                assert aggregate.count == 0
+                continue
+            assert aggregate.count == kept.size
+            np.testing.assert_allclose(aggregate.sum, kept.sum())
+            np.testing.assert_allclose(aggregate.mean, kept.mean())
+            np.testing.assert_allclose(aggregate.variance(), kept.var(), rtol=1e-8)
+            assert (aggregate.minimum, aggregate.maximum) == (kept.min(), kept.max())
+            np.testing.assert_allclose(order, np.quantile(kept, quantiles))
+
+
+def test_batch_aggregates_of_separate_columns_in_small_blocks():
+    rng = np.random.default_rng(3)
+    columns = [rng.normal(i, 1 + i, 1000) for i in range(5)]
+    columns[2][::7] = np.nan
+    columns[4][:] = np.nan
+    # a budget of about one column per block
+    results = batch_aggregates(columns, quantiles=(0.5,), block_bytes=30000)
+    assert len(results) == 5
+    for column, (aggregate, order) in zip(columns[:4], results):
+        finite = column[np.isfinite(column)]
+        assert aggregate.count == finite.size
+        np.testing.assert_allclose(aggregate.mean, finite.mean())
+        np.testing.assert_allclose(aggregate.variance(), finite.var())
+        np.testing.assert_allclose(order, (np.median(finite),))
+    assert results[4][0].count == 0
@@ -0,0 +1,51 @@
+import numpy as np
+
+from glue_statistics.reductions import gather_aggregate
+from glue_statistics.streaming import streaming_quantiles, file_fingerprint
+
+
+def memmap(tmp_path, values):
+    mapped = np.memmap(str(tmp_path / 'values.dat'), dtype=values.dtype, mode='w+', shape=values.shape)
+    mapped[:] = values
+    mapped.flush()
+    return np.memmap(str(tmp_path / 'values.dat'), dtype=values.dtype, mode='r', shape=values.shape)
+
+
+def aggregate_of(values, mask=None):
+    return gather_aggregate(np.asarray(values), mask)[1]
+
+
+def test_quantiles_of_ties(tmp_path):
+    # far more equal values than the budget of 1000 values can gather
+    values = np.zeros(100000)
+    values[-10:] = 1
+    values = memmap(tmp_path, values)
+    result = streaming_quantiles(values, None, aggregate_of(values), (0.25, 0.5, 0.75), chunk_bytes=8000)
+    assert result == (0, 0, 0)
+
+
+def test_quantiles_of_padded_values(tmp_path):
+    rng = np.random.default_rng(0)
+    values = np.zeros(100000)
+    values[:30000] = rng.normal(size=30000)
+    values[30000:40000] = 7
+    values = memmap(tmp_path, values)
+    quantiles = (0.1, 0.5, 0.65, 0.9)
+    result = streaming_quantiles(values, None, aggregate_of(values), quantiles, chunk_bytes=8000)
+    np.testing.assert_allclose(result, np.quantile(np.asarray(values), quantiles))
+
+
+def test_quantiles_of_integer_ties_with_mask(tmp_path):
+    rng = np.random.default_rng(1)
+    values = memmap(tmp_path, rng.integers(0, 3, size=100000))
+    mask = rng.random(100000) < 0.7
+    result = streaming_quantiles(values, mask, aggregate_of(values, mask), (0.5, 0.99), chunk_bytes=8000)
+    np.testing.assert_allclose(result, np.quantile(np.asarray(values)[mask], (0.5, 0.99)))
+
+
+def test_fingerprint_of_views(tmp_path):
+    values = memmap(tmp_path, np.arange(1000.))
+    assert file_fingerprint(values[:100]) != file_fingerprint(values[100:200])
+    assert file_fingerprint(values[100:200]) == file_fingerprint(values[100:200])
+    # the file of arrays over a bare mmap is not known
+    assert file_fingerprint(np.asarray(values)) is None
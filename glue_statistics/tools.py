@@ -1,6 +1,7 @@
 from glue_statistics.icons import NOTATION_LOGO, EXPORT_LOGO, \
     CALCULATE_LOGO, SORT_LOGO, SETTINGS_LOGO, INSTRUCTIONS_LOGO, \
-    HOME_LOGO, SAVE_LOGO, EXPAND_LOGO, COLLAPSE_LOGO, CUSTOM_COLUMN_LOGO
+    HOME_LOGO, SAVE_LOGO, EXPAND_LOGO, COLLAPSE_LOGO, CUSTOM_COLUMN_LOGO, \
+    COLUMNS_LOGO
 
 from glue.config import viewer_tool
 from glue.viewers.common.qt.tool import Tool, SimpleToolMenu
@@ -171,12 +172,63 @@ class Settings(SimpleToolMenu):
         action = QtWidgets.QAction("Toggle Manual Calculation", None)
         action.triggered.connect(self.viewer.showManualCalc)
         result.append(action)
+
+        action = QtWidgets.QAction("Select Compute Backend", None)
+        action.triggered.connect(self.viewer.showComputeBackend)
+        result.append(action)
+        # Action for toggling the on-disk statistics cache
+        action = QtWidgets.QAction("Toggle Disk Cache", None)
+        action.triggered.connect(self.viewer.showDiskCache)
+        result.append(action)
+        # Action for opening the performance settings (workers, block memory, estimates, dask)
+        action = QtWidgets.QAction("Performance Settings", None)
+        action.triggered.connect(self.viewer.showPerformanceSettings)
+        result.append(action)
         return result
 
     def close(self):
         self.viewer.closeAllWindows
 
 
+@viewer_tool
+class ColumnsButton(SimpleToolMenu):
+    """
+    A class used to choose the statistic columns shown in the viewer. Statistics whose
+    column is hidden are not calculated.
+    ----------
+    Attributes
+    ----------
+    icon : str
+        a formatted string that points to the icon png file location
+    tool_id : str
+        the id of the columns tool used to add to toolbar
+    tool_tip: str
+        detailed tip about the tool's function
+    -------
+    Methods
+    -------
+    menu_actions(self):
+        one checkable action per registered statistic
+    """
+    icon = COLUMNS_LOGO
+    tool_id = 'stats:columns'
+    tool_tip = 'Choose the statistics shown'
+    status_tip = 'Hidden statistics are not calculated'
+
+    def menu_actions(self):
+        result = []
+        for name in self.viewer.statistic_names:
+            action = QtWidgets.QAction(name, None)
+            action.setCheckable(True)
+            action.setChecked(self.viewer.isStatisticShown(name))
+            action.triggered.connect(lambda checked, name=name: self.viewer.setStatisticShown(name, checked))
+            result.append(action)
+        return result
+
+    def close(self):
+        pass
+
+
 @viewer_tool
 class ConvertNotation(Tool):
     """